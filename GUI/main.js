@@ -112,6 +112,7 @@ $(document).ready(function() {
     }
     var piecesLeftCoordinates = {};
     var steps = [];
+    var lastState = null;
     var index = -1;
     var play = false;
     var lastCellMouseOn = null;
@@ -266,9 +267,13 @@ $(document).ready(function() {
         reader.onload = function(e) {
             const json = JSON.parse(e.target.result);
             let gameData = [];
-            for (const step of json) {
-                const players_info = convertToPlayerInfo(step.players, step.scores, step.players_pieces_left);
-                gameData.push({"env": step.rep.env, "players":players_info, "next_player": step.next_player.name});
+            let state = null;
+            for (const payload of json) {
+                // Recordings hold keyframes (full states) and deltas between them
+                state = decodeStatePayload(payload, state);
+                if (state === null) continue;
+                const players_info = convertToPlayerInfo(state.players, state.scores, state.players_pieces_left);
+                gameData.push({"env": state.rep.env, "players":players_info, "next_player": state.next_player.name});
             }
             steps = gameData;
             index = 0;
@@ -354,15 +359,15 @@ $(document).ready(function() {
 
         socket.on("play", (...args) => {
             console.log("play");
-            json = JSON.parse(args[0]);
-            if (!json.rep) json = JSON.parse(json);
-            if (json.rep && json.rep.env) {
-                nextPlayer = json.next_player.name;
-                const players_info = convertToPlayerInfo(json.players, json.scores, json.players_pieces_left);
-                steps.push({"env": json.rep.env, "players":players_info, "next_player": nextPlayer});
-                index = steps.length - 1;
-                drawNewState(steps[index]);
-            }
+            const state = decodeStatePayload(JSON.parse(args[0]), lastState);
+            // A delta received before any keyframe cannot be rebuilt, wait for the next keyframe
+            if (state === null) return;
+            lastState = state;
+            nextPlayer = state.next_player.name;
+            const players_info = convertToPlayerInfo(state.players, state.scores, state.players_pieces_left);
+            steps.push({"env": state.rep.env, "players":players_info, "next_player": nextPlayer});
+            index = steps.length - 1;
+            drawNewState(steps[index]);
         });
 
         socket.on("ActionNotPermitted", (...args) => {
@@ -437,6 +442,30 @@ $(document).ready(function() {
         
     }
 
+    function decodeStatePayload(payload, previousState) {
+        // Keyframes are full states, deltas only hold the placed piece, the score changes and the next player
+        if (payload.kind !== "delta") return payload;
+        if (!previousState) return null;
+        const env = Object.assign({}, previousState.rep.env);
+        env[`(${payload.position[0]}, ${payload.position[1]})`] = payload.piece;
+        const scores = Object.assign({}, previousState.scores);
+        for (const id in payload.scores) {
+            scores[id] += payload.scores[id];
+        }
+        const piecesLeft = Object.assign({}, previousState.players_pieces_left);
+        const ownerId = payload.piece.owner_id;
+        piecesLeft[ownerId] = Object.assign({}, piecesLeft[ownerId]);
+        piecesLeft[ownerId][payload.piece.piece_type.substring(0, 2)] -= 1;
+        const nextPlayer = previousState.players.find(player => player.id == payload.next_player_id);
+        return Object.assign({}, previousState, {
+            "rep": Object.assign({}, previousState.rep, {"env": env}),
+            "scores": scores,
+            "players_pieces_left": piecesLeft,
+            "next_player": nextPlayer,
+            "step": payload.step,
+        });
+    }
+
     function convertToPlayerInfo(players, scores, playersPiecesLeft){
         let playerInfo = {};
         for (let player of players) {
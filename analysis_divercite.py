@@ -0,0 +1,307 @@
+import argparse
+import ast
+import glob
+import json
+import os
+import time
+from argparse import RawTextHelpFormatter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from arena_divercite import create_initial_state, create_worker_pool, find_played_move, load_player_module, player_name
+from game_state_divercite import GameStateDivercite
+from geometry_divercite import COLORS, Variant
+from seahorse.game.light_action import LightAction
+
+BLUNDER_THRESHOLD = 3.0
+
+
+def moves_from_states(states: List[dict]) -> List[Tuple[str, Tuple[int, int]]]:
+    """
+    Extract the moves of a game from its successive JSON states, each state being one move after the previous one.
+
+    Args:
+        states (List[dict]): The full JSON states of the game, from the initial one.
+
+    Returns:
+        List[Tuple[str, Tuple[int, int]]]: The (piece, position) pairs of the game.
+    """
+    moves = []
+    for previous, state in zip(states, states[1:]):
+        previous_env = previous["rep"]["env"]
+        for pos, piece in state["rep"]["env"].items():
+            if pos not in previous_env:
+                moves.append((piece["piece_type"][:2], ast.literal_eval(pos)))
+                break
+    return moves
+
+
+def read_recorded_game(path: str) -> dict:
+    """
+    Read a game recorded by the game master (`-r`). Records hold one entry per state,
+    either a full state (keyframe) or a delta against the previous one.
+
+    Args:
+        path (str): Path to the `__REC__*.json` file.
+
+    Returns:
+        dict: The source, player names, moves and variant (as in `Variant.to_json`) of the game.
+    """
+    with open(path, encoding="utf-8") as f:
+        payloads = json.load(f)
+    states = []
+    for payload in payloads:
+        if payload.get("kind") == "delta":
+            states.append(GameStateDivercite.apply_json_delta(states[-1], payload))
+        else:
+            states.append(payload)
+    # Remote players are serialized as their bare id
+    players = [player["name"] if isinstance(player, dict) else f"remote_{player}" for player in states[0]["players"]]
+    # The variant is read back from the initial state: its board, the stock of a player and its number of steps
+    stock = next(iter(states[0]["players_pieces_left"].values()))
+    variant = {"size": states[0]["rep"]["dim"][0], "n_resource_pieces": stock[COLORS[0]+"R"],
+               "n_city_pieces": stock[COLORS[0]+"C"], "max_step": states[0]["max_step"]}
+    return {"source": path, "players": players, "moves": moves_from_states(states), "variant": variant}
+
+
+def read_games(paths: Iterable[str]) -> Iterable[dict]:
+    """
+    Stream the games of recorded game files and of JSON lines results files (tournaments, multi-game host, self-play).
+    Directories are scanned for both kinds of files.
+
+    Args:
+        paths (Iterable[str]): Files or directories.
+
+    Returns:
+        Iterable[dict]: The source, player names, moves and variant (as in `Variant.to_json`, None for the records
+            written before the variants, which are standard games) of each game.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            yield from read_games(sorted(glob.glob(os.path.join(path, "__REC__*.json")) + glob.glob(os.path.join(path, "*.jsonl"))))
+        elif path.endswith(".jsonl"):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record.get("type", "game") == "game" and record.get("moves"):
+                        yield {"source": f"{path}:{record.get('game_id', '')}", "players": record["players"],
+                               "moves": [(piece, tuple(position)) for piece, position in record["moves"]],
+                               "variant": record.get("variant")}
+        else:
+            yield read_recorded_game(path)
+
+
+def search(analyzer, current_state: GameStateDivercite, depth: int, move_time: Optional[float]) -> Tuple[float, object, int]:
+    """
+    Search a position with the analyzer, at a fixed depth or by iterative deepening within a time budget.
+
+    Args:
+        analyzer: The search player to move in `current_state`.
+        current_state (GameStateDivercite): The position to search.
+        depth (int): The search depth, or the maximum depth with a time budget.
+        move_time (Optional[float]): Time budget in seconds, the last depth started is always completed.
+
+    Returns:
+        Tuple[float, object, int]: The value, the best action and the depth reached.
+    """
+    if move_time is None:
+        value, action = analyzer.alphaBetaSearch(current_state, depth)
+        return value, action, depth
+    start = time.time()
+    for reached in range(1, depth + 1):
+        value, action = analyzer.alphaBetaSearch(current_state, reached)
+        if time.time() - start >= move_time:
+            break
+    return value, action, reached
+
+
+def search_lines(analyzer, current_state: GameStateDivercite, depth: int, move_time: Optional[float],
+                 n_lines: int) -> Tuple[List[Tuple[float, list]], int]:
+    """
+    Search the best lines of a position in a single multi-PV search, at a fixed depth or by iterative deepening
+    within a time budget.
+
+    Args:
+        analyzer: The search player to move in `current_state`, with a `multiPVSearch` method.
+        current_state (GameStateDivercite): The position to search.
+        depth (int): The search depth, or the maximum depth with a time budget.
+        move_time (Optional[float]): Time budget in seconds, the last depth started is always completed.
+        n_lines (int): Number of lines.
+
+    Returns:
+        Tuple[List[Tuple[float, list]], int]: The value and principal variation of each line, best first, and the depth reached.
+    """
+    if move_time is None:
+        return analyzer.multiPVSearch(current_state, depth, n_lines), depth
+    start = time.time()
+    for reached in range(1, depth + 1):
+        lines = analyzer.multiPVSearch(current_state, reached, n_lines)
+        if time.time() - start >= move_time:
+            break
+    return lines, reached
+
+
+def line_moves(current_state: GameStateDivercite, actions: list) -> List[list]:
+    # The principal variation as JSON moves, each action being played in the state left by the previous one
+    moves = []
+    for action in actions:
+        piece, position = find_played_move(current_state, action)
+        moves.append([piece, list(position)])
+        current_state = action.get_next_game_state()
+    return moves
+
+
+def analyze_game(job: dict) -> dict:
+    """
+    Replay a game through the engine and re-score every move with a search player, in a worker process.
+    The loss of a move is the value of the best move found minus the value of the played move, both searched
+    at the same depth from the point of view of the player to move.
+
+    Args:
+        job (dict): The game (source, players, moves, variant), the analyzer module path, the depth, the time per move,
+            the blunder threshold and the number of candidate lines.
+
+    Returns:
+        dict: The report of the game: the scored moves, the blunders and the final scores.
+    """
+    module = load_player_module(job["analyzer"])
+    analyzers = [module.MyPlayer("W", name=job["players"][0]), module.MyPlayer("B", name=job["players"][1])]
+    current_state = create_initial_state(*analyzers, Variant.from_json(job["variant"]))
+    n_lines = job["lines"]
+    if n_lines > 1 and not hasattr(analyzers[0], "multiPVSearch"):
+        logger.warning(f"{player_name(job['analyzer'])} has no multi-PV search, --lines is ignored")
+        n_lines = 1
+    scored_moves = []
+    for ply, (piece, position) in enumerate(job["moves"]):
+        analyzer = current_state.get_next_player()
+        played_move = [piece, list(position)]
+        lines = []
+        if n_lines > 1:
+            searched_lines, depth = search_lines(analyzer, current_state, job["depth"], job["move_time"], n_lines)
+            lines = [{"value": value, "pv": line_moves(current_state, actions)} for value, actions in searched_lines]
+            best_value, best_move = lines[0]["value"], lines[0]["pv"][0]
+        else:
+            best_value, best_action, depth = search(analyzer, current_state, job["depth"], job["move_time"])
+            piece_type, best_position = find_played_move(current_state, best_action)
+            best_move = [piece_type, list(best_position)]
+            lines = [{"value": best_value, "pv": [best_move]}]
+        light_action = LightAction({"piece": piece, "position": tuple(position)})
+        next_state = current_state.apply_action(light_action)
+        # The played move is re-searched only when it is not one of the candidate lines
+        played_value = next((line["value"] for line in lines if line["pv"][0] == played_move), None)
+        if played_value is None:
+            played_value, _ = analyzer.minValue(next_state, -float('inf'), float('inf'), depth - 1)
+        scored_move = {
+            "ply": ply,
+            "player": analyzer.get_name(),
+            "move": played_move,
+            "best_move": best_move,
+            "played_value": played_value,
+            "best_value": best_value,
+            "loss": best_value - played_value,
+            "depth": depth,
+        }
+        if n_lines > 1:
+            scored_move["lines"] = lines
+        scored_moves.append(scored_move)
+        current_state = next_state
+    return {
+        "source": job["source"],
+        "players": job["players"],
+        "scores": [current_state.scores[analyzer.get_id()] for analyzer in analyzers],
+        "moves": scored_moves,
+        "blunders": [move for move in scored_moves if move["loss"] >= job["blunder_threshold"]],
+    }
+
+
+def aggregate(reports: List[dict]) -> Dict[str, dict]:
+    """
+    Compute the statistics of each player over analyzed games.
+
+    Args:
+        reports (List[dict]): The reports of `analyze_game`.
+
+    Returns:
+        Dict[str, dict]: The number of games and moves, the average loss, the blunders and the worst loss of each player.
+    """
+    stats = {}
+    for report in reports:
+        for name in report["players"]:
+            stats.setdefault(name, {"games": 0, "moves": 0, "total_loss": 0.0, "blunders": 0, "worst_loss": 0.0})["games"] += 1
+        for move in report["moves"]:
+            player_stats = stats[move["player"]]
+            loss = max(move["loss"], 0.0)
+            player_stats["moves"] += 1
+            player_stats["total_loss"] += loss
+            player_stats["worst_loss"] = max(player_stats["worst_loss"], loss)
+        for move in report["blunders"]:
+            stats[move["player"]]["blunders"] += 1
+    for player_stats in stats.values():
+        player_stats["average_loss"] = player_stats["total_loss"] / max(player_stats["moves"], 1)
+    return stats
+
+
+def analyze_games(games: Iterable[dict], analyzer_path: str, depth: int, move_time: Optional[float],
+                  blunder_threshold: float, workers: int, n_lines: int = 1) -> Iterable[dict]:
+    """
+    Analyze games in parallel across a process pool with the analyzer preloaded, reports are yielded in the order of the games.
+
+    Args:
+        games (Iterable[dict]): The games, as produced by `read_games`.
+        analyzer_path (str): Path to the search player module.
+        depth (int): The search depth, or the maximum depth with a time budget.
+        move_time (Optional[float]): Time budget per move in seconds, None to search at a fixed depth.
+        blunder_threshold (float): Loss from which a move is reported as a blunder.
+        workers (int): Number of worker processes.
+        n_lines (int, optional): Number of candidate lines reported for each move, searched in a single multi-PV search.
+
+    Returns:
+        Iterable[dict]: The report of each game.
+    """
+    jobs = ({**game, "analyzer": analyzer_path, "depth": depth, "move_time": move_time,
+             "blunder_threshold": blunder_threshold, "lines": n_lines} for game in games)
+    with create_worker_pool(workers, [analyzer_path]) as executor:
+        yield from executor.map(analyze_game, jobs)
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser(
+                        prog="analysis_divercite.py",
+                        description="Replays recorded games, re-scores every move with a search player and reports the blunders.",
+                        formatter_class=RawTextHelpFormatter)
+    parser.add_argument("games", nargs="+", help="Recorded games (__REC__*.json), results files (*.jsonl) or directories of them.")
+    parser.add_argument("-a","--analyzer",default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "my_player_2.py"),
+                        help="The search player used to score the moves.\n\n")
+    parser.add_argument("-d","--depth",type=int,default=3,help="Search depth, or maximum depth with --move-time.\n\n")
+    parser.add_argument("-m","--move-time",type=float,default=None,help="Time budget per move (s), searches by iterative deepening.\n\n")
+    parser.add_argument("-b","--blunder-threshold",type=float,default=BLUNDER_THRESHOLD,help="Loss from which a move is a blunder.\n\n")
+    parser.add_argument("-k","--lines",type=int,default=1,help="Candidate lines reported for each move, with their principal variations.\n\n")
+    parser.add_argument("-j","--workers",type=int,default=os.cpu_count(),help="Number of games analyzed in parallel.\n\n")
+    parser.add_argument("-o","--output",default=None,help="JSON lines file the game reports are written to.\n\n")
+    args = parser.parse_args()
+
+    reports = []
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    for report in analyze_games(read_games(args.games), args.analyzer, args.depth, args.move_time, args.blunder_threshold, args.workers, args.lines):
+        reports.append(report)
+        if output is not None:
+            output.write(json.dumps(report) + "\n")
+        logger.info(f"{report['source']} : {report['players'][0]} vs {report['players'][1]} {report['scores']}, "
+                    f"{len(report['blunders'])} blunder(s)")
+        for move in report["blunders"]:
+            logger.info(f"    ply {move['ply']:>2} {move['player']} played {move['move']} instead of {move['best_move']} "
+                        f"(loss {move['loss']:.1f})")
+            for line in move.get("lines", []):
+                logger.info(f"        {line['value']:>6} {' '.join(f'{piece}{tuple(position)}' for piece, position in line['pv'])}")
+    if output is not None:
+        output.close()
+
+    logger.info(f"Analyzed {len(reports)} game(s) with {player_name(args.analyzer)}")
+    for name, player_stats in sorted(aggregate(reports).items(), key=lambda x: x[1]["average_loss"]):
+        logger.info(f"{name:<30} {player_stats['games']:>4} games {player_stats['moves']:>5} moves "
+                    f"avg loss {player_stats['average_loss']:5.2f} worst {player_stats['worst_loss']:5.1f} "
+                    f"blunders {player_stats['blunders']}")
@@ -0,0 +1,241 @@
+import importlib.util
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os.path import basename, dirname, splitext
+from types import ModuleType
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from board_divercite import BoardDivercite
+from game_state_divercite import GameStateDivercite
+from geometry_divercite import Variant
+from seahorse.game.light_action import LightAction
+from seahorse.player.player import Player
+
+_loaded_modules: Dict[str, ModuleType] = {}
+
+
+def create_initial_state(player1: Player, player2: Player, variant: Optional[Variant] = None) -> GameStateDivercite:
+    """
+    Build the initial state of a Divercite game, player1 plays first.
+
+    Args:
+        player1 (Player): The first player (white pieces).
+        player2 (Player): The second player (black pieces).
+        variant (Variant, optional): Board size, stock and number of steps. Defaults to the standard game.
+
+    Returns:
+        GameStateDivercite: The initial game state.
+    """
+    variant = variant if variant is not None else Variant()
+    list_players = [player1, player2]
+    init_scores = {player1.get_id(): 0, player2.get_id(): 0}
+    dim = [variant.size, variant.size]
+    env = {}
+    players_pieces_left = {player.get_id() : variant.initial_stock() for player in list_players}
+    init_rep = BoardDivercite(env=env, dim=dim)
+    return GameStateDivercite(
+        scores=init_scores, next_player=player1, players=list_players, rep=init_rep, step=0, players_pieces_left=players_pieces_left,
+        max_step=variant.max_step)
+
+
+def load_player_module(path: str) -> ModuleType:
+    """
+    Import a player module from its file path. Modules are cached so each process imports a player once.
+
+    Args:
+        path (str): Path to the python file defining `MyPlayer`.
+
+    Returns:
+        ModuleType: The imported module.
+    """
+    path = os.path.abspath(path)
+    if path not in _loaded_modules:
+        # The player may import the game modules and its own helpers
+        for folder in (dirname(os.path.abspath(__file__)), dirname(path)):
+            if folder not in sys.path:
+                sys.path.append(folder)
+        spec = importlib.util.spec_from_file_location(splitext(basename(path))[0], path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded_modules[path] = module
+    return _loaded_modules[path]
+
+
+def preload_players(paths: Iterable[str]) -> None:
+    """
+    Import player modules ahead of their games, used as the initializer of the worker processes.
+    A module that fails to import is skipped, the error is raised again by the games using it.
+
+    Args:
+        paths (Iterable[str]): Paths to the player modules.
+    """
+    for path in paths:
+        try:
+            load_player_module(path)
+        except Exception:
+            continue
+
+
+def create_worker_pool(workers: int, player_paths: Iterable[str]) -> ProcessPoolExecutor:
+    """
+    Create a process pool whose workers have the game and player modules imported before their first job,
+    so that many short games pay the interpreter and import startup once per worker only. The modules are
+    imported in the calling process too: forked workers inherit them, spawned workers import them once.
+
+    Args:
+        workers (int): Number of worker processes.
+        player_paths (Iterable[str]): Paths to the player modules used by the jobs.
+
+    Returns:
+        ProcessPoolExecutor: The pool, to be shut down by the caller.
+    """
+    paths = [os.path.abspath(path) for path in player_paths]
+    preload_players(paths)
+    return ProcessPoolExecutor(max_workers=workers, initializer=preload_players, initargs=(paths,))
+
+
+def player_name(path: str) -> str:
+    """
+    Returns the name under which a player module is rated and recorded.
+
+    Args:
+        path (str): Path to the player module.
+
+    Returns:
+        str: The name of the player.
+    """
+    return splitext(basename(path))[0]
+
+
+def find_played_move(current_state: GameStateDivercite, action) -> Tuple[str, Tuple[int, int]]:
+    """
+    Extract the (piece, position) pair played by an action returned by a player.
+
+    Args:
+        current_state (GameStateDivercite): The state the action was computed on.
+        action (Action): The light or heavy action returned by the player.
+
+    Returns:
+        Tuple[str, Tuple[int, int]]: The piece (color and resource/city letters) and its position.
+    """
+    if isinstance(action, LightAction):
+        return action.data["piece"], tuple(action.data["position"])
+    env = current_state.get_rep().get_env()
+    new_env = action.get_next_game_state().get_rep().get_env()
+    for pos, piece in new_env.items():
+        if pos not in env:
+            return piece.get_type()[:2], pos
+    raise ValueError("The action does not place any piece.")
+
+
+def random_opening(current_state: GameStateDivercite, n_plies: int, rng: random.Random) -> List[Tuple[str, Tuple[int, int]]]:
+    """
+    Draw random opening moves from a state.
+
+    Args:
+        current_state (GameStateDivercite): The state the opening starts from, left unchanged.
+        n_plies (int): Number of moves.
+        rng (random.Random): Source of the moves.
+
+    Returns:
+        List[Tuple[str, Tuple[int, int]]]: The (piece, position) pairs of the opening.
+    """
+    opening = []
+    for _ in range(n_plies):
+        actions = sorted(current_state.get_possible_light_actions(), key=lambda a: (a.data["piece"], a.data["position"]))
+        action = rng.choice(actions)
+        opening.append((action.data["piece"], action.data["position"]))
+        current_state = current_state.apply_action(action)
+    return opening
+
+
+def compute_winner(scores: List[float], loser: Optional[int] = None) -> Optional[int]:
+    """
+    Returns the index of the winner of a game.
+
+    Args:
+        scores (List[float]): Final scores of the first and second player.
+        loser (int, optional): Index of the player who lost by forfeit (timeout, illegal move, error), if any.
+
+    Returns:
+        Optional[int]: 0 or 1, None on a draw.
+    """
+    if loser is not None:
+        return 1 - loser
+    if scores[0] == scores[1]:
+        return None
+    return int(scores[1] > scores[0])
+
+
+def play_headless_game(player1: Player, player2: Player, time_limit: float = 60*15,
+                       opening: Optional[List[Tuple[str, Tuple[int, int]]]] = None,
+                       on_move: Optional[Callable[[str, Tuple[int, int]], None]] = None, variant: Optional[Variant] = None) -> dict:
+    """
+    Play a full game between two players without the GameMaster, the GUI or any socket.
+    Players are timed like in a hosted game and lose when their time credit expires,
+    when they play an illegal move or when they raise an exception.
+
+    Args:
+        player1 (Player): The first player (white pieces).
+        player2 (Player): The second player (black pieces).
+        time_limit (float, optional): Time credit of each player in seconds. Defaults to 15 minutes.
+        opening (List[Tuple[str, Tuple[int, int]]], optional): Moves played before the players take over, untimed.
+        on_move (Callable[[str, Tuple[int, int]], None], optional): Called with the piece and position of every move
+            played, opening included.
+        variant (Variant, optional): Board size, stock and number of steps. Defaults to the standard game.
+
+    Returns:
+        dict: The game record with the moves, final scores, winner index (0, 1), termination reason and variant
+            (as in `Variant.to_json`).
+    """
+    players = [player1, player2]
+    variant = variant if variant is not None else Variant()
+    current_state = create_initial_state(player1, player2, variant)
+    remaining_time = {player.get_id(): time_limit for player in players}
+    moves: List[Tuple[str, Tuple[int, int]]] = []
+    times: List[float] = []
+    for piece, position in opening or []:
+        moves.append((piece, position))
+        if on_move is not None:
+            on_move(piece, position)
+        times.append(0.0)
+        current_state = current_state.apply_action(LightAction({"piece": piece, "position": position}))
+    termination = "done"
+    loser = None
+    while not current_state.is_done():
+        next_player = current_state.get_next_player()
+        start = time.time()
+        try:
+            action = next_player.compute_action(current_state=current_state, remaining_time=remaining_time[next_player.get_id()])
+            elapsed = time.time() - start
+            piece, position = find_played_move(current_state, action)
+        except Exception:
+            termination, loser = "error", players.index(next_player)
+            break
+        remaining_time[next_player.get_id()] -= elapsed
+        times.append(elapsed)
+        if remaining_time[next_player.get_id()] < 0:
+            termination, loser = "timeout", players.index(next_player)
+            break
+        light_action = LightAction({"piece": piece, "position": position})
+        if light_action not in current_state.get_possible_light_actions():
+            termination, loser = "illegal", players.index(next_player)
+            break
+        moves.append((piece, position))
+        if on_move is not None:
+            on_move(piece, position)
+        current_state = current_state.apply_action(light_action)
+
+    scores = [current_state.scores[player.get_id()] for player in players]
+    return {
+        "players": [player.get_name() for player in players],
+        "moves": moves,
+        "times": times,
+        "scores": scores,
+        "winner": compute_winner(scores, loser),
+        "termination": termination,
+        "variant": variant.to_json(),
+    }
@@ -1,10 +1,76 @@
 from __future__ import annotations
 import json
-from typing import Dict, List, Tuple
-from colorama import Fore, Style
+import weakref
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from geometry_divercite import STANDARD_SIZE, BoardGeometry
 from seahorse.game.game_layout.board import Board, Piece
 from seahorse.utils.serializer import Serializable
 
+class PieceDivercite(Piece):
+    """
+    A class representing a Divercite piece.
+
+    Only 16 distinct pieces exist per game (4 colors, city or resource, 2 owners), so instances are interned
+    and must be obtained through `PieceDivercite.get`. Placing a piece therefore never allocates, and the
+    color, the resource/city type and the hash are precomputed attributes. The owners are the players of each
+    game, so the pieces are only interned while a board holds them: a process playing many games keeps the
+    pieces of its current games only.
+
+    Attributes:
+        piece_type (str): The type of the piece (color, resource/city and owner letters, e.g. "RCW").
+        owner_id (int): The ID of the player who possesses the piece.
+        color (str): The color letter of the piece.
+        res_city (str): "R" for a resource, "C" for a city.
+    """
+
+    __slots__ = ("color", "res_city", "_hash")
+
+    _instances: weakref.WeakValueDictionary[Tuple[str, int], PieceDivercite] = weakref.WeakValueDictionary()
+
+    def __init__(self, piece_type: str, owner=None, owner_id: int = -1) -> None:
+        super().__init__(piece_type, owner, owner_id)
+        self.color = piece_type[0]
+        self.res_city = piece_type[1]
+        self._hash = hash((hash(self.piece_type), hash(self.owner_id)))
+
+    @classmethod
+    def get(cls, piece_type: str, owner_id: int) -> PieceDivercite:
+        """
+        Returns the shared instance of a piece.
+
+        Args:
+            piece_type (str): The type of the piece.
+            owner_id (int): The ID of the owner.
+
+        Returns:
+            PieceDivercite: The interned piece.
+        """
+        piece = cls._instances.get((piece_type, owner_id))
+        if piece is None:
+            piece = cls._instances[(piece_type, owner_id)] = cls(piece_type, owner_id=owner_id)
+        return piece
+
+    def copy(self) -> PieceDivercite:
+        return self
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, __value: object) -> bool:
+        return self._hash == hash(__value)
+
+    def to_json(self) -> dict:
+        return {"piece_type": self.piece_type, "owner_id": self.owner_id}
+
+    @classmethod
+    def from_json(cls, data) -> PieceDivercite:
+        return cls.get(**json.loads(data))
+
+# How `str(board)` draws the boards in the current context (thread or asyncio task): True in colors, False in
+# plain ASCII, None not at all. A game master sets it for the task playing its game, see MasterDivercite.play_game
+BOARD_RENDERING: ContextVar[Optional[bool]] = ContextVar("board_rendering", default=True)
+
 class BoardDivercite(Board):
     """
     A class representing an Divercite board.
@@ -12,6 +78,12 @@ class BoardDivercite(Board):
     Attributes:
         env (dict[Tuple[int], Piece]): The environment dictionary composed of pieces.
         dimensions (list[int]): The dimensions of the board.
+        geometry (BoardGeometry): The shape of the board and the tables derived from it, given by its dimensions.
+        zobrist_key (int): 64 bits hash of the pieces on the board, updated incrementally on placement.
+        hot_cities (dict[Tuple[int], Tuple[int, str, Tuple[int]]]): The cities one resource away from a divercite,
+            with their owner, missing color and empty neighbour, updated incrementally on placement.
+        color_masks (dict[Tuple[int], int]): The colors of the resources around each city position, one bit per
+            color plus DUPLICATE_COLOR once two resources share a color, updated incrementally on placement.
     """
 
     #EMPTY_POS=3
@@ -20,62 +92,266 @@ class BoardDivercite(Board):
     RESOURCE_POS=2
 
 
-    FORBIDDEN_MASK = [
-     [True,  True,  True,  True,  False, True,  True,  True,  True],
-     [True,  True,  True,  False, False, False, True,  True,  True],
-     [True,  True,  False, False, False, False, False, True,  True],
-     [True,  False, False, False, False, False, False, False, True],
-     [False, False, False, False, False, False, False, False, False],
-     [True,  False, False, False, False, False, False, False, True],
-     [True,  True,  False, False, False, False, False, True,  True],
-     [True,  True,  True,  False, False, False, True,  True,  True],
-     [True,  True,  True,  True,  False, True,  True,  True,  True]
-    ]
-
-    BOARD_MASK = [
-            [ 0,   0,   0,   0,  'R',  0,   0,   0,   0],
-            [ 0,   0,   0,  'R', 'C', 'R',  0,   0,   0],
-            [ 0,   0,  'R', 'C', 'R', 'C', 'R',  0,   0],
-            [ 0,  'R', 'C', 'R', 'C', 'R', 'C', 'R',  0],
-            ['R', 'C', 'R', 'C', 'R', 'C', 'R', 'C', 'R'],
-            [ 0,  'R', 'C', 'R', 'C', 'R', 'C', 'R',  0],
-            [ 0,   0,  'R', 'C', 'R', 'C', 'R',  0,   0],
-            [ 0,   0,   0,  'R', 'C', 'R',  0,   0,   0],
-            [ 0,   0,   0,   0,  'R',  0,   0,   0,   0]
-]
-
-
-    def __init__(self, env: dict[tuple[int], Piece], dim: list[int]) -> None:
+    # Tables of the standard board, the engine reads the tables of the geometry of each board
+    FORBIDDEN_MASK = BoardGeometry.get(STANDARD_SIZE).forbidden_mask
+    BOARD_MASK = BoardGeometry.get(STANDARD_SIZE).board_mask
+    ZOBRIST_TABLE = BoardGeometry.get(STANDARD_SIZE).zobrist_table
+    CITY_RESOURCES = BoardGeometry.get(STANDARD_SIZE).city_resources
+    RESOURCE_CITIES = BoardGeometry.get(STANDARD_SIZE).resource_cities
+    CITY_NEIGHBOURS = BoardGeometry.get(STANDARD_SIZE).city_neighbours
+
+    # Color presence masks : a city position is a divercite when its mask is ALL_COLORS
+    COLOR_BITS = {"R": 1, "G": 2, "B": 4, "Y": 8}
+    ALL_COLORS = 15
+    DUPLICATE_COLOR = 16
+
+    # Rows of the diamond drawing of each board size, see get_render_layout
+    _render_layouts: Dict[int, List[List[Tuple[int, int] | str]]] = {}
+
+    def __init__(self, env: dict[tuple[int], Piece], dim: list[int], zobrist_key: int | None = None,
+                 hot_cities: Dict[Tuple[int, int], Tuple[int, str, Tuple[int, int]]] | None = None,
+                 color_masks: Dict[Tuple[int, int], int] | None = None) -> None:
         super().__init__(env, dim)
+        self.geometry = BoardGeometry.get(dim[0])
+        if color_masks is None:
+            color_masks = {}
+            for city_pos, resources in self.geometry.city_resources.items():
+                mask = 0
+                for n_pos in resources:
+                    if n_pos in env:
+                        mask = BoardDivercite.add_color(mask, env[n_pos].color)
+                color_masks[city_pos] = mask
+        self.color_masks = color_masks
+        if zobrist_key is None:
+            zobrist_key = 0
+            for pos, piece in env.items():
+                zobrist_key ^= self.geometry.zobrist_table[(pos, piece.get_type())]
+        self.zobrist_key = zobrist_key
+        if hot_cities is None:
+            hot_cities = {}
+            for pos in env:
+                threat = self.city_threat(pos)
+                if threat is not None:
+                    hot_cities[pos] = threat
+        self.hot_cities = hot_cities
+        self._rendered = None
 
-    def __str__(self):
-        grid_data = self.get_grid()
-        rotated_grid = self.rotate_grid_45(grid_data)
-        board_string = "\n"
-        max_len = max(len(row) for row in rotated_grid)
-        for i, row in enumerate(rotated_grid):
-            if all(cell == ' ' for cell in row):
-                continue
-            padded_row = [' '] * ((max_len - len(row)) // 2) + row + [' '] * ((max_len - len(row)) // 2)
-            if i%2 == 1:
-                padded_row = [''] + padded_row
-            for cell in padded_row:
-                if isinstance(cell, tuple):
-                    char, color = cell
-                    if color == 'R':
-                        board_string += Fore.RED + char + Style.RESET_ALL + " "
-                    elif color == 'G':
-                        board_string += Fore.GREEN + char + Style.RESET_ALL + " "
-                    elif color == 'Y':
-                        board_string += Fore.YELLOW + char + Style.RESET_ALL + " "
-                    elif color == 'B':
-                        board_string += Fore.BLUE + char + Style.RESET_ALL + " "
-                    elif color == 'Black':
-                        board_string += Fore.BLACK + char + Style.RESET_ALL + " "
+    def get_zobrist_key(self) -> int:
+        """
+        Returns the zobrist hash of the board.
+
+        Returns:
+            int: The zobrist hash of the pieces on the board.
+        """
+        return self.zobrist_key
+
+    def zobrist_key_after(self, pos: Tuple[int, int], piece: Piece) -> int:
+        """
+        Returns the zobrist hash the board would have after placing a piece.
+
+        Args:
+            pos (Tuple[int, int]): The position of the new piece.
+            piece (Piece): The piece to place.
+
+        Returns:
+            int: The zobrist hash of the resulting board.
+        """
+        return self.zobrist_key ^ self.geometry.zobrist_table[(pos, piece.get_type())]
+
+    @staticmethod
+    def add_color(mask: int, color: str) -> int:
+        """
+        Returns a color mask with one more resource of the given color.
+
+        Args:
+            mask (int): The color mask of a city position.
+            color (str): The color of the new resource.
+
+        Returns:
+            int: The new color mask.
+        """
+        bit = BoardDivercite.COLOR_BITS[color]
+        return mask | bit | (BoardDivercite.DUPLICATE_COLOR if mask & bit else 0)
+
+    def color_masks_after(self, pos: Tuple[int, int], piece: Piece) -> Dict[Tuple[int, int], int]:
+        """
+        Returns the color masks the board would have after placing a piece. Only the cities around a placed
+        resource change.
+
+        Args:
+            pos (Tuple[int, int]): The position of the new piece.
+            piece (Piece): The piece to place.
+
+        Returns:
+            Dict[Tuple[int, int], int]: The color masks of the resulting board.
+        """
+        if piece.res_city == 'C':
+            return self.color_masks
+        color_masks = dict(self.color_masks)
+        for city_pos in self.geometry.resource_cities.get(pos, ()):
+            color_masks[city_pos] = BoardDivercite.add_color(color_masks[city_pos], piece.color)
+        return color_masks
+
+    def is_divercite(self, city_pos: Tuple[int, int], color: str | None = None) -> bool:
+        """
+        Returns whether the resources around a city position have four distinct colors.
+
+        Args:
+            city_pos (Tuple[int, int]): The city position to examine.
+            color (str, optional): Color of a resource to consider as placed on its empty neighbour.
+
+        Returns:
+            bool: True if the position is (or would be) a divercite.
+        """
+        mask = self.color_masks.get(city_pos, 0)
+        if color is not None:
+            mask = BoardDivercite.add_color(mask, color)
+        return mask == BoardDivercite.ALL_COLORS
+
+    def city_threat(self, city_pos: Tuple[int, int], pos: Tuple[int, int] | None = None, piece: Piece | None = None) -> Tuple[int, str, Tuple[int, int]] | None:
+        """
+        Returns the threat of a city: three neighbours of distinct colors and an empty one, so that a resource
+        of the missing color completes a divercite.
+
+        Args:
+            city_pos (Tuple[int, int]): The position to examine.
+            pos (Tuple[int, int], optional): Position of a piece to consider as placed.
+            piece (Piece, optional): The piece to consider as placed at `pos`.
+
+        Returns:
+            Tuple[int, str, Tuple[int, int]] | None: The owner of the city, the missing color and the empty
+                neighbour, None if `city_pos` holds no hot city.
+        """
+        city = piece if city_pos == pos else self.env.get(city_pos)
+        neighbours = self.geometry.city_neighbours.get(city_pos)
+        if city is None or city.res_city != 'C' or neighbours is None:
+            return None
+        colors = set()
+        empty = None
+        for n_pos in neighbours:
+            n = piece if n_pos == pos else self.env.get(n_pos)
+            if n is None:
+                if empty is not None:
+                    return None
+                empty = n_pos
+            elif n.color in colors:
+                return None
+            else:
+                colors.add(n.color)
+        if empty is None:
+            return None
+        missing_color, = {"R", "G", "B", "Y"} - colors
+        return city.owner_id, missing_color, empty
+
+    def hot_cities_after(self, pos: Tuple[int, int], piece: Piece) -> Dict[Tuple[int, int], Tuple[int, str, Tuple[int, int]]]:
+        """
+        Returns the hot cities index the board would have after placing a piece. Only the placed city,
+        or the cities around the placed resource, can change.
+
+        Args:
+            pos (Tuple[int, int]): The position of the new piece.
+            piece (Piece): The piece to place.
+
+        Returns:
+            Dict[Tuple[int, int], Tuple[int, str, Tuple[int, int]]]: The hot cities of the resulting board.
+        """
+        cities = (pos,) if piece.res_city == 'C' else self.geometry.resource_cities.get(pos, ())
+        hot_cities = self.hot_cities
+        for city_pos in cities:
+            threat = self.city_threat(city_pos, pos, piece)
+            if threat != hot_cities.get(city_pos):
+                if hot_cities is self.hot_cities:
+                    hot_cities = dict(hot_cities)
+                if threat is None:
+                    del hot_cities[city_pos]
                 else:
-                    board_string += cell + "  "
-            board_string += "\n"
+                    hot_cities[city_pos] = threat
+        return hot_cities
+
+    def render(self, colored: bool = True) -> str:
+        """
+        Returns the board drawn as a diamond, like on the GUI. The string is cached on the board for its
+        current pieces, so a board printed several times is only drawn once.
+
+        Args:
+            colored (bool, optional): Draw the pieces with colorama escape sequences, otherwise in plain ASCII,
+                each piece written as its type (e.g. "RCW"), an empty city as "[ ]" and an empty resource as " . ".
+
+        Returns:
+            str: The drawing of the board.
+        """
+        cache_key = (self.zobrist_key, colored)
+        if self._rendered is not None and self._rendered[0] == cache_key:
+            return self._rendered[1]
+        board_string = self.render_colored() if colored else self.render_ascii()
+        self._rendered = (cache_key, board_string)
         return board_string
+
+    def get_render_layout(self) -> List[List[Tuple[int, int] | str]]:
+        """
+        Returns the rows of the diamond drawing of the board, computed once per board size: each cell is either
+        a board position or a padding string.
+        """
+        layout = BoardDivercite._render_layouts.get(self.geometry.size)
+        if layout is None:
+            board_mask = self.geometry.board_mask
+            positions = [[(i, j) if board_mask[i][j] else ' ' for j in range(len(board_mask))] for i in range(len(board_mask))]
+            rotated_grid = self.rotate_grid_45(positions)
+            max_len = max(len(row) for row in rotated_grid)
+            layout = []
+            for i, row in enumerate(rotated_grid):
+                if all(cell == ' ' for cell in row):
+                    continue
+                padded_row = [' '] * ((max_len - len(row)) // 2) + row + [' '] * ((max_len - len(row)) // 2)
+                if i%2 == 1:
+                    padded_row = [''] + padded_row
+                layout.append(padded_row)
+            BoardDivercite._render_layouts[self.geometry.size] = layout
+        return layout
+
+    def render_colored(self) -> str:
+        # colorama is only needed to print the board, the search processes never pay its import
+        from colorama import Fore, Style
+
+        colors = {'R': Fore.RED, 'G': Fore.GREEN, 'Y': Fore.YELLOW, 'B': Fore.BLUE}
+        empty_cells = {'C': Fore.BLACK + "▢ " + Style.RESET_ALL + " ", 'R': Fore.BLACK + "◇ " + Style.RESET_ALL + " "}
+        parts = ["\n"]
+        for row in self.get_render_layout():
+            for cell in row:
+                if isinstance(cell, str):
+                    parts.append(cell + "  ")
+                elif cell in self.env:
+                    piece = self.env[cell]
+                    if piece.res_city == "C":
+                        char = "🅆" if piece.piece_type[2] == 'W' else "🄱"
+                    else:
+                        char = "◆ "
+                    parts.append(colors[piece.color] + char + Style.RESET_ALL + " ")
+                else:
+                    parts.append(empty_cells[self.geometry.board_mask[cell[0]][cell[1]]])
+            parts.append("\n")
+        return "".join(parts)
+
+    def render_ascii(self) -> str:
+        empty_cells = {'C': "[ ] ", 'R': " .  "}
+        parts = ["\n"]
+        for row in self.get_render_layout():
+            for cell in row:
+                if isinstance(cell, str):
+                    parts.append("  " if cell == '' else "    ")
+                elif cell in self.env:
+                    parts.append(self.env[cell].piece_type + " ")
+                else:
+                    parts.append(empty_cells[self.geometry.board_mask[cell[0]][cell[1]]])
+            parts.append("\n")
+        return "".join(parts)
+
+    def __str__(self):
+        colored = BOARD_RENDERING.get()
+        if colored is None:
+            # The line logging the board is filtered out, it is not worth drawing
+            return f"<board of {len(self.env)} pieces>"
+        return self.render(colored)
     
     # def __str__(self):
     #     grid_data = self.get_grid()
@@ -123,7 +399,7 @@ class BoardDivercite(Board):
                 if v[0] < 0 or v[1] < 0 or v[0] >= self.dimensions[0] or v[1] >= self.dimensions[1]:
                     neighbours[k] = ("OUTSIDE", neighbours[k])
                 else:
-                    if BoardDivercite.FORBIDDEN_MASK[v[0]][v[1]]:
+                    if self.geometry.forbidden_mask[v[0]][v[1]]:
                         neighbours[k] = ("OUTSIDE",neighbours[k])
                     else:
                         neighbours[k] = ("EMPTY",neighbours[k])
@@ -138,22 +414,14 @@ class BoardDivercite(Board):
         Returns:
             str: The nice representation of the board.
         """
-        grid_data = [
-            [0, 0, 0, 0, 2, 0, 0, 0, 0],
-            [0, 0, 0, 2, 1, 2, 0, 0, 0],
-            [0, 0, 2, 1, 2, 1, 2, 0, 0],
-            [0, 2, 1, 2, 1, 2, 1, 2, 0],
-            [2, 1, 2, 1, 2, 1, 2, 1, 2],
-            [0, 2, 1, 2, 1, 2, 1, 2, 0],
-            [0, 0, 2, 1, 2, 1, 2, 0, 0],
-            [0, 0, 0, 2, 1, 2, 0, 0, 0],
-            [0, 0, 0, 0, 2, 0, 0, 0, 0],
-        ]
+        grid_data = [[0] * self.dimensions[1] for _ in range(self.dimensions[0])]
+        board_mask = self.geometry.board_mask
         for i in range(self.dimensions[0]):
             for j in range(self.dimensions[1]):
                 if (i,j) in self.env:
-                    piece_type = self.env[(i,j)].get_type()
-                    piece_color, piece_res_city = piece_type[0], piece_type[1]
+                    piece = self.env[(i,j)]
+                    piece_type = piece.get_type()
+                    piece_color, piece_res_city = piece.color, piece.res_city
                     if piece_res_city == "C" and piece_type[2] == 'W':
                         char = "🅆"
                     elif piece_res_city == "C" and piece_type[2] == 'B':
@@ -161,16 +429,17 @@ class BoardDivercite(Board):
                     else:
                         char = "◆ "
                     grid_data[i][j] = (char, piece_color)
-                elif BoardDivercite.BOARD_MASK[i][j] == 'C':
+                elif board_mask[i][j] == 'C':
                     grid_data[i][j] = ("▢ ", "Black")
-                elif BoardDivercite.BOARD_MASK[i][j] == 'R':
+                elif board_mask[i][j] == 'R':
                     grid_data[i][j] = ("◇ ", "Black")
                 else:
                     grid_data[i][j] = " "
          
         return grid_data
     
-    def rotate_grid_45(self, grid_data: List[List[tuple|str]]) -> List[List[tuple|str]]:
+    @staticmethod
+    def rotate_grid_45(grid_data: List[List[tuple|str]]) -> List[List[tuple|str]]:
         """
         Rotate the grid by 45 degrees.
 
@@ -191,7 +460,7 @@ class BoardDivercite(Board):
                 if i%2 == 0:
                     rot_grid[i][j] = grid_data[i//2+n//2-j][j+i//2]
                 else:
-                    if j != 4:
+                    if j != n//2:
                         rot_grid[i][j] = grid_data[i//2+n//2-j][j+1+i//2]
 
         return rot_grid
@@ -217,5 +486,5 @@ class BoardDivercite(Board):
         for x,y in d["env"].items():
             # TODO eval is unsafe
             del dd["env"][x]
-            dd["env"][eval(x)] = Piece.from_json(json.dumps(y))
+            dd["env"][eval(x)] = PieceDivercite.from_json(json.dumps(y))
         return cls(**dd)
@@ -0,0 +1,289 @@
+import argparse
+import glob
+import json
+import os
+from argparse import RawTextHelpFormatter
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from game_state_divercite import GameStateDivercite
+from geometry_divercite import CITY_RESOURCE_TYPES, COLORS, STANDARD_SIZE, Variant
+
+# The shapes are those of the standard game, the records of the other variants are rejected
+# Per-cell planes : 4 colors, city/resource, owner (first player, second player)
+COLOR_PLANE = {c: k for k, c in enumerate(COLORS)}
+TYPE_PLANE = {t: len(COLORS) + k for k, t in enumerate(CITY_RESOURCE_TYPES)}
+OWNER_PLANE = len(COLORS) + len(CITY_RESOURCE_TYPES)
+N_PLANES = OWNER_PLANE + 2
+BOARD_SIZE = STANDARD_SIZE
+N_CELLS = BOARD_SIZE * BOARD_SIZE
+
+# Global features : pieces left of each player for each piece (first player then second player), then the step
+PIECES = [c+t for c in COLORS for t in CITY_RESOURCE_TYPES]
+PIECE_INDEX = {piece: k for k, piece in enumerate(PIECES)}
+STEP_FEATURE = 2 * len(PIECES)
+N_FEATURES = STEP_FEATURE + 1
+INITIAL_STOCK = np.array([Variant().initial_stock()[piece] for piece in PIECES] * 2, dtype=np.float32)
+
+# Labels : final score difference (first player minus second player) and result for the first player (1, 0.5 or 0)
+N_LABELS = 2
+
+
+def allocate(n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Allocate the buffers for n encoded positions.
+
+    Args:
+        n (int): Number of positions.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Planes (n, N_PLANES, 9, 9) and global features (n, N_FEATURES).
+    """
+    return np.zeros((n, N_PLANES, BOARD_SIZE, BOARD_SIZE), dtype=np.uint8), np.zeros((n, N_FEATURES), dtype=np.float32)
+
+
+def encode_state(current_state: GameStateDivercite, planes: np.ndarray, features: np.ndarray) -> None:
+    """
+    Encode a game state into preallocated buffers.
+
+    Args:
+        current_state (GameStateDivercite): The state to encode.
+        planes (np.ndarray): Output planes of shape (N_PLANES, 9, 9), overwritten.
+        features (np.ndarray): Output global features of shape (N_FEATURES,), overwritten.
+    """
+    first_player_id = current_state.players[0].get_id()
+    indices = []
+    for (i, j), piece in current_state.get_rep().get_env().items():
+        cell = i * BOARD_SIZE + j
+        indices.append(COLOR_PLANE[piece.color] * N_CELLS + cell)
+        indices.append(TYPE_PLANE[piece.res_city] * N_CELLS + cell)
+        indices.append((OWNER_PLANE + (piece.owner_id != first_player_id)) * N_CELLS + cell)
+    flat_planes = planes.reshape(-1)
+    flat_planes[:] = 0
+    flat_planes[indices] = 1
+    for k, player in enumerate(current_state.players):
+        for piece, n_piece in current_state.players_pieces_left[player.get_id()].items():
+            features[k * len(PIECES) + PIECE_INDEX[piece]] = n_piece
+    features[STEP_FEATURE] = current_state.step
+
+
+def encode_states(states: List[GameStateDivercite], planes: Optional[np.ndarray] = None,
+                  features: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode a batch of game states.
+
+    Args:
+        states (List[GameStateDivercite]): The states to encode.
+        planes (np.ndarray, optional): Preallocated planes buffer with at least len(states) rows.
+        features (np.ndarray, optional): Preallocated features buffer with at least len(states) rows.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The planes and features of the batch.
+    """
+    if planes is None or features is None:
+        planes, features = allocate(len(states))
+    for k, current_state in enumerate(states):
+        encode_state(current_state, planes[k], features[k])
+    return planes[:len(states)], features[:len(states)]
+
+
+def encode_record(moves: List[Tuple[str, Tuple[int, int]]], planes: Optional[np.ndarray] = None,
+                  features: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode every position of a recorded game, from the initial position to the final one, without replaying it
+    through the engine: the one-hot encoding of each move is accumulated along the game.
+
+    Args:
+        moves (List[Tuple[str, Tuple[int, int]]]): The (piece, position) pairs of the game, first player first.
+        planes (np.ndarray, optional): Preallocated planes buffer with at least len(moves) + 1 rows.
+        features (np.ndarray, optional): Preallocated features buffer with at least len(moves) + 1 rows.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The planes and features of the len(moves) + 1 positions.
+    """
+    n_moves = len(moves)
+    if planes is None or features is None:
+        planes, features = allocate(n_moves + 1)
+    planes, features = planes[:n_moves + 1], features[:n_moves + 1]
+
+    owners = np.arange(n_moves) % 2
+    cells = np.array([i * BOARD_SIZE + j for _, (i, j) in moves], dtype=np.intp)
+    color_planes = np.array([COLOR_PLANE[piece[0]] for piece, _ in moves], dtype=np.intp)
+    type_planes = np.array([TYPE_PLANE[piece[1]] for piece, _ in moves], dtype=np.intp)
+    stock_indices = owners * len(PIECES) + np.array([PIECE_INDEX[piece] for piece, _ in moves], dtype=np.intp)
+
+    placed = np.zeros((n_moves, N_PLANES * N_CELLS), dtype=np.uint8)
+    rows = np.arange(n_moves)
+    placed[rows, color_planes * N_CELLS + cells] = 1
+    placed[rows, type_planes * N_CELLS + cells] = 1
+    placed[rows, (OWNER_PLANE + owners) * N_CELLS + cells] = 1
+    flat_planes = planes.reshape(n_moves + 1, -1)
+    flat_planes[0] = 0
+    np.cumsum(placed, axis=0, out=flat_planes[1:])
+
+    used = np.zeros((n_moves, len(INITIAL_STOCK)), dtype=np.float32)
+    used[rows, stock_indices] = 1
+    features[0, :STEP_FEATURE] = INITIAL_STOCK
+    np.cumsum(used, axis=0, out=features[1:, :STEP_FEATURE])
+    np.subtract(INITIAL_STOCK, features[1:, :STEP_FEATURE], out=features[1:, :STEP_FEATURE])
+    features[:, STEP_FEATURE] = np.arange(n_moves + 1)
+    return planes, features
+
+
+def check_variant(record: dict) -> None:
+    """
+    Reject the record of a game that is not standard: the encoding has the shapes of the standard board and stock.
+
+    Args:
+        record (dict): A game record.
+
+    Raises:
+        ValueError: When the game is played on another variant.
+    """
+    variant = Variant.from_json(record.get("variant"))
+    if not variant.is_standard():
+        raise ValueError(f"Game {record.get('game_id', '')} is a variant ({variant.to_json()}), only standard games are encoded.")
+
+
+def record_labels(record: dict) -> Tuple[float, float]:
+    """
+    Returns the labels shared by every position of a game record.
+
+    Args:
+        record (dict): A game record as produced by `arena_divercite.play_headless_game`.
+
+    Returns:
+        Tuple[float, float]: The final score difference and the result for the first player.
+    """
+    score_diff = record["scores"][0] - record["scores"][1]
+    result = 0.5 if record["winner"] is None else 1.0 - record["winner"]
+    return score_diff, result
+
+
+class DatasetWriter:
+    """
+    Writes encoded positions to memory-mapped `.npy` shards: `planes_XXXXX.npy`, `features_XXXXX.npy` and
+    `labels_XXXXX.npy`. Records are encoded directly into the mapped files.
+
+    Attributes:
+        directory (str): Output directory.
+        shard_size (int): Maximum number of positions per shard.
+        n_positions (int): Number of positions written so far.
+    """
+
+    def __init__(self, directory: str, shard_size: int = 1 << 16) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_size = shard_size
+        self.n_positions = 0
+        self.shard_index = len(glob.glob(os.path.join(directory, "planes_*.npy")))
+        self.shard = None
+        self.shard_fill = 0
+
+    def shard_path(self, kind: str, index: int) -> str:
+        return os.path.join(self.directory, f"{kind}_{index:05d}.npy")
+
+    def open_shard(self) -> None:
+        self.shard = (
+            np.lib.format.open_memmap(self.shard_path("planes", self.shard_index), mode="w+", dtype=np.uint8,
+                                      shape=(self.shard_size, N_PLANES, BOARD_SIZE, BOARD_SIZE)),
+            np.lib.format.open_memmap(self.shard_path("features", self.shard_index), mode="w+", dtype=np.float32,
+                                      shape=(self.shard_size, N_FEATURES)),
+            np.lib.format.open_memmap(self.shard_path("labels", self.shard_index), mode="w+", dtype=np.float32,
+                                      shape=(self.shard_size, N_LABELS)),
+        )
+        self.shard_fill = 0
+
+    def close_shard(self) -> None:
+        if self.shard is None:
+            return
+        for array in self.shard:
+            array.flush()
+        shard, self.shard = self.shard, None
+        if self.shard_fill < self.shard_size:
+            # The last shard is truncated to the positions actually written
+            filled = [np.array(array[:self.shard_fill]) for array in shard]
+            del shard
+            for kind, array in zip(("planes", "features", "labels"), filled):
+                np.save(self.shard_path(kind, self.shard_index), array)
+        self.shard_index += 1
+
+    def write_record(self, record: dict) -> int:
+        """
+        Encode and write every position of a game record.
+
+        Args:
+            record (dict): A game record with its moves, scores and winner.
+
+        Returns:
+            int: The number of positions written.
+
+        Raises:
+            ValueError: When the game is not a standard game, or does not fit in a shard.
+        """
+        check_variant(record)
+        n = len(record["moves"]) + 1
+        if n > self.shard_size:
+            raise ValueError(f"A game of {n} positions does not fit in shards of {self.shard_size} positions.")
+        if self.shard is None or self.shard_fill + n > self.shard_size:
+            self.close_shard()
+            self.open_shard()
+        planes, features, labels = (array[self.shard_fill:self.shard_fill + n] for array in self.shard)
+        encode_record(record["moves"], planes, features)
+        labels[:] = record_labels(record)
+        self.shard_fill += n
+        self.n_positions += n
+        return n
+
+    def close(self) -> None:
+        self.close_shard()
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def read_records(paths: Iterable[str], standard_only: bool = False) -> Iterable[dict]:
+    """
+    Stream the finished game records of JSON lines results files (tournaments, self-play).
+
+    Args:
+        paths (Iterable[str]): The results files.
+        standard_only (bool, optional): Skip the games of the other variants, with a warning.
+
+    Returns:
+        Iterable[dict]: The game records that went to the end.
+    """
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("type", "game") != "game" or record.get("termination") != "done":
+                    continue
+                if standard_only and not Variant.from_json(record.get("variant")).is_standard():
+                    logger.warning(f"{path} : game {record.get('game_id', '')} skipped, it is not a standard game")
+                    continue
+                yield record
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser(
+                        prog="encoding_divercite.py",
+                        description="Encodes the positions of recorded games into memory-mapped .npy shards.",
+                        formatter_class=RawTextHelpFormatter)
+    parser.add_argument("records", nargs="+", help="JSON lines files of game records.")
+    parser.add_argument("-o","--output",required=True,help="Output directory of the shards.\n\n")
+    parser.add_argument("-s","--shard-size",type=int,default=1 << 16,help="Positions per shard.\n\n")
+    args = parser.parse_args()
+
+    with DatasetWriter(args.output, args.shard_size) as writer:
+        for record in read_records(args.records, standard_only=True):
+            writer.write_record(record)
+    logger.info(f"{writer.n_positions} positions written to {args.output}")
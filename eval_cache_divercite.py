@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from typing import Callable, Dict
+
+from seahorse.game.game_state import GameState
+
+
+class EvaluationCache:
+    """
+    A bounded LRU cache of evaluations keyed by position, meant to be wrapped around the evaluation function of a
+    search player. The wrapped function must only depend on the position (and on the player it is bound to).
+
+    Attributes:
+        max_size (int): Maximum number of cached evaluations.
+        hits (int): Number of evaluations served from the cache.
+        misses (int): Number of evaluations actually computed.
+    """
+
+    def __init__(self, max_size: int = 1 << 16) -> None:
+        """
+        Initializes a new instance of the EvaluationCache class.
+
+        Args:
+            max_size (int, optional): Maximum number of cached evaluations. Defaults to 65536.
+        """
+        self.max_size = max_size
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def wrap(self, evaluate: Callable[[GameState], float]) -> Callable[[GameState], float]:
+        """
+        Wrap an evaluation function so that its results are cached.
+
+        Args:
+            evaluate (Callable[[GameState], float]): The evaluation function.
+
+        Returns:
+            Callable[[GameState], float]: The cached evaluation function.
+        """
+        table = self.table
+
+        def cached_evaluate(current_state: GameState) -> float:
+            key = current_state.get_position_key()
+            value = table.get(key)
+            if value is not None:
+                table.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+            value = evaluate(current_state)
+            table[key] = value
+            if len(table) > self.max_size:
+                table.popitem(last=False)
+            return value
+
+        cached_evaluate.__wrapped__ = evaluate
+        return cached_evaluate
+
+    def resize(self, max_size: int) -> None:
+        """
+        Change the maximum number of cached evaluations, the least recently used ones are dropped.
+
+        Args:
+            max_size (int): The new maximum size.
+        """
+        self.max_size = max_size
+        while len(self.table) > max_size:
+            self.table.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Empty the cache and reset the statistics.
+        """
+        self.table.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Returns the cache statistics.
+
+        Returns:
+            Dict[str, float]: Hits, misses, current size and hit rate of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.table),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,68 @@
+import json
+import os
+from os.path import dirname
+from typing import List, Optional
+
+# Hand-picked weights: the score counts once, a city open for a divercite counts by its number of colors
+DEFAULT_SCORE_WEIGHT = 1
+DEFAULT_INDEX_SCORES = [0, 0, 2, 3, 5]
+
+
+def evaluation_path(player_file: str) -> str:
+    """
+    Returns the path of the tuned evaluation weights of a player module, stored next to it.
+
+    Args:
+        player_file (str): Path to the player module.
+
+    Returns:
+        str: Path to `evaluation_<module>.json`.
+    """
+    return os.path.join(dirname(os.path.abspath(player_file)), f"evaluation_{os.path.splitext(os.path.basename(player_file))[0]}.json")
+
+
+class EvaluationWeights:
+    """
+    Weights of the divercite index heuristic: the value of a player is score_weight * score plus,
+    for each of its cities still open for a divercite, the index score of its number of colors.
+
+    Attributes:
+        score_weight (float): Weight of the current score.
+        index_scores (List[float]): Index score of a city by number of colors around it, from 0 to 4.
+    """
+
+    def __init__(self, score_weight: float = DEFAULT_SCORE_WEIGHT, index_scores: Optional[List[float]] = None) -> None:
+        self.score_weight = score_weight
+        self.index_scores = list(index_scores) if index_scores is not None else list(DEFAULT_INDEX_SCORES)
+
+    @classmethod
+    def load(cls, path: str) -> "EvaluationWeights":
+        """
+        Load a weights file, a missing file gives the hand-picked weights.
+
+        Args:
+            path (str): Path to the weights file.
+
+        Returns:
+            EvaluationWeights: The weights.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["score_weight"], data["index_scores"])
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"score_weight": self.score_weight, "index_scores": self.index_scores}, f, indent=2)
+
+    @classmethod
+    def from_vector(cls, vector: List[float]) -> "EvaluationWeights":
+        return cls(vector[0], vector[1:])
+
+    def to_vector(self) -> List[float]:
+        """
+        Returns the weights in the order of the features of `MyPlayer.evaluation_features`:
+        the score weight, then the index scores.
+        """
+        return [self.score_weight] + self.index_scores
@@ -3,7 +3,7 @@ import json
 import random
 from typing import Dict, Generator, List, Optional, Set, Tuple
 
-from board_divercite import BoardDivercite
+from board_divercite import BoardDivercite, PieceDivercite
 from player_divercite import PlayerDivercite
 from seahorse.game.game_layout.board import Piece
 from seahorse.game.game_state import GameState
@@ -21,13 +21,16 @@ class GameStateDivercite(GameState):
         next_player (Player): Next player to play.
         players (list[Player]): List of players.
         rep (Representation): Representation of the game.
+        max_step (int): Number of steps of the game, by default the number of pieces of the stock.
     """
     def __init__(self, scores: Dict, next_player: Player, players: List[Player], rep: BoardDivercite, step: int, 
-                 players_pieces_left: dict[str: dict[str: int]],  *args, **kwargs) -> None:
+                 players_pieces_left: dict[str: dict[str: int]], max_step: Optional[int] = None, *args, **kwargs) -> None:
         super().__init__(scores, next_player, players, rep)
-        self.max_step = 40
+        # Every step places a piece : the pieces placed and the pieces left make the stock
+        self.max_step = max_step if max_step is not None else step + sum(sum(pieces.values()) for pieces in players_pieces_left.values())
         self.step = step
         self.players_pieces_left = {int(a):b for a,b in players_pieces_left.items()}
+        self._undo_stack = []
 
     def get_step(self) -> int:
         """
@@ -38,6 +41,34 @@ class GameStateDivercite(GameState):
         """
         return self.step
 
+    def get_position_key(self) -> tuple:
+        """
+        Return a cheap key identifying the position: the zobrist hash of the board and the scores.
+        The step, the next player and the pieces left all follow from the board.
+
+        Returns:
+            tuple: The position key.
+        """
+        return (self.rep.zobrist_key, *[self.scores[player.get_id()] for player in self.players])
+
+    def get_hot_cities(self, owner_id: Optional[int] = None) -> Dict[Tuple[int, int], Tuple[int, str, Tuple[int, int]]]:
+        """
+        Return the cities one resource away from a divercite: three neighbours of distinct colors and an empty one.
+        Placing a resource of the missing color there completes the divercite (+5 for the owner of the city),
+        placing any other color breaks it.
+
+        Args:
+            owner_id (int, optional): Only return the cities of this player.
+
+        Returns:
+            Dict[Tuple[int, int], Tuple[int, str, Tuple[int, int]]]: The owner, the missing color and the empty
+                neighbour of each hot city, by city position.
+        """
+        hot_cities = self.rep.hot_cities
+        if owner_id is None:
+            return hot_cities
+        return {pos: threat for pos, threat in hot_cities.items() if threat[0] == owner_id}
+
     def is_done(self) -> bool:
         """
         Check if the game is finished.
@@ -60,7 +91,7 @@ class GameStateDivercite(GameState):
         Returns:
             bool: True if the index is within the game board, False otherwise.
         """
-        return not BoardDivercite.FORBIDDEN_MASK[index[0]][index[1]]
+        return not self.rep.geometry.forbidden_mask[index[0]][index[1]]
     
     def piece_type_match(self, resource_or_city: str, pos: tuple) -> bool:
         """
@@ -74,7 +105,7 @@ class GameStateDivercite(GameState):
             bool: True if the piece can be placed on the position, False otherwise.
 
         """
-        return BoardDivercite.BOARD_MASK[pos[0]][pos[1]] == resource_or_city
+        return self.rep.geometry.board_mask[pos[0]][pos[1]] == resource_or_city
     
     def get_player_id(self, pid) -> Player:
         """
@@ -100,28 +131,32 @@ class GameStateDivercite(GameState):
         current_rep = self.get_rep()
         b = current_rep.get_env()
         d = current_rep.get_dimensions()
+        positions = current_rep.geometry.positions
 
         for piece, n_piece in self.players_pieces_left[self.next_player.get_id()].items():
             piece_color = piece[0]
             piece_res_city = piece[1]
             if n_piece > 0:
-                for i in range(d[0]):
-                    for j in range(d[1]):
-                        if self.in_board((i, j)) and (i,j) not in b and self.piece_type_match(piece_res_city, (i, j)):
-                            copy_b = copy.copy(b)
-                            copy_b[(i, j)] = Piece(piece_type=piece_color+piece_res_city+self.next_player.piece_type, owner=self.next_player)
-                            play_info = ((i,j), piece, self.next_player.get_id())
-                            yield HeavyAction(
-                                            self,
-                                            GameStateDivercite(
-                                                self.compute_scores(play_info),
-                                                self.compute_next_player(),
-                                                self.players,
-                                                BoardDivercite(env=copy_b, dim=d),
-                                                step=self.step + 1,
-                                                players_pieces_left=self.compute_players_pieces_left(play_info),
-                                            ),
-                                        )
+                new_piece = PieceDivercite.get(piece_color+piece_res_city+self.next_player.piece_type, self.next_player.get_id())
+                for (i, j) in positions[piece_res_city]:
+                    if (i,j) not in b:
+                        copy_b = copy.copy(b)
+                        copy_b[(i, j)] = new_piece
+                        play_info = ((i,j), piece, self.next_player.get_id())
+                        yield HeavyAction(
+                                        self,
+                                        GameStateDivercite(
+                                            self.compute_scores(play_info),
+                                            self.compute_next_player(),
+                                            self.players,
+                                            BoardDivercite(env=copy_b, dim=d, zobrist_key=current_rep.zobrist_key_after((i, j), new_piece),
+                                                           hot_cities=current_rep.hot_cities_after((i, j), new_piece),
+                                                           color_masks=current_rep.color_masks_after((i, j), new_piece)),
+                                            step=self.step + 1,
+                                            players_pieces_left=self.compute_players_pieces_left(play_info),
+                                            max_step=self.max_step,
+                                        ),
+                                    )
                             
 
     def generate_possible_light_actions(self) -> Generator[LightAction, None, None]:
@@ -135,17 +170,47 @@ class GameStateDivercite(GameState):
 
         current_rep = self.get_rep()
         b = current_rep.get_env()
-        d = current_rep.get_dimensions()
+        # The free cells are read from the precomputed cells of each type, in row-major order
+        positions = current_rep.geometry.positions
         for piece, n_piece in self.players_pieces_left[self.next_player.get_id()].items():
             piece_color = piece[0]
             piece_res_city = piece[1]
             if n_piece > 0:
-                for i in range(d[0]):
-                    for j in range(d[1]):
-                        if self.in_board((i, j)) and (i,j) not in b and self.piece_type_match(piece_res_city, (i, j)):
-                            data = {"piece": piece_color+piece_res_city, "position" : (i,j)}
-                            yield LightAction(data)
+                for (i, j) in positions[piece_res_city]:
+                    if (i,j) not in b:
+                        data = {"piece": piece_color+piece_res_city, "position" : (i,j)}
+                        yield LightAction(data)
+
 
+    def generate_tactical_light_actions(self) -> Generator[LightAction, None, None]:
+        """
+        Generate the moves of the next player that complete or break a divercite: a city on an empty slot
+        surrounded by four distinct colors, the missing resource of one of its hot cities, or a resource
+        of another color on the empty neighbour of a hot city of the opponent. Completions come first.
+
+        Returns:
+            Generator[LightAction]: Generator of tactical light actions.
+        """
+        player_id = self.next_player.get_id()
+        pieces_left = self.players_pieces_left[player_id]
+        env = self.rep.get_env()
+        cities = [color+"C" for color in "RGBY" if pieces_left[color+"C"] > 0]
+        if cities:
+            for city_pos in self.rep.geometry.city_neighbours:
+                if city_pos not in env and self.rep.is_divercite(city_pos):
+                    for piece in cities:
+                        yield LightAction({"piece": piece, "position": city_pos})
+        completions, blocks = [], []
+        for owner_id, missing_color, empty in self.rep.hot_cities.values():
+            if owner_id == player_id:
+                completions.append((missing_color+"R", empty))
+            else:
+                blocks.extend((color+"R", empty) for color in "RGBY" if color != missing_color)
+        seen = set()
+        for piece, position in completions + blocks:
+            if pieces_left[piece] > 0 and (piece, position) not in seen:
+                seen.add((piece, position))
+                yield LightAction({"piece": piece, "position": position})
 
     def apply_action(self, action: LightAction) -> GameState:
         """
@@ -167,8 +232,11 @@ class GameStateDivercite(GameState):
         b = current_rep.get_env()
         d = current_rep.get_dimensions()
         copy_b = copy.copy(b)
-        copy_b[position] = Piece(piece_type=piece+self.next_player.get_piece_type(), owner=self.next_player)
-        new_board = BoardDivercite(env=copy_b, dim=d)
+        new_piece = PieceDivercite.get(piece+self.next_player.get_piece_type(), self.next_player.get_id())
+        copy_b[position] = new_piece
+        new_board = BoardDivercite(env=copy_b, dim=d, zobrist_key=current_rep.zobrist_key_after(position, new_piece),
+                                   hot_cities=current_rep.hot_cities_after(position, new_piece),
+                                   color_masks=current_rep.color_masks_after(position, new_piece))
         play_info = (position, piece, self.next_player.get_id())
 
         return GameStateDivercite(
@@ -178,8 +246,67 @@ class GameStateDivercite(GameState):
             new_board,
             step=self.step + 1,
             players_pieces_left=self.compute_players_pieces_left(play_info=play_info),
+            max_step=self.max_step,
         )
 
+    def copy(self) -> "GameStateDivercite":
+        """
+        Returns an independent copy of the state, that a search can walk with `push` and `pop`
+        without touching the state it received.
+
+        Returns:
+            GameStateDivercite: The copy.
+        """
+        current_rep = self.rep
+        # The incremental indexes are replaced on placement, never modified, so they can be shared
+        board = BoardDivercite(env=dict(current_rep.env), dim=current_rep.dimensions, zobrist_key=current_rep.zobrist_key,
+                               hot_cities=current_rep.hot_cities, color_masks=current_rep.color_masks)
+        return GameStateDivercite(dict(self.scores), self.next_player, self.players, board, self.step,
+                                  {player_id: dict(pieces) for player_id, pieces in self.players_pieces_left.items()}, self.max_step)
+
+    def push(self, action: LightAction) -> None:
+        """
+        Apply an action in place, for searches walking the tree on a single state. Only the placed cell,
+        the previous scores, the stock decrement and the incremental board keys are recorded on an undo stack,
+        `pop` restores them. The state must not be shared (game master, caches) while it is modified:
+        `apply_action` remains the immutable way to play a move.
+
+        Args:
+            action (LightAction): The action to apply.
+        """
+        piece, position = action.data["piece"], tuple(action.data["position"])
+        player_id = self.next_player.get_id()
+        current_rep = self.rep
+        new_piece = PieceDivercite.get(piece+self.next_player.get_piece_type(), player_id)
+        scores = self.compute_scores((position, piece, player_id))
+        self._undo_stack.append((position, piece, player_id, self.scores, self.next_player, current_rep.zobrist_key,
+                                 current_rep.hot_cities, current_rep.color_masks, self._possible_light_actions,
+                                 self._possible_heavy_actions))
+        current_rep.zobrist_key = current_rep.zobrist_key_after(position, new_piece)
+        current_rep.hot_cities = current_rep.hot_cities_after(position, new_piece)
+        current_rep.color_masks = current_rep.color_masks_after(position, new_piece)
+        current_rep.env[position] = new_piece
+        self.scores = scores
+        self.players_pieces_left[player_id][piece] -= 1
+        self.next_player = self.compute_next_player()
+        self.step += 1
+        self._possible_light_actions = None
+        self._possible_heavy_actions = None
+
+    def pop(self) -> None:
+        """
+        Undo the last action applied with `push`.
+        """
+        (position, piece, player_id, self.scores, self.next_player, zobrist_key, hot_cities, color_masks,
+         self._possible_light_actions, self._possible_heavy_actions) = self._undo_stack.pop()
+        current_rep = self.rep
+        del current_rep.env[position]
+        current_rep.zobrist_key = zobrist_key
+        current_rep.hot_cities = hot_cities
+        current_rep.color_masks = color_masks
+        self.players_pieces_left[player_id][piece] += 1
+        self.step -= 1
+
     def convert_gui_data_to_action_data(self, gui_data: dict) -> dict:
         """
         Convert GUI data to action data.
@@ -220,20 +347,23 @@ class GameStateDivercite(GameState):
         pos, piece, id_player = play_info
         color, res_city = piece[0], piece[1]
         scores = copy.copy(self.scores)
+        env = self.get_rep().get_env()
         if res_city == "C":
             if self.check_divercite(pos):
                 scores[id_player] += 5
             else:
-                scores[id_player] += len([n for n in self.get_neighbours(pos[0], pos[1]).values() 
-                                          if isinstance(n[0], Piece) and n[0].get_type()[0] == color])
-        else:            
-            for n in self.get_neighbours(pos[0], pos[1]).values():
-                if isinstance(n[0], Piece):
-                    if self.check_divercite(n[1], color):
-                        scores[n[0].get_owner_id()] -= int(n[0].get_type()[0] != color)
-                        scores[n[0].get_owner_id()] += 5
+                scores[id_player] += len([n_pos for n_pos in self.rep.geometry.city_resources[pos]
+                                          if n_pos in env and env[n_pos].color == color])
+        else:
+            # The neighbours of a resource are cities
+            for n_pos in self.rep.geometry.resource_cities.get(pos, ()):
+                city = env.get(n_pos)
+                if city is not None:
+                    if self.check_divercite(n_pos, color):
+                        scores[city.owner_id] -= int(city.color != color)
+                        scores[city.owner_id] += 5
                     else:
-                        scores[n[0].get_owner_id()] += int(n[0].get_type()[0] == color)
+                        scores[city.owner_id] += int(city.color == color)
 
         if self.step == self.max_step-1:
             # Last step, we prevent draws
@@ -242,7 +372,7 @@ class GameStateDivercite(GameState):
                 
                 env = copy.copy(self.get_rep().get_env())
                 player = self.get_player_id(id_player)
-                env[pos] = Piece(piece_type=color+res_city+player.piece_type, owner=player)
+                env[pos] = PieceDivercite.get(color+res_city+player.piece_type, player.get_id())
                 new_board = BoardDivercite(env=env, dim=self.get_rep().get_dimensions())
                 return self.remove_draw(scores, new_board)
         
@@ -265,12 +395,12 @@ class GameStateDivercite(GameState):
         
         def count_divercite(player_id: int) -> int:
             return sum([self.check_divercite((i,j), board=board) for i in range(d[0]) for j in range(d[1]) 
-                        if self.in_board((i,j)) and env.get((i,j)) and env.get((i,j)).get_type()[1] == 'C' and env[(i,j)].get_owner_id() == player_id])
+                        if self.in_board((i,j)) and env.get((i,j)) and env.get((i,j)).res_city == 'C' and env[(i,j)].owner_id == player_id])
             
         
         def count_nstack(player_id, n) -> int:
-            return sum([sum([p[0].get_type()[0] == env[(i,j)].get_type()[0] for p in board.get_neighbours(i,j).values() if isinstance(p[0], Piece)]) == n 
-                        for i in range(d[0]) for j in range(d[1]) if self.in_board((i,j)) and env.get((i,j)) and env.get((i,j)).get_type()[1] == 'C' and env[(i,j)].get_owner_id() == player_id])
+            return sum([sum([p[0].color == env[(i,j)].color for p in board.get_neighbours(i,j).values() if isinstance(p[0], Piece)]) == n 
+                        for i in range(d[0]) for j in range(d[1]) if self.in_board((i,j)) and env.get((i,j)) and env.get((i,j)).res_city == 'C' and env[(i,j)].owner_id == player_id])
         
         player1, player2 = self.players
         
@@ -299,16 +429,17 @@ class GameStateDivercite(GameState):
     
     def check_divercite(self, pos, piece_color = None, board: BoardDivercite = None) -> bool:
         """
-        Check if a given position has won a divercite.
+        Check if a given position has won a divercite, from the color mask of the position.
 
         Args:
             pos: The position to check.
+            piece_color (str, optional): Color of a resource to consider as placed around the position.
+            board (BoardDivercite, optional): The board to check, the board of the state by default.
 
         Returns:
             bool: True if the position has won a divercite, False otherwise.
         """
-        neighbors = self.get_neighbours(pos[0], pos[1]) if not board else board.get_neighbours(pos[0], pos[1])
-        return len(set([n[0].get_type()[0] for n in neighbors.values() if isinstance(n[0], Piece)]).union(set([piece_color]) if piece_color else {})) == 4
+        return (board or self.get_rep()).is_divercite(pos, piece_color)
     
     
     def __str__(self) -> str:
@@ -317,7 +448,58 @@ class GameStateDivercite(GameState):
         return "The game is finished!"
 
     def to_json(self) -> str:
-        return { i:j for i,j in self.__dict__.items() if i!="_possible_light_actions" and i!="_possible_heavy_actions"}
+        return { i:j for i,j in self.__dict__.items() if i!="_possible_light_actions" and i!="_possible_heavy_actions" and i!="_undo_stack"}
+
+    def to_delta_json(self, previous_state: "GameStateDivercite") -> dict:
+        """
+        Converts the state to a JSON delta against the previous state of the game: the placed piece,
+        the score changes and the piece removed from the stock.
+
+        Args:
+            previous_state (GameStateDivercite): The state this one was reached from by a single move.
+
+        Returns:
+            dict: The JSON delta, to be applied with `apply_json_delta`.
+        """
+        previous_env = previous_state.get_rep().get_env()
+        for pos, piece in self.get_rep().get_env().items():
+            if pos not in previous_env:
+                break
+        else:
+            raise ValueError("The states are not separated by a single move.")
+        return {
+            "kind": "delta",
+            "step": self.step,
+            "position": pos,
+            "piece": piece.to_json(),
+            "scores": {player_id: score - previous_state.scores[player_id] for player_id, score in self.scores.items()
+                       if score != previous_state.scores[player_id]},
+            "next_player_id": self.next_player.get_id(),
+        }
+
+    @staticmethod
+    def apply_json_delta(state_json: dict, delta: dict) -> dict:
+        """
+        Rebuild the JSON of a state from the JSON of the previous state and a delta, as the GUI does.
+
+        Args:
+            state_json (dict): The JSON of the previous state (as decoded from a message or a record).
+            delta (dict): The delta produced by `to_delta_json`.
+
+        Returns:
+            dict: The JSON of the new state, `state_json` is left untouched.
+        """
+        piece = delta["piece"]
+        owner_id = str(piece["owner_id"])
+        env = {**state_json["rep"]["env"], str(tuple(delta["position"])): piece}
+        scores = {player_id: score + delta["scores"].get(player_id, 0) for player_id, score in state_json["scores"].items()}
+        pieces_left = {player_id: dict(pieces) for player_id, pieces in state_json["players_pieces_left"].items()}
+        pieces_left[owner_id][piece["piece_type"][:2]] -= 1
+        # Remote players are serialized as their bare id
+        next_player = next(player for player in state_json["players"]
+                           if str(player["id"] if isinstance(player, dict) else player) == str(delta["next_player_id"]))
+        return {**state_json, "rep": {**state_json["rep"], "env": env}, "scores": scores, "step": delta["step"],
+                "players_pieces_left": pieces_left, "next_player": next_player}
 
     @classmethod
     def from_json(cls,data:str,*,next_player:Optional[PlayerDivercite]=None) -> Serializable:
@@ -0,0 +1,160 @@
+import argparse
+import random
+from typing import Dict, List, Optional, Tuple
+
+COLORS = ["R","G","B","Y"] # Red, Green, Blue, Yellow
+CITY_RESOURCE_TYPES = ["C","R"] # City, Resource
+
+# The standard game : a diamond of side 5 in a 9x9 grid, 3 resources and 2 cities of each color per player
+STANDARD_SIZE = 9
+
+
+class BoardGeometry:
+    """
+    Shape of a diamond board of odd size n: the cells at Manhattan distance at most n // 2 from the center,
+    resources and cities alternating with resources on the tips. Every table the engine uses in its fast paths
+    is precomputed here once per size, geometries are interned and must be obtained through `BoardGeometry.get`.
+
+    Attributes:
+        size (int): Number of rows and columns of the grid.
+        forbidden_mask (List[List[bool]]): True for the cells of the grid outside the board.
+        board_mask (List[List[int|str]]): 'C' for the city cells, 'R' for the resource cells, 0 outside the board.
+        positions (Dict[str, List[Tuple[int, int]]]): The city ("C") and resource ("R") cells, in row-major order.
+        city_resources (Dict[Tuple[int, int], Tuple[Tuple[int, int], ...]]): The resource cells around each city cell.
+        resource_cities (Dict[Tuple[int, int], Tuple[Tuple[int, int], ...]]): The city cells around each resource cell.
+        city_neighbours (Dict[Tuple[int, int], Tuple[Tuple[int, int], ...]]): The city cells with four resource
+            neighbours (others can never divercite), with their neighbours.
+        zobrist_table (Dict[Tuple[Tuple[int, int], str], int]): One random 64 bits value per (cell, piece type),
+            seeded so keys are identical across processes.
+    """
+
+    _instances: Dict[int, "BoardGeometry"] = {}
+
+    def __init__(self, size: int) -> None:
+        if size < 3 or size % 2 == 0:
+            raise ValueError(f"The board size must be odd and at least 3, got {size}.")
+        self.size = size
+        center = size // 2
+        self.forbidden_mask = [[abs(i - center) + abs(j - center) > center for j in range(size)] for i in range(size)]
+        self.board_mask = [[0 if self.forbidden_mask[i][j] else ('C' if (i + j + center) % 2 else 'R') for j in range(size)]
+                           for i in range(size)]
+        self.positions = {res_city: [(i, j) for i in range(size) for j in range(size) if self.board_mask[i][j] == res_city]
+                          for res_city in CITY_RESOURCE_TYPES}
+        self.city_resources = {
+            (i, j): tuple((a, b) for a, b in ((i-1, j), (i, j-1), (i, j+1), (i+1, j))
+                          if 0 <= a < size and 0 <= b < size and not self.forbidden_mask[a][b])
+            for i, j in self.positions["C"]
+        }
+        resource_cities: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        for city, resources in self.city_resources.items():
+            for pos in resources:
+                resource_cities.setdefault(pos, []).append(city)
+        self.resource_cities = {pos: tuple(cities) for pos, cities in resource_cities.items()}
+        self.city_neighbours = {city: resources for city, resources in self.city_resources.items() if len(resources) == 4}
+        rng = random.Random(0xD1CE)
+        self.zobrist_table = {((i, j), color+res_city+owner): rng.getrandbits(64)
+                              for i in range(size) for j in range(size)
+                              for color in "RGBY" for res_city in "CR" for owner in "WB"}
+
+    @classmethod
+    def get(cls, size: int) -> "BoardGeometry":
+        """
+        Returns the geometry of a board size, built on first use.
+
+        Args:
+            size (int): Number of rows and columns of the grid.
+
+        Returns:
+            BoardGeometry: The geometry.
+        """
+        geometry = cls._instances.get(size)
+        if geometry is None:
+            geometry = cls._instances[size] = cls(size)
+        return geometry
+
+    def __reduce__(self):
+        # Boards sent to other processes carry their size only, the tables are rebuilt there once
+        return BoardGeometry.get, (self.size,)
+
+
+class Variant:
+    """
+    Rules of a game: the board geometry, the stock of pieces of each player and the number of steps.
+    Without explicit counts, the stock is the largest one the board can hold: every city cell and all
+    the resource cells but one get filled, as in the standard game.
+
+    Attributes:
+        geometry (BoardGeometry): The board.
+        n_resource_pieces (int): Resources of each color per player.
+        n_city_pieces (int): Cities of each color per player.
+        max_step (int): Number of steps of a game.
+    """
+
+    def __init__(self, size: int = STANDARD_SIZE, n_resource_pieces: Optional[int] = None, n_city_pieces: Optional[int] = None,
+                 max_step: Optional[int] = None) -> None:
+        self.geometry = BoardGeometry.get(size)
+        n_stock_types = 2 * len(COLORS)
+        max_resources = (len(self.geometry.positions["R"]) - 1) // n_stock_types
+        max_cities = len(self.geometry.positions["C"]) // n_stock_types
+        self.n_resource_pieces = max_resources if n_resource_pieces is None else n_resource_pieces
+        self.n_city_pieces = max_cities if n_city_pieces is None else n_city_pieces
+        if not 0 <= self.n_resource_pieces * n_stock_types <= len(self.geometry.positions["R"]):
+            raise ValueError(f"A {size}x{size} board holds at most {len(self.geometry.positions['R']) // n_stock_types} "
+                             f"resources of each color per player.")
+        if not 0 <= self.n_city_pieces * n_stock_types <= len(self.geometry.positions["C"]):
+            raise ValueError(f"A {size}x{size} board holds at most {max_cities} cities of each color per player.")
+        n_pieces = n_stock_types * (self.n_resource_pieces + self.n_city_pieces)
+        self.max_step = n_pieces if max_step is None else max_step
+        if not 0 < self.max_step <= n_pieces:
+            raise ValueError(f"The number of steps must be between 1 and the {n_pieces} pieces of the stock.")
+
+    @property
+    def size(self) -> int:
+        return self.geometry.size
+
+    def __reduce__(self):
+        return Variant, (self.size, self.n_resource_pieces, self.n_city_pieces, self.max_step)
+
+    def initial_stock(self) -> Dict[str, int]:
+        """
+        Returns the pieces of a player at the start of a game, by color and city/resource letters.
+        """
+        return {c+t: (self.n_resource_pieces if t == "R" else self.n_city_pieces) for c in COLORS for t in CITY_RESOURCE_TYPES}
+
+    def to_json(self) -> dict:
+        return {"size": self.size, "n_resource_pieces": self.n_resource_pieces, "n_city_pieces": self.n_city_pieces,
+                "max_step": self.max_step}
+
+    @classmethod
+    def from_json(cls, data: Optional[dict]) -> "Variant":
+        """
+        Returns the variant of a game record. The records written before the variants existed hold none,
+        they are standard games.
+
+        Args:
+            data (Optional[dict]): The variant as in `to_json`, or None.
+
+        Returns:
+            Variant: The variant.
+        """
+        return cls() if data is None else cls(**data)
+
+    def is_standard(self) -> bool:
+        return self.to_json() == Variant().to_json()
+
+
+def add_variant_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the options selecting the variant to a command line parser, read back with `variant_from_arguments`.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser.
+    """
+    parser.add_argument("--size",type=int,default=STANDARD_SIZE,help="Size of the diamond board, an odd number.\n\n")
+    parser.add_argument("--resource-pieces",type=int,default=None,help="Resources of each color per player, as many as the board holds by default.\n\n")
+    parser.add_argument("--city-pieces",type=int,default=None,help="Cities of each color per player, as many as the board holds by default.\n\n")
+    parser.add_argument("--max-step",type=int,default=None,help="Number of steps of a game, until the stock is empty by default.\n\n")
+
+
+def variant_from_arguments(args: argparse.Namespace) -> Variant:
+    return Variant(args.size, args.resource_pieces, args.city_pieces, args.max_step)
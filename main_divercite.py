@@ -4,51 +4,55 @@ import os
 from os.path import basename, splitext, dirname
 import sys
 
-from board_divercite import BoardDivercite
 from player_divercite import PlayerDivercite
 from master_divercite import MasterDivercite
 from game_state_divercite import GameStateDivercite
+from arena_divercite import create_initial_state
+from geometry_divercite import STANDARD_SIZE, add_variant_arguments, variant_from_arguments
+from remote_divercite import CompactLocalPlayerProxy, CompactRemotePlayerProxy
+from writer_divercite import FSYNC_POLICIES, default_writer
 
 from seahorse.player.proxies import InteractivePlayerProxy, LocalPlayerProxy, RemotePlayerProxy
-from seahorse.utils.gui_client import GUIClient
-from seahorse.utils.recorders import StateRecorder
-from seahorse.game.game_layout.board import Piece
 from seahorse.utils.custom_exceptions import PlayerDuplicateError
 
 from loguru import logger
 from argparse import RawTextHelpFormatter
 
-def play(player1, player2, log_level, port, address, gui, record, gui_path) :
+def play(player1, player2, log_level, port, address, gui, record, gui_path, ascii_board=False, variant=None) :
 
     time_limit = 60*15
     list_players = [player1, player2]
-    init_scores = {player1.get_id(): 0, player2.get_id(): 0}
-    dim = [9, 9]
-    env = {}
-    n_resource_pieces_per_color = 3
-    n_city_pieces_per_color = 2
-    colors = ["R","G","B","Y"] # Red, Green, Blue, Yellow
-    city_resource_types = ["C","R"] # City, Resource
-    players_pieces_left = {player.get_id() : {c+t: (n_resource_pieces_per_color if t == "R" else n_city_pieces_per_color) 
-                            for c in colors for t in city_resource_types} for player in list_players}
-    
-    init_rep = BoardDivercite(env=env, dim=dim)
-    initial_game_state = GameStateDivercite(
-        scores=init_scores, next_player=player1, players=list_players, rep=init_rep, step=0, players_pieces_left=players_pieces_left)
+    initial_game_state = create_initial_state(player1, player2, variant)
     try:
         master = MasterDivercite(
             name="Divercite", initial_game_state=initial_game_state, players_iterator=list_players, log_level=log_level, port=port,
-            hostname=address, time_limit=time_limit
+            hostname=address, time_limit=time_limit, colored_board=False if ascii_board else None
         )
     except PlayerDuplicateError:
         return
 
-    listeners = [GUIClient(path=gui_path)]*gui
+    # The GUI and recorder modules are only imported when they are used
+    listeners = []
+    if gui and variant is not None and variant.size != STANDARD_SIZE :
+        logger.warning('The GUI only draws the standard board, it is disabled for this variant')
+        gui = 0
+    if gui :
+        from seahorse.utils.gui_client import GUIClient
+        listeners = [GUIClient(path=gui_path)]*gui
     if record :
-        listeners.append(StateRecorder())
+        from recorder_divercite import StreamingStateRecorder
+        listeners.append(StreamingStateRecorder())
 
     master.record_game(listeners=listeners)
 
+def enable_pondering(player, ponder) :
+    if not ponder :
+        return
+    if hasattr(player, "start_pondering") :
+        player.ponder = True
+    else :
+        logger.warning(f'{player.get_name()} does not support pondering, --ponder is ignored')
+
 
 if __name__=="__main__":
 
@@ -78,7 +82,12 @@ if __name__=="__main__":
     parser.add_argument("-p","--port",required=False,type=int, default=16001, help="The port of the machine that hosts the GameMaster.\n\n")
     parser.add_argument("-g","--no-gui",action='store_false',default=True, help="Headless mode\n\n")
     parser.add_argument("-r","--record",action="store_true",default=False, help="Stores the succesive game states in a json file.\n\n")
-    parser.add_argument("-l","--log",required=False,choices=["DEBUG","INFO"], default="DEBUG",help="\nSets the logging level.")
+    parser.add_argument("--fsync",choices=FSYNC_POLICIES,default="never", help="When the recorded game is synced to disk.\n\n")
+    parser.add_argument("--ponder",action="store_true",default=False, help="Lets the local player search on the opponent's time (host_game and connect modes).\n\n")
+    parser.add_argument("--compact",action="store_true",default=False, help="Sends only the moves after the first state and logs the round trips (host_game and connect modes,\nboth sides must use it).\n\n")
+    parser.add_argument("--ascii",action="store_true",default=False, help="Logs the board in plain ASCII, the default when the log is not a terminal.\n\n")
+    add_variant_arguments(parser)
+    parser.add_argument("-l","--log",required=False,choices=["DEBUG","INFO","WARNING"], default="DEBUG",help="\nSets the logging level, WARNING logs the result only and\nskips drawing the board of every ply.")
     parser.add_argument("players_list",nargs="*", help='The players')
 
     args=parser.parse_args()
@@ -89,7 +98,16 @@ if __name__=="__main__":
     gui = vars(args).get("no_gui")
     record = vars(args).get("record")
     log_level = vars(args).get("log")
+    ascii_board = vars(args).get("ascii")
+    ponder = vars(args).get("ponder")
+    compact = vars(args).get("compact")
+    if record :
+        default_writer().fsync = vars(args).get("fsync")
     list_players = vars(args).get("players_list")
+    try :
+        variant = variant_from_arguments(args)
+    except ValueError as e :
+        parser.error(str(e))
 
     
 
@@ -104,22 +122,28 @@ if __name__=="__main__":
         player2_class = __import__(splitext(basename(list_players[1]))[0], fromlist=[None])
         player1 = player1_class.MyPlayer("W", name=splitext(basename(list_players[0]))[0]+"_1")
         player2 = player2_class.MyPlayer("B", name=splitext(basename(list_players[1]))[0]+"_2")
-        play(player1=player1, player2=player2, log_level=log_level, port=port, address=address, gui=gui, record=record, gui_path=gui_path)
+        play(player1=player1, player2=player2, log_level=log_level, port=port, address=address, gui=gui, record=record, gui_path=gui_path, ascii_board=ascii_board, variant=variant)
     elif type == "host_game" :
         folder = dirname(list_players[0])
         sys.path.append(folder)
         player1_class = __import__(splitext(basename(list_players[0]))[0], fromlist=[None])
-        player1 = LocalPlayerProxy(player1_class.MyPlayer("W", name=splitext(basename(list_players[0]))[0]+"_local"),gs=GameStateDivercite)
-        player2 = RemotePlayerProxy(mimics=PlayerDivercite,piece_type="B",name="_remote")
+        local_player = player1_class.MyPlayer("W", name=splitext(basename(list_players[0]))[0]+"_local")
+        enable_pondering(local_player, ponder)
+        player1 = LocalPlayerProxy(local_player,gs=GameStateDivercite)
+        remote_proxy = CompactRemotePlayerProxy if compact else RemotePlayerProxy
+        player2 = remote_proxy(mimics=PlayerDivercite,piece_type="B",name="_remote")
         if address=='localhost':
             logger.warning('Using `localhost` with `host_game` mode, if both players are on different machines')
             logger.warning('use ipconfig/ifconfig to get your external ip and specity the ip with -a')
-        play(player1=player1, player2=player2, log_level=log_level, port=port, address=address, gui=0, record=record, gui_path=gui_path)
+        play(player1=player1, player2=player2, log_level=log_level, port=port, address=address, gui=0, record=record, gui_path=gui_path, ascii_board=ascii_board, variant=variant)
     elif type == "connect" :
         folder = dirname(list_players[0])
         sys.path.append(folder)
         player2_class = __import__(splitext(basename(list_players[0]))[0], fromlist=[None])
-        player2 = LocalPlayerProxy(player2_class.MyPlayer("B", name="_remote"),gs=GameStateDivercite)
+        local_player = player2_class.MyPlayer("B", name="_remote")
+        enable_pondering(local_player, ponder)
+        local_proxy = CompactLocalPlayerProxy if compact else LocalPlayerProxy
+        player2 = local_proxy(local_player,gs=GameStateDivercite)
         if address=='localhost':
             logger.warning('Using `localhost` with `connect` mode, if both players are on different machines')
             logger.warning('use ipconfig/ifconfig to get your external ip and specity the ip with -a')
@@ -130,10 +154,10 @@ if __name__=="__main__":
         player1_class = __import__(splitext(basename(list_players[0]))[0], fromlist=[None])
         player1 = InteractivePlayerProxy(PlayerDivercite("W", name="bob"),gui_path=gui_path,gs=GameStateDivercite)
         player2 = LocalPlayerProxy(player1_class.MyPlayer("B", name=splitext(basename(list_players[0]))[0]),gs=GameStateDivercite)
-        play(player1=player1, player2=player2, log_level=log_level, port=port, address=address, gui=False, record=record, gui_path=gui_path)
+        play(player1=player1, player2=player2, log_level=log_level, port=port, address=address, gui=False, record=record, gui_path=gui_path, ascii_board=ascii_board, variant=variant)
     elif type == "human_vs_human" :
         player1 = InteractivePlayerProxy(PlayerDivercite("W", name="bob"),gui_path=gui_path,gs=GameStateDivercite)
         player2 = InteractivePlayerProxy(PlayerDivercite("B", name="alice"))
         player2.share_sid(player1)
-        play(player1=player1, player2=player2, log_level=log_level, port=port, address=address, gui=False, record=record, gui_path=gui_path)
+        play(player1=player1, player2=player2, log_level=log_level, port=port, address=address, gui=False, record=record, gui_path=gui_path, ascii_board=ascii_board, variant=variant)
         
@@ -1,9 +1,16 @@
-from typing import Dict, Iterable, List
+import json
+import sys
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
 
 from seahorse.game.game_state import GameState
+from seahorse.game.io_stream import EventSlave
 from seahorse.game.master import GameMaster
 from seahorse.player.player import Player
 
+from board_divercite import BOARD_RENDERING
+
 
 class MasterDivercite(GameMaster):
     """
@@ -16,11 +23,29 @@ class MasterDivercite(GameMaster):
         players_iterator (Iterable): An iterable for the players_iterator, ordered according to the playing order.
             If a list is provided, a cyclic iterator is automatically built
         log_level (str): Name of the log file
+        keyframe_interval (int): Number of plies between two full states broadcast to the listeners,
+            the plies in between are broadcast as deltas
+        colored_board (bool): Log the board with colors, or in plain ASCII
     """
 
-    def __init__(self, name: str, initial_game_state: GameState, players_iterator: Iterable[Player], log_level: str, port: int = 8080, hostname: str = "localhost", time_limit: int = 60*15) -> None:
+    def __init__(self, name: str, initial_game_state: GameState, players_iterator: Iterable[Player], log_level: str, port: int = 8080, hostname: str = "localhost", time_limit: int = 60*15,
+                 keyframe_interval: int = 10, colored_board: Optional[bool] = None) -> None:
         super().__init__(name, initial_game_state, players_iterator, log_level, port, hostname, time_limit)
-        
+        self.keyframe_interval = keyframe_interval
+        # Escape sequences only make sense on a terminal, a redirected log gets the ASCII board
+        self.colored_board = sys.stderr.isatty() if colored_board is None else colored_board
+        self.last_emitted_state = None
+        self.listeners = []
+        self.winner = None
+        # The log is written by loguru's background thread, a slow terminal or log file does not delay the moves
+        logger.remove()
+        logger.add(sys.stderr, level=log_level, enqueue=True)
+
+        # A listener gets the answer after the states broadcast before its call, see disconnect_listeners
+        @self.emitter.sio.on("listener_sync")
+        async def listener_sync(sid, data=None):
+            return True
+
     def compute_winner(self, scores: Dict[int, float]) -> List[Player]:
         """
         Computes the winners of the game based on the scores.
@@ -35,3 +60,83 @@ class MasterDivercite(GameMaster):
         players_id = list(filter(lambda key: scores[key] == max_val, scores))
         itera = list(filter(lambda x: x.get_id() in players_id, self.players))
         return itera
+
+    def state_payload(self) -> dict:
+        """
+        Builds the "play" payload of the current state: a full state (keyframe) every `keyframe_interval` plies
+        and on the first emission, a delta against the previously emitted state otherwise.
+
+        Returns:
+            dict: The payload to broadcast.
+        """
+        state = self.current_game_state
+        previous = self.last_emitted_state
+        self.last_emitted_state = state
+        if previous is None or state.get_step() % self.keyframe_interval == 0 or state.get_step() != previous.get_step() + 1:
+            return {**state.to_json(), "kind": "keyframe"}
+        return state.to_delta_json(previous)
+
+    def record_game(self, listeners: Optional[List[EventSlave]] = None) -> None:
+        """
+        Plays the game with the listeners connected, then closes the game master.
+
+        Args:
+            listeners (Optional[List[EventSlave]]): The listeners of the game (recorders, interface).
+        """
+        self.listeners = listeners or []
+        try:
+            super().record_game(self.listeners)
+        except OSError:
+            # Seahorse cancels every task left once the game is over, a socket closed during the cancellation
+            # ends with an OSError: the game itself is played
+            if self.winner is None:
+                raise
+
+    async def play_game(self) -> List[Player]:
+        """
+        Play the game, broadcasting the successive states as keyframes and deltas, then disconnect the listeners.
+
+        Returns:
+            Iterable[Player]: The winner(s) of the game.
+        """
+        sio = self.emitter.sio
+        emit = sio.emit
+
+        async def emit_play(event, data=None, *args, **kwargs):
+            # The "play" broadcasts of the seahorse game loop carry the keyframes and deltas of `state_payload`
+            if event == "play":
+                data = json.dumps(self.state_payload(), default=lambda x:x.to_json())
+            return await emit(event, data, *args, **kwargs)
+
+        sio.emit = emit_play
+        # Seahorse logs the board of every ply in an f-string, it is drawn only when the INFO level is logged
+        rendering = BOARD_RENDERING.set(self.colored_board if self.logs_level("INFO") else None)
+        try:
+            return await super().play_game()
+        finally:
+            BOARD_RENDERING.reset(rendering)
+            del sio.emit
+            await self.disconnect_listeners()
+
+    def logs_level(self, level: str) -> bool:
+        """
+        Tells if the master's log emits the messages of a level.
+
+        Args:
+            level (str): The name of the level, e.g. "INFO".
+
+        Returns:
+            bool: True if the messages of the level are logged.
+        """
+        return logger.level(level).no >= logger.level(self.log_level).no
+
+    async def disconnect_listeners(self) -> None:
+        """
+        Disconnects the listeners running in this process before seahorse cancels the remaining tasks,
+        so that they close their sockets and the recorders write their files. Each listener first waits for the
+        answer to a "listener_sync" call, which comes after the states already broadcast.
+        """
+        for listener in self.listeners:
+            if isinstance(listener, EventSlave) and listener.sio.connected:
+                await listener.sio.call("listener_sync", timeout=10)
+                await listener.sio.disconnect()
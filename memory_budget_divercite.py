@@ -0,0 +1,118 @@
+import os
+import tracemalloc
+from typing import Optional
+
+# Environment variables enabling the memory-bounded search in every player process of a host
+MAX_LIVE_STATES_VARIABLE = "DIVERCITE_MAX_LIVE_STATES"
+MAX_TABLE_SIZE_VARIABLE = "DIVERCITE_MAX_TABLE_SIZE"
+MAX_MEMORY_VARIABLE = "DIVERCITE_MAX_MEMORY_MB"
+
+# Smallest size the tables are shrunk to under memory pressure
+MIN_TABLE_SIZE = 1 << 10
+
+
+class MemoryBudgetExceeded(Exception):
+    """
+    Raised by a search that would go over its memory budget, the player falls back to its last completed depth.
+
+    Attributes:
+        kind (str): "states" when the cap on live states is reached, "memory" when the traced memory is.
+    """
+
+    def __init__(self, kind: str) -> None:
+        super().__init__(f"Memory budget exceeded ({kind})")
+        self.kind = kind
+
+
+class MemoryBudget:
+    """
+    Memory budgets of a search player: a cap on the child states kept alive along the search path,
+    a maximum size for its tables and a watchdog sampling the memory traced by tracemalloc.
+    Every budget left to None is not enforced. Tracing slows down every allocation of the process, so a budget
+    that starts it only traces its searches.
+
+    Attributes:
+        max_live_states (Optional[int]): Maximum number of child states alive at once.
+        max_table_size (Optional[int]): Maximum number of entries of the player's tables.
+        max_memory (Optional[int]): Maximum memory traced by tracemalloc during a search, in bytes.
+        sample_interval (int): Number of nodes between two samples of the traced memory.
+        live_states (int): Number of child states currently alive.
+    """
+
+    def __init__(self, max_live_states: Optional[int] = None, max_table_size: Optional[int] = None,
+                 max_memory_mb: Optional[float] = None, sample_interval: int = 256) -> None:
+        self.max_live_states = max_live_states
+        self.max_table_size = max_table_size
+        self.max_memory = int(max_memory_mb * (1 << 20)) if max_memory_mb is not None else None
+        self.sample_interval = sample_interval
+        self.live_states = 0
+        self.nodes = 0
+        self.started_tracing = False
+
+    @classmethod
+    def from_environment(cls) -> Optional["MemoryBudget"]:
+        """
+        Build the budget set by the DIVERCITE_MAX_LIVE_STATES, DIVERCITE_MAX_TABLE_SIZE and DIVERCITE_MAX_MEMORY_MB
+        environment variables.
+
+        Returns:
+            Optional[MemoryBudget]: The budget, None when none of the variables is set.
+        """
+        max_live_states = os.environ.get(MAX_LIVE_STATES_VARIABLE)
+        max_table_size = os.environ.get(MAX_TABLE_SIZE_VARIABLE)
+        max_memory_mb = os.environ.get(MAX_MEMORY_VARIABLE)
+        if max_live_states is None and max_table_size is None and max_memory_mb is None:
+            return None
+        return cls(int(max_live_states) if max_live_states else None, int(max_table_size) if max_table_size else None,
+                   float(max_memory_mb) if max_memory_mb else None)
+
+    def start(self) -> None:
+        """
+        Start a search: the live states are counted from zero, and memory tracing is started if needed.
+        """
+        self.live_states = 0
+        self.nodes = 0
+        if self.max_memory is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def stop(self) -> None:
+        """
+        End a search: memory tracing is stopped if `start` started it.
+        """
+        if self.started_tracing:
+            self.started_tracing = False
+            tracemalloc.stop()
+
+    def acquire(self, n_states: int) -> None:
+        """
+        Account for the children of a node, kept alive until the node returns.
+
+        Args:
+            n_states (int): Number of child states.
+
+        Raises:
+            MemoryBudgetExceeded: When the live states or the traced memory go over their budget.
+        """
+        self.live_states += n_states
+        self.nodes += 1
+        if self.max_live_states is not None and self.live_states > self.max_live_states:
+            raise MemoryBudgetExceeded("states")
+        if self.max_memory is not None and self.nodes % self.sample_interval == 0 and tracemalloc.is_tracing():
+            if tracemalloc.get_traced_memory()[0] > self.max_memory:
+                raise MemoryBudgetExceeded("memory")
+
+    def release(self, n_states: int) -> None:
+        self.live_states -= n_states
+
+    def table_size(self, default: int) -> int:
+        """
+        Returns the size of a table within the budget.
+
+        Args:
+            default (int): The size the table has without budget.
+
+        Returns:
+            int: The allowed size.
+        """
+        return default if self.max_table_size is None else min(default, self.max_table_size)
@@ -0,0 +1,358 @@
+import argparse
+import asyncio
+import functools
+import json
+from argparse import RawTextHelpFormatter
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from arena_divercite import compute_winner, create_initial_state, find_played_move, load_player_module, player_name
+from game_state_divercite import GameStateDivercite
+from geometry_divercite import Variant
+from player_divercite import PlayerDivercite
+from seahorse.game.light_action import LightAction
+from writer_divercite import FSYNC_POLICIES, default_writer
+
+PIECE_TYPES = ["W", "B"]
+
+# Messages are JSON objects, one per line, every message but "error" carries the id of the game it belongs to:
+#  client -> host : {"type": "join", "game_id", "name"}
+#                   {"type": "action", "game_id", "piece", "position"}
+#                   {"type": "resign", "game_id", "message"}                     the player could not play its turn
+#  host -> client : {"type": "joined", "game_id", "seat", "piece_type", "time_limit"}
+#                   {"type": "turn", "game_id", "last_move", "remaining_time"}
+#                   {"type": "done", "game_id", "scores", "winner", "termination"}
+#                   {"type": "error", "game_id", "message"}
+
+
+class Resignation(Exception):
+    """
+    Raised when a player resigns the game it has to move in.
+    """
+
+
+def send(writer: asyncio.StreamWriter, message: dict) -> None:
+    if not writer.is_closing():
+        writer.write((json.dumps(message) + "\n").encode())
+
+
+class HostedGame:
+    """
+    A game of the multi-game host. Both seats are filled by remote connections, the game is refereed
+    and timed by the host.
+
+    Attributes:
+        game_id (str): Identifier of the game, used to route the messages of a shared connection.
+        time_limit (float): Time credit of each player, in seconds.
+        seats (List[Optional[asyncio.StreamWriter]]): The connection of the first and second player.
+        names (List[Optional[str]]): The names of the first and second player.
+    """
+
+    def __init__(self, game_id: str, time_limit: float) -> None:
+        self.game_id = game_id
+        self.time_limit = time_limit
+        self.seats: List[Optional[asyncio.StreamWriter]] = [None, None]
+        self.names: List[Optional[str]] = [None, None]
+        self.disconnected = [False, False]
+        self.resigned = [False, False]
+        self.to_move = None
+        self.pending_action: Optional[asyncio.Future] = None
+
+    def is_full(self) -> bool:
+        return None not in self.seats
+
+    def join(self, writer: asyncio.StreamWriter, name: str) -> int:
+        """
+        Seat a connection in the game, the first connection to join plays first.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection of the player.
+            name (str): The name of the player.
+
+        Returns:
+            int: The seat of the player (0 or 1).
+        """
+        if self.is_full():
+            raise ValueError(f"Game {self.game_id} already has two players.")
+        seat = self.seats.index(None)
+        self.seats[seat] = writer
+        self.names[seat] = name
+        return seat
+
+    def receive_action(self, writer: asyncio.StreamWriter, piece: str, position: List[int]) -> None:
+        if self.to_move is None or self.seats[self.to_move] is not writer or self.pending_action.done():
+            raise ValueError(f"It is not the turn of this connection in game {self.game_id}.")
+        self.pending_action.set_result((piece, tuple(position)))
+
+    def resign(self, writer: asyncio.StreamWriter, reason: str) -> None:
+        if writer not in self.seats:
+            raise ValueError(f"This connection does not play game {self.game_id}.")
+        seat = self.seats.index(writer)
+        logger.warning(f"{self.names[seat]} resigned game {self.game_id} : {reason}")
+        self.resigned[seat] = True
+        if self.to_move == seat and self.pending_action is not None and not self.pending_action.done():
+            self.pending_action.set_exception(Resignation(reason))
+
+    def leave(self, seat: int) -> None:
+        self.disconnected[seat] = True
+        if self.to_move == seat and self.pending_action is not None and not self.pending_action.done():
+            self.pending_action.set_exception(ConnectionError(f"{self.names[seat]} left game {self.game_id}."))
+
+    async def play(self) -> dict:
+        """
+        Referee the game: ask each player for its move in turn and time it against its own clock.
+        A player loses when its clock runs out, when it plays an illegal move, when it resigns or when it disconnects.
+
+        Returns:
+            dict: The game record, in the format of `arena_divercite.play_headless_game`.
+        """
+        loop = asyncio.get_running_loop()
+        players = [PlayerDivercite(piece_type, name=name) for piece_type, name in zip(PIECE_TYPES, self.names)]
+        current_state = create_initial_state(*players)
+        remaining_time = [self.time_limit, self.time_limit]
+        moves: List[Tuple[str, Tuple[int, int]]] = []
+        times: List[float] = []
+        termination = "done"
+        loser = None
+        last_move = None
+        while not current_state.is_done():
+            seat = players.index(current_state.get_next_player())
+            if self.disconnected[seat]:
+                termination, loser = "disconnect", seat
+                break
+            if self.resigned[seat]:
+                termination, loser = "resign", seat
+                break
+            self.to_move = seat
+            self.pending_action = loop.create_future()
+            send(self.seats[seat], {"type": "turn", "game_id": self.game_id, "last_move": last_move,
+                                    "remaining_time": remaining_time[seat]})
+            start = loop.time()
+            try:
+                piece, position = await asyncio.wait_for(self.pending_action, timeout=remaining_time[seat])
+            except asyncio.TimeoutError:
+                termination, loser = "timeout", seat
+                break
+            except ConnectionError:
+                termination, loser = "disconnect", seat
+                break
+            except Resignation:
+                termination, loser = "resign", seat
+                break
+            elapsed = loop.time() - start
+            remaining_time[seat] -= elapsed
+            times.append(elapsed)
+            light_action = LightAction({"piece": piece, "position": position})
+            if light_action not in current_state.get_possible_light_actions():
+                termination, loser = "illegal", seat
+                break
+            moves.append((piece, position))
+            last_move = [piece, position]
+            current_state = current_state.apply_action(light_action)
+        self.to_move = None
+
+        scores = [current_state.scores[player.get_id()] for player in players]
+        record = {
+            "players": list(self.names),
+            "moves": moves,
+            "times": times,
+            "scores": scores,
+            "winner": compute_winner(scores, loser),
+            "termination": termination,
+            "variant": Variant().to_json(),
+        }
+        for writer in self.seats:
+            send(writer, {"type": "done", "game_id": self.game_id, "scores": scores, "winner": record["winner"],
+                          "termination": termination})
+        return record
+
+
+class MultiGameHost:
+    """
+    Hosts many independent games concurrently in a single event loop. A connection may join several games,
+    its messages are routed by game id, and each game starts as soon as its two seats are taken.
+
+    Attributes:
+        time_limit (float): Time credit of each player per game, in seconds.
+        results_path (Optional[str]): JSON lines file the finished game records are appended to.
+        games (Dict[str, HostedGame]): The games being played or waiting for players, by game id.
+        records (Dict[str, dict]): The records of the finished games, by game id.
+    """
+
+    def __init__(self, time_limit: float = 60*15, results_path: Optional[str] = None) -> None:
+        self.time_limit = time_limit
+        self.results_path = results_path
+        self.games: Dict[str, HostedGame] = {}
+        self.records: Dict[str, dict] = {}
+        self.game_tasks = set()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        seats: List[Tuple[HostedGame, int]] = []
+        try:
+            while line := await reader.readline():
+                message = None
+                try:
+                    message = json.loads(line)
+                    game_id = str(message["game_id"])
+                    if message["type"] == "join":
+                        if game_id in self.records:
+                            raise ValueError(f"Game {game_id} is already over.")
+                        game = self.games.setdefault(game_id, HostedGame(game_id, self.time_limit))
+                        seat = game.join(writer, str(message.get("name", f"player_{len(seats)}")))
+                        seats.append((game, seat))
+                        send(writer, {"type": "joined", "game_id": game_id, "seat": seat, "piece_type": PIECE_TYPES[seat],
+                                      "time_limit": self.time_limit})
+                        logger.info(f"{game.names[seat]} joined game {game_id} as {PIECE_TYPES[seat]}")
+                        if game.is_full():
+                            game_task = asyncio.create_task(self.run_game(game))
+                            self.game_tasks.add(game_task)
+                            game_task.add_done_callback(self.game_tasks.discard)
+                    elif message["type"] == "action":
+                        if game_id not in self.games:
+                            raise ValueError(f"Unknown game {game_id}.")
+                        self.games[game_id].receive_action(writer, message["piece"], message["position"])
+                    elif message["type"] == "resign":
+                        if game_id not in self.games:
+                            raise ValueError(f"Unknown game {game_id}.")
+                        self.games[game_id].resign(writer, str(message.get("message")))
+                    else:
+                        raise ValueError(f"Unknown message type {message['type']}.")
+                except (ValueError, KeyError, TypeError) as e:
+                    send(writer, {"type": "error", "game_id": message.get("game_id") if isinstance(message, dict) else None,
+                                  "message": str(e)})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for game, seat in seats:
+                game.leave(seat)
+            writer.close()
+
+    async def run_game(self, game: HostedGame) -> None:
+        logger.info(f"Starting game {game.game_id} : {game.names[0]} vs {game.names[1]}")
+        record = await game.play()
+        record = {"type": "game", "game_id": game.game_id, "white": game.names[0], "black": game.names[1], **record}
+        del self.games[game.game_id]
+        self.records[game.game_id] = record
+        if self.results_path is not None:
+            default_writer().write(self.results_path, json.dumps(record) + "\n")
+        logger.info(f"Game {game.game_id} : {record['white']} vs {record['black']} -> "
+                    f"winner {record['winner']} ({record['termination']}), {len(self.games)} game(s) in progress")
+
+    async def serve(self, hostname: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle_connection, hostname, port)
+        logger.info(f"Hosting games on {hostname}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+class MultiGameClient:
+    """
+    Plays a local player in several games of a multi-game host over a single connection.
+    Each game has its own player instance and its own copy of the game state, kept up to date with the moves.
+
+    Attributes:
+        player_path (str): Path to the player module.
+        game_ids (List[str]): The games to join.
+        records (Dict[str, dict]): The results of the finished games, by game id.
+    """
+
+    def __init__(self, player_path: str, game_ids: List[str]) -> None:
+        self.player_path = player_path
+        self.game_ids = game_ids
+        self.players: Dict[str, PlayerDivercite] = {}
+        self.states: Dict[str, GameStateDivercite] = {}
+        self.records: Dict[str, dict] = {}
+
+    def start_game(self, game_id: str, seat: int) -> None:
+        name = f"{player_name(self.player_path)}_{game_id}"
+        local_player = load_player_module(self.player_path).MyPlayer(PIECE_TYPES[seat], name=name)
+        opponent = PlayerDivercite(PIECE_TYPES[1 - seat], name="_remote")
+        self.players[game_id] = local_player
+        self.states[game_id] = create_initial_state(*([local_player, opponent] if seat == 0 else [opponent, local_player]))
+
+    async def play_turn(self, writer: asyncio.StreamWriter, game_id: str, remaining_time: float) -> None:
+        current_state = self.states[game_id]
+        # The search runs in a thread so the connection keeps serving the other games
+        action = await asyncio.to_thread(self.players[game_id].compute_action, current_state=current_state,
+                                         remaining_time=remaining_time)
+        piece, position = find_played_move(current_state, action)
+        self.states[game_id] = current_state.apply_action(LightAction({"piece": piece, "position": position}))
+        send(writer, {"type": "action", "game_id": game_id, "piece": piece, "position": position})
+        await writer.drain()
+
+    def end_turn(self, writer: asyncio.StreamWriter, game_id: str, turn: asyncio.Task) -> None:
+        """
+        Done callback of a turn: a turn that failed resigns its game, instead of leaving the host waiting
+        for the move until the player's clock runs out.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection to the host.
+            game_id (str): The game of the turn.
+            turn (asyncio.Task): The finished turn.
+        """
+        if turn.cancelled() or turn.exception() is None:
+            return
+        logger.opt(exception=turn.exception()).error(f"Game {game_id} : the turn failed, resigning")
+        send(writer, {"type": "resign", "game_id": game_id, "message": repr(turn.exception())})
+
+    async def run(self, hostname: str, port: int) -> Dict[str, dict]:
+        reader, writer = await asyncio.open_connection(hostname, port)
+        for game_id in self.game_ids:
+            send(writer, {"type": "join", "game_id": game_id, "name": f"{player_name(self.player_path)}_{game_id}"})
+        await writer.drain()
+        turns = set()
+        while len(self.records) < len(self.game_ids) and (line := await reader.readline()):
+            message = json.loads(line)
+            game_id = message.get("game_id")
+            if message["type"] == "joined":
+                self.start_game(game_id, message["seat"])
+            elif message["type"] == "turn":
+                if message["last_move"] is not None:
+                    piece, position = message["last_move"]
+                    self.states[game_id] = self.states[game_id].apply_action(LightAction({"piece": piece, "position": tuple(position)}))
+                turn = asyncio.create_task(self.play_turn(writer, game_id, message["remaining_time"]))
+                turns.add(turn)
+                turn.add_done_callback(turns.discard)
+                turn.add_done_callback(functools.partial(self.end_turn, writer, game_id))
+            elif message["type"] == "done":
+                self.records[game_id] = message
+                logger.info(f"Game {game_id} over : scores {message['scores']}, winner {message['winner']} ({message['termination']})")
+            elif message["type"] == "error":
+                if game_id not in self.game_ids:
+                    # An error that is not about one of the games joined (e.g. a malformed message) ends none of them
+                    logger.error(f"Host error : {message['message']}")
+                    continue
+                logger.error(f"Game {game_id} : {message['message']}")
+                if game_id not in self.states:
+                    # The game could not be joined, it will never be played
+                    self.records[game_id] = message
+        writer.close()
+        return self.records
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser(
+                        prog="multi_host_divercite.py",
+                        description="Hosts many Divercite games concurrently in one process, or plays in some of them.",
+                        formatter_class=RawTextHelpFormatter)
+    parser.add_argument("-t","--type",required=True,choices=["host","connect"],
+                        help="\nThe execution mode you want.\n"
+                             +" - host: Referees every game joined by the connected players, each game starts when its two seats are taken.\n"
+                             +" - connect: Plays the given player in the games listed with -i, over a single connection.\n\n")
+    parser.add_argument("-a","--address",required=False,default="localhost",help="\nThe address of the machine that hosts the games.\n\n")
+    parser.add_argument("-p","--port",required=False,type=int,default=16001,help="The port of the machine that hosts the games.\n\n")
+    parser.add_argument("-i","--game-ids",nargs="+",default=[],help="The games to join (connect mode).\n\n")
+    parser.add_argument("--time-limit",type=float,default=60*15,help="Time credit of each player per game, in seconds (host mode).\n\n")
+    parser.add_argument("-o","--output",default=None,help="JSON lines file the finished games are appended to (host mode).\n\n")
+    parser.add_argument("--fsync",choices=FSYNC_POLICIES,default="never",help="When the results are synced to disk (host mode).\n\n")
+    parser.add_argument("players_list",nargs="*",help="The player (connect mode).")
+    args = parser.parse_args()
+
+    if args.type == "host":
+        default_writer().fsync = args.fsync
+        asyncio.run(MultiGameHost(args.time_limit, args.output).serve(args.address, args.port))
+    else:
+        asyncio.run(MultiGameClient(args.players_list[0], args.game_ids).run(args.address, args.port))
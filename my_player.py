@@ -4,6 +4,8 @@ from seahorse.game.game_state import GameState
 from game_state_divercite import GameStateDivercite
 from seahorse.utils.custom_exceptions import MethodNotImplementedError
 import hashlib
+from typing import Optional
+from selective_search_divercite import QUIESCENCE_NODES, ProbCut, probcut_path, quiescence, search_late_move
 
 class MyPlayer(PlayerDivercite):
     """
@@ -13,7 +15,7 @@ class MyPlayer(PlayerDivercite):
         piece_type (str): piece type of the player
     """
 
-    def __init__(self, piece_type: str, name: str = "MyPlayer"):
+    def __init__(self, piece_type: str, name: str = "MyPlayer", probcut: Optional[ProbCut] = None):
         """
         Initialize the PlayerDivercite instance.
 
@@ -21,8 +23,11 @@ class MyPlayer(PlayerDivercite):
             piece_type (str): Type of the player's game piece
             name (str, optional): Name of the player (default is "bob")
             time_limit (float, optional): the time limit in (s)
+            probcut (ProbCut, optional): ProbCut calibration (default is the calibration file next to this module)
         """
         super().__init__(piece_type, name)
+        # Without calibration file, ProbCut never cuts
+        self._probcut = probcut if probcut is not None else ProbCut.load(probcut_path(__file__))
 
     def compute_action(self, current_state: GameState, remaining_time: int = 1e9, **kwargs) -> Action:
         """
@@ -55,9 +60,16 @@ class MyPlayer(PlayerDivercite):
         return my_score - opponent_score
     
     def maxValue(self, current_state: GameState, alpha, beta, depth: int):
-        if depth == 0 or current_state.is_done():
+        if current_state.is_done():
             return self.calculate_heuristic(current_state), None
-        
+        if depth == 0:
+            # Quiescence: the pending divercites are resolved before evaluating
+            return quiescence(current_state, alpha, beta, True, self.calculate_heuristic, [QUIESCENCE_NODES]), None
+
+        # ProbCut: a shallow null-window search predicts when the full search fails high
+        if self._probcut.cuts(self.maxValue, current_state, alpha, beta, depth, True):
+            return beta, None
+
         v = -float('inf')
         m = None
         actions = current_state.generate_possible_heavy_actions()
@@ -68,16 +80,18 @@ class MyPlayer(PlayerDivercite):
             evaluated_actions.append((heuristic_value, action))
 
         evaluated_actions.sort(reverse=True, key=lambda x: x[0])
-    
-        # Choose the number of actions to evaluate
-        number_of_actions = len(evaluated_actions) // 3
-        if number_of_actions == 0:
-            number_of_actions = 1
-        top_actions = evaluated_actions[:number_of_actions]
 
-        for heuristic_value, action in top_actions:
+        for move_number, (heuristic_value, action) in enumerate(evaluated_actions):
             new_state = action.get_next_game_state()
-            new_v, new_m = self.minValue(new_state, alpha, beta, depth - 1)
+            if m is None:
+                # The first move is searched with the full window
+                new_v, new_m = self.minValue(new_state, alpha, beta, depth - 1)
+            else:
+                # Later moves have to prove with a reduced null-window search that they beat alpha
+                result = search_late_move(self.minValue, new_state, alpha, beta, depth, move_number, heuristic_value, True)
+                if result is None:
+                    break
+                new_v, new_m = result
             if new_v > v:
                 v = new_v
                 m = action
@@ -88,9 +102,14 @@ class MyPlayer(PlayerDivercite):
         return v, m
     
     def minValue(self, current_state: GameState, alpha, beta, depth: int):
-        if depth == 0 or current_state.is_done():
+        if current_state.is_done():
             return self.calculate_heuristic(current_state), None
-        
+        if depth == 0:
+            return quiescence(current_state, alpha, beta, False, self.calculate_heuristic, [QUIESCENCE_NODES]), None
+
+        if self._probcut.cuts(self.minValue, current_state, alpha, beta, depth, False):
+            return alpha, None
+
         v = float('inf')
         m = None
         actions = current_state.generate_possible_heavy_actions()
@@ -99,18 +118,18 @@ class MyPlayer(PlayerDivercite):
             new_state = action.get_next_game_state()
             heuristic_value = self.calculate_heuristic(new_state)
             evaluated_actions.append((heuristic_value, action))
-    
+
         evaluated_actions.sort(key=lambda x: x[0])
-    
-        # Choose the number of actions to evaluate
-        number_of_actions = len(evaluated_actions) // 3
-        if number_of_actions == 0:
-            number_of_actions = 1
-        top_actions = evaluated_actions[:number_of_actions]
 
-        for heuristic_value, action in top_actions:
+        for move_number, (heuristic_value, action) in enumerate(evaluated_actions):
             new_state = action.get_next_game_state()
-            new_v, new_m = self.maxValue(new_state, alpha, beta, depth - 1)
+            if m is None:
+                new_v, new_m = self.maxValue(new_state, alpha, beta, depth - 1)
+            else:
+                result = search_late_move(self.maxValue, new_state, alpha, beta, depth, move_number, heuristic_value, False)
+                if result is None:
+                    break
+                new_v, new_m = result
             if new_v < v:
                 v = new_v
                 m = action
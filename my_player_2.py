@@ -2,7 +2,17 @@ from player_divercite import PlayerDivercite
 from seahorse.game.action import Action
 from seahorse.game.game_state import GameState
 from game_state_divercite import GameStateDivercite
+from board_divercite import BoardDivercite
+from eval_cache_divercite import EvaluationCache
+from evaluation_weights_divercite import EvaluationWeights, evaluation_path
+from memory_budget_divercite import MIN_TABLE_SIZE, MemoryBudget, MemoryBudgetExceeded
 from seahorse.utils.custom_exceptions import MethodNotImplementedError
+from selective_search_divercite import NULL_WINDOW, QUIESCENCE_NODES, ProbCut, probcut_path, quiescence, search_late_move
+from collections import OrderedDict
+from functools import partial
+from typing import Iterator, List, Optional, Tuple
+import os
+import threading
 import time
 
 class MyPlayer(PlayerDivercite):
@@ -14,18 +24,59 @@ class MyPlayer(PlayerDivercite):
     """
     #python main_divercite.py -t local my_player_2.py my_player.py
 
-    def __init__(self, piece_type: str, name: str = "MyPlayer"):
+    def __init__(self, piece_type: str, name: str = "MyPlayer", ponder: bool = False, probcut: Optional[ProbCut] = None,
+                 memory_budget: Optional[MemoryBudget] = None, evaluation_weights: Optional[EvaluationWeights] = None,
+                 nnue_weights=None):
         """
         Initialize the PlayerDivercite instance.
 
         Args:
             piece_type (str): Type of the player's game piece
             name (str, optional): Name of the player (default is "bob")
-            time_limit (float, optional): the time limit in (s)
+            ponder (bool, optional): Keep searching on the opponent's time (default is False)
+            probcut (ProbCut, optional): ProbCut calibration (default is the calibration file next to this module)
+            memory_budget (MemoryBudget, optional): Memory budgets of the search (default is set by the environment,
+                unbounded otherwise)
+            evaluation_weights (EvaluationWeights, optional): Weights of the heuristic (default is the tuned weights
+                file next to this module, the hand-picked weights otherwise)
+            nnue_weights (nnue_divercite.EvaluatorWeights, optional): Weights of the incremental evaluator, searched
+                with instead of the heuristic by `alphaBetaSearch` (default is set by the DIVERCITE_NNUE_WEIGHTS
+                environment variable, the heuristic otherwise)
         """
         super().__init__(piece_type, name)
+        # Sans fichier de calibration, ProbCut ne coupe jamais
+        self._probcut = probcut if probcut is not None else ProbCut.load(probcut_path(__file__))
+        # Poids de l'heuristique, ajustés par tuning_divercite.py
+        self._evaluation_weights = evaluation_weights if evaluation_weights is not None else EvaluationWeights.load(evaluation_path(__file__))
+        self._score_weight = self._evaluation_weights.score_weight
+        self._index_scores = self._evaluation_weights.index_scores
+        # Recherche bornée en mémoire : au dépassement, on garde la dernière profondeur complétée
+        self._memory_budget = memory_budget if memory_budget is not None else MemoryBudget.from_environment()
+        # Les évaluations sont mises en cache : un même état est évalué pour le tri des coups puis à la feuille
+        self._evaluation_cache = EvaluationCache()
+        if self._memory_budget is not None:
+            self._evaluation_cache.resize(self._memory_budget.table_size(self._evaluation_cache.max_size))
+        self._cached_heuristic = self._evaluation_cache.wrap(self.compute_heuristic)
+        # Évaluateur incrémental : numpy n'est importé que s'il est demandé
+        self._nnue_search = None
+        if nnue_weights is not None or os.environ.get("DIVERCITE_NNUE_WEIGHTS"):
+            from nnue_divercite import EvaluatorWeights as NNUEWeights, IncrementalSearch
+            self._nnue_search = IncrementalSearch(nnue_weights if nnue_weights is not None else NNUEWeights.from_environment())
         self.is_first_move = True
         self.move_number = 0
+        # Pondering : recherche en arrière-plan pendant le tour de l'adversaire
+        self.ponder = ponder
+        self._ponder_thread = None
+        self._ponder_stop = threading.Event()
+        self._ponder_result = None
+        # Analyse multi-PV : meilleur enfant de chaque position, conservé entre les lignes et les profondeurs d'une même racine
+        self._best_moves = None
+        self._analysis_root = None
+        # Table bornée comme le cache d'évaluation : les entrées les moins récentes sont oubliées
+        self._analysis_table = OrderedDict()
+        self._analysis_table_size = 1 << 16
+        if self._memory_budget is not None:
+            self._analysis_table_size = self._memory_budget.table_size(self._analysis_table_size)
 
     def compute_action(self, current_state: GameState, remaining_time: int = 1e9, **kwargs) -> Action:
         """
@@ -38,117 +89,332 @@ class MyPlayer(PlayerDivercite):
             Action: The best action as determined by minimax.
         """
 
-        #TODO
+        # On arrête la recherche faite pendant le tour de l'adversaire avant de chercher
+        self.stop_pondering()
         self.move_number += 1
         start_time = time.time()
         best_move = None
-        max_depth = 0
-        # Vérifification de la profondeur maximale que le joueur pourra atteindre
-        for player_pieces_left in current_state.players_pieces_left.values():
-            for pieces_by_color in player_pieces_left.values():
-                max_depth += pieces_by_color
+        max_depth = self.get_max_depth(current_state)
         if self.is_first_move:
             # Aucune recherche pour le premier coup
             for action in current_state.generate_possible_heavy_actions():
                 self.is_first_move = False
-                return action
+                best_move = action
+                break
         else:
             # Initialisation de la profondeur de recherche à 1
             depth = 1
+            # Si l'adversaire a joué le coup prédit, on reprend la recherche là où le pondering s'est arrêté
+            pondered_depth, pondered_move = self.take_ponder_result(current_state)
+            if pondered_move is not None:
+                best_move = pondered_move
+                depth = min(pondered_depth + 1, max_depth)
             while True:
-                # Vérifier s'il reste du temps
-                self.check_time(start_time, remaining_time)
                 try:
+                    # Vérifier s'il reste du temps
+                    self.check_time(start_time, remaining_time)
                     # S'il reste du temps, lancer la recherche avec la depth actuelle
                     v, m = self.alphaBetaSearch(current_state, depth, start_time, remaining_time)
                     best_move = m
                 except TimeoutError:
                     # Retroune le meilleur coup si on atteint la limite de temps
-                    return best_move
+                    break
+                except MemoryBudgetExceeded as e:
+                    # Même repli si la recherche dépasse son budget mémoire
+                    self.handle_memory_pressure(e)
+                    break
                 # Incrémentation de la profondeur si on a pas atteint la profondeur max (IDS)
                 if depth < max_depth:
                     depth += 1
                 else:
                     break
+        if best_move is None:
+            # Aucune profondeur complétée dans le budget mémoire : premier coup généré
+            best_move = next(iter(current_state.generate_possible_heavy_actions()))
+        if self.ponder and best_move is not None:
+            self.start_pondering(best_move.get_next_game_state())
         # Retourne le meilleur coup si on atteint la profondeur maximale
         return best_move
-    
+
+    def handle_memory_pressure(self, exceeded: MemoryBudgetExceeded):
+        """
+        Shrink the evaluation cache and the analysis table when the traced memory went over budget. Live states
+        are released by the aborted search itself.
+
+        Args:
+            exceeded (MemoryBudgetExceeded): The exception raised by the search.
+        """
+        if exceeded.kind == "memory":
+            self._evaluation_cache.resize(max(MIN_TABLE_SIZE, self._evaluation_cache.max_size // 2))
+            self._analysis_table_size = max(MIN_TABLE_SIZE, self._analysis_table_size // 2)
+            while len(self._analysis_table) > self._analysis_table_size:
+                self._analysis_table.popitem(last=False)
+
+    def get_max_depth(self, current_state: GameState) -> int:
+        # Vérifification de la profondeur maximale que le joueur pourra atteindre
+        max_depth = 0
+        for player_pieces_left in current_state.players_pieces_left.values():
+            for pieces_by_color in player_pieces_left.values():
+                max_depth += pieces_by_color
+        return max_depth
+
+    def start_pondering(self, state_after_move: GameState):
+        """
+        Start searching, in a background thread, the position expected after the opponent's reply.
+
+        Args:
+            state_after_move (GameState): The state reached by the move we just returned.
+        """
+        self._ponder_result = None
+        if state_after_move.is_done():
+            return
+        self._ponder_stop.clear()
+        self._ponder_thread = threading.Thread(target=self.ponder_search, args=(state_after_move,), daemon=True)
+        self._ponder_thread.start()
+
+    def stop_pondering(self):
+        """
+        Stop the background search, if any, and wait for it to release the search.
+        """
+        if self._ponder_thread is None:
+            return
+        self._ponder_stop.set()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        self._ponder_stop.clear()
+
+    def ponder_search(self, state_after_move: GameState):
+        """
+        Predict the opponent's reply with a shallow search, then run the iterative deepening on the predicted state
+        until the opponent plays. Each completed depth is kept in `_ponder_result`.
+
+        Args:
+            state_after_move (GameState): The state reached by the move we just returned.
+        """
+        start_time = time.time()
+        no_limit = float('inf')
+        try:
+            # Coup prédit de l'adversaire : celui qui minimise notre heuristique
+            _, predicted_reply = self.minValue(state_after_move, -float('inf'), float('inf'), 2, start_time, no_limit)
+            if predicted_reply is None:
+                return
+            predicted_state = predicted_reply.get_next_game_state()
+            if predicted_state.is_done():
+                return
+            state_key = hash(predicted_state)
+            max_depth = self.get_max_depth(predicted_state)
+            for depth in range(1, max_depth + 1):
+                v, m = self.alphaBetaSearch(predicted_state, depth, start_time, no_limit)
+                self._ponder_result = (state_key, depth, m)
+        except TimeoutError:
+            # L'adversaire a joué, on garde la dernière profondeur complétée
+            pass
+        except MemoryBudgetExceeded as e:
+            self.handle_memory_pressure(e)
+
+    def take_ponder_result(self, current_state: GameState) -> tuple:
+        """
+        Consume the pondering result if the opponent played the predicted move.
+
+        Args:
+            current_state (GameState): The actual state received from the game master.
+
+        Returns:
+            tuple: The completed depth and the matching action in `current_state`, or (0, None) on a miss.
+        """
+        ponder_result, self._ponder_result = self._ponder_result, None
+        if ponder_result is None:
+            return 0, None
+        state_key, depth, pondered_move = ponder_result
+        if state_key != hash(current_state):
+            return 0, None
+        # On retrouve l'action équivalente dans l'état réellement reçu
+        pondered_next = hash(pondered_move.get_next_game_state())
+        for action in current_state.generate_possible_heavy_actions():
+            if hash(action.get_next_game_state()) == pondered_next:
+                return depth, action
+        return 0, None
+
     def check_time(self, start_time: float, remaining_time: int):
+        if self._ponder_stop.is_set():
+            raise TimeoutError
         elapsed_time = time.time() - start_time
         if elapsed_time >= remaining_time / 5:
             raise TimeoutError
     
-    def alphaBetaSearch(self, current_state: GameState, depth: int, start_time: float, remaining_time: float):
-        v, m = self.maxValue(current_state, -float('inf'), float('inf'), depth, start_time, remaining_time)
+    def alphaBetaSearch(self, current_state: GameState, depth: int, start_time: float = 0, remaining_time: float = float('inf')):
+        # Sans limite de temps par défaut, pour l'analyse des parties
+        if self._nnue_search is not None:
+            # L'évaluateur incrémental parcourt un seul état par push/pop : aucun état enfant n'est alloué
+            v, m = self._nnue_search.search(current_state, depth, lambda: self.check_time(start_time, remaining_time))
+            return v, m.get_heavy_action(current_state) if m is not None else None
+        if self._memory_budget is not None:
+            self._memory_budget.start()
+        try:
+            v, m = self.maxValue(current_state, -float('inf'), float('inf'), depth, start_time, remaining_time)
+        finally:
+            if self._memory_budget is not None:
+                self._memory_budget.stop()
         return v, m
+
+    def multiPVSearch(self, current_state: GameState, depth: int, n_lines: int, start_time: float = 0,
+                      remaining_time: float = float('inf')) -> List[Tuple[float, List[Action]]]:
+        """
+        Search the best `n_lines` root moves in a single search. Each root move is searched with alpha set to the value
+        of the worst line kept, so that only the moves entering the top lines get an exact value. The best child of every
+        position searched is recorded in a table kept across the calls on the same root: it orders the moves of the
+        following lines and depths first, and the principal variations are read back from it. The table keeps the most
+        recent entries within the table size of the memory budget (65536 without budget).
+
+        Args:
+            current_state (GameState): The root, this player to move.
+            depth (int): The search depth.
+            n_lines (int): Number of lines returned.
+            start_time (float, optional): Start of the search, for the time limit.
+            remaining_time (float, optional): Time credit left, no limit by default.
+
+        Returns:
+            List[Tuple[float, List[Action]]]: The value and the principal variation (heavy actions, from the root move)
+                of the best lines, best first.
+        """
+        if self._memory_budget is not None:
+            self._memory_budget.start()
+        root_key = current_state.get_position_key()
+        if root_key != self._analysis_root:
+            self._analysis_root = root_key
+            self._analysis_table.clear()
+        self._best_moves = self._analysis_table
+        try:
+            evaluated_actions = []
+            for action in current_state.generate_possible_heavy_actions():
+                new_state = action.get_next_game_state()
+                evaluated_actions.append((self.calculate_heuristic(new_state), action))
+            evaluated_actions.sort(reverse=True, key=lambda x: x[0])
+            if self._memory_budget is not None:
+                self._memory_budget.acquire(len(evaluated_actions))
+            self.order_best_move(current_state, evaluated_actions)
+            lines = []
+            for _, action in evaluated_actions:
+                self.check_time(start_time, remaining_time)
+                # Seuls les coups qui dépassent la pire ligne gardée reçoivent une valeur exacte
+                alpha = lines[-1][0] if len(lines) == n_lines else -float('inf')
+                new_state = action.get_next_game_state()
+                if alpha > -float('inf'):
+                    # Fenêtre nulle d'abord : la plupart des coups ne battent pas la pire ligne
+                    new_v, _ = self.minValue(new_state, alpha, alpha + NULL_WINDOW, depth - 1, start_time, remaining_time)
+                    if new_v > alpha:
+                        new_v, _ = self.minValue(new_state, alpha, float('inf'), depth - 1, start_time, remaining_time)
+                else:
+                    new_v, _ = self.minValue(new_state, alpha, float('inf'), depth - 1, start_time, remaining_time)
+                if new_v > alpha:
+                    lines.append((new_v, action))
+                    lines.sort(reverse=True, key=lambda x: x[0])
+                    del lines[n_lines:]
+            if lines:
+                self.record_best_move(current_state, lines[0][1])
+            if self._memory_budget is not None:
+                self._memory_budget.release(len(evaluated_actions))
+            return [(v, [action] + self.principal_variation(action.get_next_game_state(), depth - 1)) for v, action in lines]
+        finally:
+            self._best_moves = None
+            if self._memory_budget is not None:
+                self._memory_budget.stop()
+
+    def principal_variation(self, current_state: GameState, depth: int) -> List[Action]:
+        # On suit les meilleurs enfants enregistrés pendant l'analyse, au plus jusqu'à l'horizon
+        pv = []
+        for _ in range(depth):
+            best_child = self._analysis_table.get(current_state.get_position_key())
+            if best_child is None or current_state.is_done():
+                break
+            action = next((action for action in current_state.generate_possible_heavy_actions()
+                           if action.get_next_game_state().get_position_key() == best_child), None)
+            if action is None:
+                break
+            pv.append(action)
+            current_state = action.get_next_game_state()
+        return pv
+
+    def order_best_move(self, current_state: GameState, evaluated_actions: list):
+        # Le meilleur enfant trouvé par une ligne ou une profondeur précédente est cherché en premier
+        best_child = self._best_moves.get(current_state.get_position_key())
+        if best_child is None:
+            return
+        for i, (_, action) in enumerate(evaluated_actions):
+            if action.get_next_game_state().get_position_key() == best_child:
+                evaluated_actions.insert(0, evaluated_actions.pop(i))
+                return
+
+    def record_best_move(self, current_state: GameState, m: Optional[Action]):
+        if m is not None:
+            key = current_state.get_position_key()
+            self._best_moves[key] = m.get_next_game_state().get_position_key()
+            self._best_moves.move_to_end(key)
+            if len(self._best_moves) > self._analysis_table_size:
+                self._best_moves.popitem(last=False)
     
-    def calculate_heuristic(self, current_state: GameState) -> int:
+    def calculate_heuristic(self, current_state: GameState) -> float:
+        return self._cached_heuristic(current_state)
+
+    def get_evaluation_cache_stats(self) -> dict:
+        return self._evaluation_cache.get_stats()
+
+    def compute_heuristic(self, current_state: GameState) -> float:
         my_score = 0
         opponent_score = 0
         for player in current_state.get_players():
             player_id = player.get_id()
             if player_id == self.get_id():
                 # Résultat de l'heuristique en deux parties : score actuel et Divercité index
-                my_score = current_state.scores[player_id] + self.calculate_diverciteIndex(current_state, player_id)
+                my_score = self._score_weight * current_state.scores[player_id] + self.calculate_diverciteIndex(current_state, player_id)
             else:
-                opponent_score = current_state.scores[player_id] + self.calculate_diverciteIndex(current_state, player_id)
+                opponent_score = self._score_weight * current_state.scores[player_id] + self.calculate_diverciteIndex(current_state, player_id)
 
         # On retroune la différence des deux scores comme résultat de l'heuristique
         return my_score - opponent_score
 
-    def calculate_diverciteIndex(self, current_state: GameState, player_id) -> int:
-        # Retorune une liste des cités
-        cite_pieces = self.get_cite_piece(current_state)
-        diverciteIndex = 0
-        # Pour chaque cité du joueur actuel, on regarde combien de ressources de couleurs différentes y sont collées
-        for cite in cite_pieces:
-            if cite[1].get_owner_id() != player_id:
+    def open_cities(self, current_state: GameState, player_id) -> Iterator[int]:
+        board = current_state.get_rep()
+        pieces_left = current_state.players_pieces_left[player_id]
+        # Pour chaque cité du joueur actuel, le masque de couleurs donne les ressources de couleurs différentes collées
+        for pos, piece in board.get_env().items():
+            if piece.res_city != 'C' or piece.get_owner_id() != player_id:
                 continue
-            else:
-                # format des neighbours : (neighbour_name: (neighbour_type, (i,j)))
-                # format des cités : ("(x, y)", Piece)
-                neighbours = current_state.get_neighbours(int(cite[0][1]), int(cite[0][4]))
-                colors = set()
-                # Pour chaque voisin de la cité évaluée, on ajoute la couleur a colors si la couleur
-                # Ne s'y retrouve pas déjà
-                for neighbour in neighbours.values():
-                    if neighbour[0] != "OUTSIDE" and neighbour[0] != "EMPTY":
-                        neighbour_color = neighbour[0].get_type()[0]
-                        if neighbour_color not in colors:
-                            colors.add(neighbour_color)
-                        else:
-                            # Si la couleur s'y trouve déjà -> Divercité impossible
-                            colors.clear()
-                            break
-
+            mask = board.color_masks[pos]
+            # Deux ressources de la même couleur -> Divercité impossible
+            if mask & BoardDivercite.DUPLICATE_COLOR:
+                continue
+            n_colors = mask.bit_count()
             # Vérification de la disponibilité des pièces nécessaire à la complétion d'un Divercité
-            if len(colors) > 0 and len(colors) < 4:
-                all_colors = {'R','G','B','Y'}
-                missing_colors = all_colors - colors
-                for color in missing_colors:
-                    resource_index = color + 'R'
-                    nb_resources_left = current_state.players_pieces_left[player_id][resource_index]
-                    if nb_resources_left == 0:
-                        colors.clear()
-                        break
-
-            # Si une éventuelle Divercité est possible avec cette cité et que le joueur a les pièces nécessaires, 
-            # on ajoute à l'index le score de la cité actuelle
-            diverciteIndex += self.calculate_diverciteIndex_score(colors)
-        return diverciteIndex
-    
-    # Fonction utilisée pour obtenir les cité sur le board
-    def get_cite_piece(self, current_state: GameState) -> list:
-        cite_pieces = []
-        current_board_json = current_state.get_rep().to_json()
-        for coord, piece in current_board_json["env"].items():
-            if piece.get_type()[1] == 'C':
-                cite_pieces.append((coord, piece))
-        return cite_pieces
+            if n_colors < 4 and any(not mask & bit and pieces_left[color + 'R'] == 0
+                                    for color, bit in BoardDivercite.COLOR_BITS.items()):
+                continue
+            # Une éventuelle Divercité est possible avec cette cité : on donne son nombre de couleurs
+            yield n_colors
+
+    def calculate_diverciteIndex(self, current_state: GameState, player_id) -> float:
+        # On ajoute à l'index le score de chaque cité pouvant encore former une Divercité
+        return sum(self.calculate_diverciteIndex_score(n_colors) for n_colors in self.open_cities(current_state, player_id))
     
-    def calculate_diverciteIndex_score(self, colors:set) -> int:
-        score_mapping = {1: 0, 2: 2, 3: 3, 4: 5}
-        return score_mapping.get(len(colors), 0)
+    def calculate_diverciteIndex_score(self, n_colors: int) -> float:
+        return self._index_scores[n_colors]
+
+    def evaluation_features(self, current_state: GameState, player_id) -> List[int]:
+        """
+        Returns the features of a player the heuristic is linear in, in the order of `EvaluationWeights.to_vector`:
+        the score, then the number of cities open for a divercite by number of colors.
+
+        Args:
+            current_state (GameState): The state.
+            player_id: The id of the player.
+
+        Returns:
+            List[int]: The features, the heuristic being the weighted difference of the features of both players.
+        """
+        features = [current_state.scores[player_id]] + [0] * len(self._index_scores)
+        for n_colors in self.open_cities(current_state, player_id):
+            features[1 + n_colors] += 1
+        return features
         
     def utility(self, current_state: GameState):
         my_score = 0
@@ -160,15 +426,21 @@ class MyPlayer(PlayerDivercite):
                 opponent_score = current_state.scores[player.get_id()]
         return my_score - opponent_score
     
-    def maxValue(self, current_state: GameState, alpha, beta, depth: int, start_time: float, remaining_time: float):
+    def maxValue(self, current_state: GameState, alpha, beta, depth: int, start_time: float = 0, remaining_time: float = float('inf')):
         self.check_time(start_time, remaining_time)
         
         # Vérification 
         if depth == 0:
-            return self.calculate_heuristic(current_state), None
+            # Quiescence : les divercités en suspens sont résolues avant l'évaluation
+            return quiescence(current_state, alpha, beta, True, self.calculate_heuristic, [QUIESCENCE_NODES]), None
         elif current_state.is_done():
             return self.utility(current_state), None
 
+        # ProbCut : une recherche peu profonde à fenêtre nulle prédit si la recherche complète dépasse beta
+        max_search = partial(self.maxValue, start_time=start_time, remaining_time=remaining_time)
+        if self._probcut.cuts(max_search, current_state, alpha, beta, depth, True):
+            return beta, None
+
         # Évaluation des actions possibles
         v = -float('inf')
         m = None
@@ -182,33 +454,50 @@ class MyPlayer(PlayerDivercite):
 
          # Tri des actions 
         evaluated_actions.sort(reverse=True, key=lambda x: x[0])
-    
-        # Division par 3 des actions à évaluer
-        number_of_actions = len(evaluated_actions) // 3
-        if number_of_actions == 0:
-            number_of_actions = 1
-        top_actions = evaluated_actions[:number_of_actions]
+        if self._best_moves is not None:
+            self.order_best_move(current_state, evaluated_actions)
+        # Les états enfants restent en mémoire jusqu'au retour du noeud
+        if self._memory_budget is not None:
+            self._memory_budget.acquire(len(evaluated_actions))
 
-        for heuristic_value, action in top_actions:
+        min_search = partial(self.minValue, start_time=start_time, remaining_time=remaining_time)
+        for move_number, (heuristic_value, action) in enumerate(evaluated_actions):
             self.check_time(start_time, remaining_time)
             new_state = action.get_next_game_state()
-            new_v, new_m = self.minValue(new_state, alpha, beta, depth - 1, start_time, remaining_time)
+            if m is None:
+                # Premier coup : fenêtre complète
+                new_v, new_m = self.minValue(new_state, alpha, beta, depth - 1, start_time, remaining_time)
+            else:
+                # Coups suivants : recherche réduite à fenêtre nulle, le coup doit prouver qu'il dépasse alpha
+                result = search_late_move(min_search, new_state, alpha, beta, depth, move_number, heuristic_value, True)
+                # Les coups sont triés : aucun coup suivant ne dépasse alpha à l'horizon
+                if result is None:
+                    break
+                new_v, new_m = result
             if new_v > v:
                 v = new_v
                 m = action
                 alpha = max(alpha, v)
             if v >= beta:
-                return v, m
-        
+                break
+
+        if self._memory_budget is not None:
+            self._memory_budget.release(len(evaluated_actions))
+        if self._best_moves is not None:
+            self.record_best_move(current_state, m)
         return v, m
     
-    def minValue(self, current_state: GameState, alpha, beta, depth: int, start_time: float, remaining_time: float):
+    def minValue(self, current_state: GameState, alpha, beta, depth: int, start_time: float = 0, remaining_time: float = float('inf')):
         self.check_time(start_time, remaining_time)
         
         if depth == 0:
-            return self.calculate_heuristic(current_state), None
+            return quiescence(current_state, alpha, beta, False, self.calculate_heuristic, [QUIESCENCE_NODES]), None
         elif current_state.is_done():
             return self.utility(current_state), None
+
+        min_search = partial(self.minValue, start_time=start_time, remaining_time=remaining_time)
+        if self._probcut.cuts(min_search, current_state, alpha, beta, depth, False):
+            return alpha, None
         
         # Évaluation des actions possibles
         v = float('inf')
@@ -223,22 +512,31 @@ class MyPlayer(PlayerDivercite):
     
         # Tri des actions 
         evaluated_actions.sort(key=lambda x: x[0])
-    
-        # Division par 3 des actions à évaluer
-        number_of_actions = len(evaluated_actions) // 3
-        if number_of_actions == 0:
-            number_of_actions = 1
-        top_actions = evaluated_actions[:number_of_actions]
+        if self._best_moves is not None:
+            self.order_best_move(current_state, evaluated_actions)
+        if self._memory_budget is not None:
+            self._memory_budget.acquire(len(evaluated_actions))
 
-        for heuristic_value, action in top_actions:
+        max_search = partial(self.maxValue, start_time=start_time, remaining_time=remaining_time)
+        for move_number, (heuristic_value, action) in enumerate(evaluated_actions):
             self.check_time(start_time, remaining_time)
             new_state = action.get_next_game_state()
-            new_v, new_m = self.maxValue(new_state, alpha, beta, depth - 1, start_time, remaining_time)
+            if m is None:
+                new_v, new_m = self.maxValue(new_state, alpha, beta, depth - 1, start_time, remaining_time)
+            else:
+                result = search_late_move(max_search, new_state, alpha, beta, depth, move_number, heuristic_value, False)
+                if result is None:
+                    break
+                new_v, new_m = result
             if new_v < v:
                 v = new_v
                 m = action
                 beta = min(beta, v)
             if v <= alpha:
-                return v, m
-        
-        return v, m
\ No newline at end of file
+                break
+
+        if self._memory_budget is not None:
+            self._memory_budget.release(len(evaluated_actions))
+        if self._best_moves is not None:
+            self.record_best_move(current_state, m)
+        return v, m
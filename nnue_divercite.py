@@ -0,0 +1,407 @@
+import argparse
+import os
+from argparse import RawTextHelpFormatter
+from os.path import dirname
+from typing import Callable, Iterable, Optional, Tuple
+
+import numpy as np
+
+from game_state_divercite import GameStateDivercite
+from geometry_divercite import CITY_RESOURCE_TYPES, COLORS, STANDARD_SIZE, Variant
+from player_divercite import PlayerDivercite
+from seahorse.game.light_action import LightAction
+
+# One feature per (cell, piece type) : 4 colors, city/resource, white/black owner, on the standard board only
+BOARD_SIZE = STANDARD_SIZE
+PIECE_TYPES = [c+t+o for c in COLORS for t in CITY_RESOURCE_TYPES for o in "WB"]
+PIECE_TYPE_INDEX = {piece_type: k for k, piece_type in enumerate(PIECE_TYPES)}
+N_FEATURES = BOARD_SIZE * BOARD_SIZE * len(PIECE_TYPES)
+# Most pieces a standard board holds
+MAX_PIECES = Variant().max_step
+
+DEFAULT_HIDDEN = 16
+DEFAULT_WEIGHTS = os.path.join(dirname(os.path.abspath(__file__)), "nnue_divercite.npz")
+# Environment variable giving the weights file the players search with, instead of their heuristic
+WEIGHTS_VARIABLE = "DIVERCITE_NNUE_WEIGHTS"
+
+
+def feature_index(pos: Tuple[int, int], piece_type: str) -> int:
+    """
+    Returns the feature of a piece on a cell.
+
+    Args:
+        pos (Tuple[int, int]): The cell.
+        piece_type (str): The color, city/resource and owner letters of the piece, e.g. "RCW".
+
+    Returns:
+        int: The feature index.
+    """
+    return (pos[0] * BOARD_SIZE + pos[1]) * len(PIECE_TYPES) + PIECE_TYPE_INDEX[piece_type]
+
+
+def score_difference(current_state: GameStateDivercite) -> float:
+    """
+    Returns the score of the white player minus the score of the black player.
+
+    Args:
+        current_state (GameStateDivercite): The state.
+
+    Returns:
+        float: The score difference.
+    """
+    difference = 0.0
+    for player in current_state.players:
+        difference += current_state.scores[player.get_id()] * (1 if player.get_piece_type() == "W" else -1)
+    return difference
+
+
+class EvaluatorWeights:
+    """
+    Weights of the evaluator, from the point of view of the white player: the score difference plus the points
+    still to come predicted by w2 . clip(b1 + sum of the w1 rows of the pieces, 0, 1) + b2.
+    The accumulated layer only depends on the pieces on the board, so it is updated with one row per placement.
+
+    Attributes:
+        w1 (np.ndarray): Feature weights, shape (N_FEATURES, hidden).
+        b1 (np.ndarray): Hidden biases, shape (hidden,).
+        w2 (np.ndarray): Output weights, shape (hidden,).
+        b2 (float): Output bias.
+    """
+
+    def __init__(self, w1: np.ndarray, b1: np.ndarray, w2: np.ndarray, b2: float) -> None:
+        self.w1 = np.ascontiguousarray(w1, dtype=np.float32)
+        self.b1 = np.ascontiguousarray(b1, dtype=np.float32)
+        self.w2 = np.ascontiguousarray(w2, dtype=np.float32)
+        self.b2 = float(b2)
+
+    @classmethod
+    def zeros(cls, hidden: int = DEFAULT_HIDDEN) -> "EvaluatorWeights":
+        """
+        Returns weights evaluating a position by its score difference only.
+        """
+        return cls(np.zeros((N_FEATURES, hidden)), np.zeros(hidden), np.zeros(hidden), 0.0)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_WEIGHTS) -> "EvaluatorWeights":
+        """
+        Load weights saved with `save`, a missing file gives the score difference weights.
+
+        Args:
+            path (str, optional): Path to the `.npz` weights file.
+
+        Returns:
+            EvaluatorWeights: The weights.
+        """
+        if not os.path.exists(path):
+            return cls.zeros()
+        with np.load(path) as data:
+            return cls(data["w1"], data["b1"], data["w2"], data["b2"])
+
+    def save(self, path: str) -> None:
+        # float16 rows keep the file compact, the evaluator computes in float32
+        np.savez_compressed(path, w1=self.w1.astype(np.float16), b1=self.b1, w2=self.w2, b2=np.float32(self.b2))
+
+    @classmethod
+    def from_environment(cls) -> Optional["EvaluatorWeights"]:
+        """
+        Load the weights file set by the DIVERCITE_NNUE_WEIGHTS environment variable.
+
+        Returns:
+            Optional[EvaluatorWeights]: The weights, None when the variable is not set.
+        """
+        path = os.environ.get(WEIGHTS_VARIABLE)
+        if not path:
+            return None
+        return cls.load(path)
+
+    @property
+    def hidden(self) -> int:
+        return self.b1.shape[0]
+
+
+class Accumulator:
+    """
+    Incrementally updated hidden layer of the evaluator, following a state walked with `push` and `pop`:
+    each placement adds one row of w1 and each undo drops it, so an evaluation only costs the output layer.
+
+    Attributes:
+        weights (EvaluatorWeights): The evaluator weights.
+        stack (np.ndarray): Preallocated accumulators, one per ply from the refreshed state.
+        ply (int): Index of the current accumulator.
+        hidden (np.ndarray): Buffer of the clipped hidden layer.
+    """
+
+    def __init__(self, weights: EvaluatorWeights) -> None:
+        self.weights = weights
+        self.stack = np.zeros((MAX_PIECES + 1, weights.hidden), dtype=np.float32)
+        self.ply = 0
+        self.hidden = np.zeros(weights.hidden, dtype=np.float32)
+
+    def refresh(self, current_state: GameStateDivercite) -> None:
+        """
+        Compute the accumulator of a state from scratch.
+
+        Args:
+            current_state (GameStateDivercite): The state walked from now on.
+        """
+        if current_state.get_rep().get_dimensions() != [BOARD_SIZE, BOARD_SIZE]:
+            raise ValueError(f"The evaluator has the features of the {BOARD_SIZE}x{BOARD_SIZE} board only.")
+        indices = [feature_index(pos, piece.get_type()) for pos, piece in current_state.get_rep().get_env().items()]
+        self.ply = 0
+        np.add(self.weights.b1, self.weights.w1[indices].sum(axis=0), out=self.stack[0])
+
+    def push(self, pos: Tuple[int, int], piece_type: str) -> None:
+        """
+        Add a placed piece to the accumulator.
+
+        Args:
+            pos (Tuple[int, int]): The cell of the piece.
+            piece_type (str): The color, city/resource and owner letters of the piece.
+        """
+        np.add(self.stack[self.ply], self.weights.w1[feature_index(pos, piece_type)], out=self.stack[self.ply + 1])
+        self.ply += 1
+
+    def pop(self) -> None:
+        self.ply -= 1
+
+    def evaluate(self, score_diff: float) -> float:
+        """
+        Evaluate the current position from the point of view of the white player.
+
+        Args:
+            score_diff (float): The score of the white player minus the score of the black player.
+
+        Returns:
+            float: The evaluation.
+        """
+        # Clipped ReLU in place, np.clip is slower on such small vectors
+        hidden = self.hidden
+        np.maximum(self.stack[self.ply], 0.0, out=hidden)
+        np.minimum(hidden, 1.0, out=hidden)
+        return score_diff + float(np.dot(self.weights.w2, hidden)) + self.weights.b2
+
+
+def evaluate_state(weights: EvaluatorWeights, current_state: GameStateDivercite) -> float:
+    """
+    Evaluate a state from scratch, from the point of view of the white player.
+
+    Args:
+        weights (EvaluatorWeights): The evaluator weights.
+        current_state (GameStateDivercite): The state to evaluate.
+
+    Returns:
+        float: The evaluation.
+    """
+    accumulator = Accumulator(weights)
+    accumulator.refresh(current_state)
+    return accumulator.evaluate(score_difference(current_state))
+
+
+class IncrementalSearch:
+    """
+    Alpha-beta search walking a single copy of the root with `GameStateDivercite.push` and `pop`, the accumulator
+    pushed and popped alongside: ordering the moves and evaluating the leaves only costs the row of the placed piece
+    and the output layer.
+
+    Attributes:
+        accumulator (Accumulator): The hidden layer following the searched state.
+    """
+
+    def __init__(self, weights: EvaluatorWeights) -> None:
+        self.accumulator = Accumulator(weights)
+
+    def search(self, current_state: GameStateDivercite, depth: int,
+               check_time: Optional[Callable[[], None]] = None) -> Tuple[float, Optional[LightAction]]:
+        """
+        Search the best move of the player to move.
+
+        Args:
+            current_state (GameStateDivercite): The root, left untouched.
+            depth (int): The search depth.
+            check_time (Callable[[], None], optional): Called at every node, raises to abort the search.
+
+        Returns:
+            Tuple[float, Optional[LightAction]]: The value for the player to move and the best move.
+        """
+        state = current_state.copy()
+        self.accumulator.refresh(state)
+        return self.negamax(state, -float("inf"), float("inf"), depth, check_time or (lambda: None))
+
+    def evaluate(self, state: GameStateDivercite) -> float:
+        sign = 1 if state.next_player.get_piece_type() == "W" else -1
+        if state.is_done():
+            return sign * score_difference(state)
+        return sign * self.accumulator.evaluate(score_difference(state))
+
+    def push(self, state: GameStateDivercite, action: LightAction) -> None:
+        self.accumulator.push(tuple(action.data["position"]), action.data["piece"] + state.next_player.get_piece_type())
+        state.push(action)
+
+    def pop(self, state: GameStateDivercite) -> None:
+        state.pop()
+        self.accumulator.pop()
+
+    def negamax(self, state: GameStateDivercite, alpha: float, beta: float, depth: int,
+                check_time: Callable[[], None]) -> Tuple[float, Optional[LightAction]]:
+        check_time()
+        if depth == 0 or state.is_done():
+            return self.evaluate(state), None
+        # The children are ordered by their evaluation, best for the player to move first
+        evaluated_actions = []
+        for action in list(state.generate_possible_light_actions()):
+            self.push(state, action)
+            evaluated_actions.append((-self.evaluate(state), action))
+            self.pop(state)
+        evaluated_actions.sort(key=lambda x: -x[0])
+        v, m = -float("inf"), None
+        for _, action in evaluated_actions:
+            self.push(state, action)
+            try:
+                new_v = -self.negamax(state, -beta, -alpha, depth - 1, check_time)[0]
+            finally:
+                self.pop(state)
+            if new_v > v:
+                v, m = new_v, action
+                alpha = max(alpha, v)
+            if v >= beta:
+                break
+        return v, m
+
+
+def replay_positions(records: Iterable[dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Replay game records through the engine and collect every position with its current and final score differences.
+
+    Args:
+        records (Iterable[dict]): Finished game records with their moves and final scores, first player white.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The features of each position, padded with
+            N_FEATURES, shape (n, MAX_PIECES), the current and final score differences and the game index.
+
+    Raises:
+        ValueError: When a game is played on another board than the standard one.
+    """
+    from arena_divercite import create_initial_state
+
+    features, current, final, games = [], [], [], []
+    for game, record in enumerate(records):
+        variant = Variant.from_json(record.get("variant"))
+        if variant.size != BOARD_SIZE:
+            raise ValueError(f"Game {record.get('game_id', '')} is played on a {variant.size}x{variant.size} board, "
+                             f"the evaluator has the features of the {BOARD_SIZE}x{BOARD_SIZE} board only.")
+        current_state = create_initial_state(PlayerDivercite("W", name="white"), PlayerDivercite("B", name="black"), variant)
+        final_diff = record["scores"][0] - record["scores"][1]
+        indices = []
+        for piece, position in [(piece, tuple(position)) for piece, position in record["moves"]]:
+            owner = current_state.get_next_player().get_piece_type()
+            current_state.push(LightAction({"piece": piece, "position": position}))
+            indices.append(feature_index(position, piece + owner))
+            features.append(indices + [N_FEATURES] * (MAX_PIECES - len(indices)))
+            current.append(score_difference(current_state))
+            final.append(final_diff)
+            games.append(game)
+    return (np.array(features, dtype=np.int32), np.array(current, dtype=np.float32), np.array(final, dtype=np.float32),
+            np.array(games, dtype=np.int32))
+
+
+def fit(features: np.ndarray, current: np.ndarray, final: np.ndarray, hidden: int = DEFAULT_HIDDEN, epochs: int = 5,
+        batch_size: int = 512, learning_rate: float = 1e-3, weight_decay: float = 0.1, seed: int = 0) -> EvaluatorWeights:
+    """
+    Fit the evaluator to predict the final score difference of the positions, with Adam on the mean squared error:
+    the network learns the points still to come on top of the current score difference.
+
+    Args:
+        features (np.ndarray): Padded feature indices of the positions, as returned by `replay_positions`.
+        current (np.ndarray): Current score differences.
+        final (np.ndarray): Final score differences.
+        hidden (int, optional): Size of the hidden layer.
+        epochs (int, optional): Number of passes over the positions.
+        batch_size (int, optional): Positions per gradient step.
+        learning_rate (float, optional): Adam step size.
+        weight_decay (float, optional): L2 penalty on the feature weights, positions of a game share their label.
+        seed (int, optional): Seed of the initialization and of the shuffling.
+
+    Returns:
+        EvaluatorWeights: The fitted weights.
+    """
+    rng = np.random.default_rng(seed)
+    # The extra row of w1 is the padding feature, kept at zero
+    params = {
+        "w1": rng.normal(0, 0.05, (N_FEATURES + 1, hidden)).astype(np.float32),
+        "b1": np.full(hidden, 0.5, dtype=np.float32),
+        "w2": rng.normal(0, 0.1, hidden).astype(np.float32),
+        "b2": np.zeros(1, dtype=np.float32),
+    }
+    params["w1"][N_FEATURES] = 0
+    moments = {name: (np.zeros_like(p), np.zeros_like(p)) for name, p in params.items()}
+    step = 0
+    for _ in range(epochs):
+        order = rng.permutation(len(final))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            x, y = features[batch], final[batch] - current[batch]
+            pre = params["w1"][x].sum(axis=1) + params["b1"]
+            active = (pre > 0) & (pre < 1)
+            h = np.clip(pre, 0, 1)
+            error = h @ params["w2"] + params["b2"] - y
+            g_out = 2 * error / len(batch)
+            g_pre = np.outer(g_out, params["w2"]) * active
+            g_w1 = np.zeros_like(params["w1"])
+            np.add.at(g_w1, x.ravel(), np.repeat(g_pre, x.shape[1], axis=0))
+            g_w1 += weight_decay * params["w1"]
+            g_w1[N_FEATURES] = 0
+            grads = {"w1": g_w1, "b1": g_pre.sum(axis=0), "w2": h.T @ g_out,
+                     "b2": np.array([g_out.sum()])}
+            step += 1
+            for name, grad in grads.items():
+                m, v = moments[name]
+                m *= 0.9
+                m += 0.1 * grad
+                v *= 0.999
+                v += 0.001 * grad * grad
+                params[name] -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+    return EvaluatorWeights(params["w1"][:N_FEATURES], params["b1"], params["w2"], params["b2"][0])
+
+
+def mean_squared_error(weights: EvaluatorWeights, features: np.ndarray, current: np.ndarray, final: np.ndarray) -> float:
+    w1 = np.vstack([weights.w1, np.zeros((1, weights.hidden), dtype=np.float32)])
+    h = np.clip(w1[features].sum(axis=1) + weights.b1, 0, 1)
+    prediction = current + h @ weights.w2 + weights.b2
+    return float(np.mean((prediction - final) ** 2))
+
+
+if __name__=="__main__":
+
+    # The players import this module for the search, the training tools are only needed here
+    from loguru import logger
+
+    from encoding_divercite import read_records
+
+    parser = argparse.ArgumentParser(
+                        prog="nnue_divercite.py",
+                        description="Fits the incremental evaluator on the positions of recorded games.\n"
+                                    "The weights predict the final score difference, a tenth of the positions is held out.",
+                        formatter_class=RawTextHelpFormatter)
+    parser.add_argument("records", nargs="+", help="JSON lines files of game records (tournaments, self-play).")
+    parser.add_argument("-H","--hidden",type=int,default=DEFAULT_HIDDEN,help="Size of the hidden layer.\n\n")
+    parser.add_argument("-e","--epochs",type=int,default=5,help="Number of passes over the positions.\n\n")
+    parser.add_argument("-l","--learning-rate",type=float,default=1e-3,help="Adam step size.\n\n")
+    parser.add_argument("-w","--weight-decay",type=float,default=0.1,help="L2 penalty on the feature weights.\n\n")
+    parser.add_argument("-s","--seed",type=int,default=0,help="Seed of the initialization and of the split.\n\n")
+    parser.add_argument("-o","--output",default=DEFAULT_WEIGHTS,help="Weights file.\n\n")
+    args = parser.parse_args()
+
+    try:
+        features, current, final, games = replay_positions(read_records(args.records))
+    except ValueError as e:
+        parser.error(str(e))
+    # The split is made by game so that no position of a held out game is seen
+    held_out = np.random.default_rng(args.seed).random(games.max() + 1)[games] < 0.1
+    weights = fit(features[~held_out], current[~held_out], final[~held_out], args.hidden, args.epochs,
+                  learning_rate=args.learning_rate, weight_decay=args.weight_decay, seed=args.seed)
+    test = (features[held_out], current[held_out], final[held_out])
+    logger.info(f"{len(final)} positions, held out mean squared error {mean_squared_error(weights, *test):.2f} "
+          f"(score difference only {mean_squared_error(EvaluatorWeights.zeros(args.hidden), *test):.2f})")
+    weights.save(args.output)
+    logger.info(f"Weights written to {args.output}")
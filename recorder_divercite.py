@@ -0,0 +1,47 @@
+import atexit
+from typing import Optional
+
+from seahorse.utils.recorders import StateRecorder
+
+from writer_divercite import BackgroundWriter, default_writer
+
+
+class StreamingStateRecorder(StateRecorder):
+    """
+    Records the states broadcast by the master in the same `__REC__*.json` file as `StateRecorder`, but appends
+    each state through a background writer as it arrives instead of keeping the game in memory and writing it
+    on the game loop once the game is over. The record is closed on disconnection, or when the process exits.
+
+    Attributes:
+        writer (BackgroundWriter): The writer appending the states.
+        path (str): Path of the record.
+        n_states (int): Number of states recorded.
+    """
+
+    def __init__(self, writer: Optional[BackgroundWriter] = None) -> None:
+        super().__init__()
+        self.writer = writer if writer is not None else default_writer()
+        self.path = self.identifier + ".json"
+        self.n_states = 0
+        self.finished = False
+        # Registered after the writer's own exit handler, so it runs before the writer is closed
+        atexit.register(self.finish)
+
+        # The states are received as JSON, they are written as is in the JSON array of the record
+        @self.sio.on("play")
+        def record_play(data):
+            self.writer.write(self.path, ("[" if self.n_states == 0 else ", ") + data)
+            self.n_states += 1
+
+        @self.sio.event()
+        def disconnect():
+            self.connected = False
+            self.finish()
+
+    def finish(self) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        atexit.unregister(self.finish)
+        self.writer.write(self.path, "]" if self.n_states else "[]")
+        self.writer.close_file(self.path)
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import time
+from typing import Dict, Optional
+
+from loguru import logger
+
+from arena_divercite import find_played_move
+from game_state_divercite import GameStateDivercite
+from seahorse.game.io_stream import EventMaster
+from seahorse.game.light_action import LightAction
+from seahorse.player.proxies import LocalPlayerProxy, RemotePlayerProxy
+
+# Compact transport between a host_game master and a connect player, over the socket.io session of the game.
+# The first turn carries the full state, the next ones only the moves played since the player's last turn :
+#  master -> player : "compact_turn"   {"step", "remaining_time", "state"}                   full state (first turn, resync)
+#                                      {"step", "remaining_time", "moves": [[piece, [i, j]]]}
+#  player -> master : "compact_action" {"step", "piece", "position", "search_time"}          step of the state searched
+#                     "compact_resync" {"step"}                                               the moves do not apply to its state
+
+
+class CompactRemotePlayerProxy(RemotePlayerProxy):
+    """
+    Master side of the compact transport: stands for a `CompactLocalPlayerProxy` connected to the game master.
+    The moves played since the player's last turn are sent instead of the full state, and the round trip of each
+    turn is logged without the player's search time.
+
+    Attributes:
+        last_state (Optional[GameStateDivercite]): The state reached by the player's last move, as known by the player.
+        round_trips (list): Transport time of each turn, in seconds.
+    """
+
+    # Replies of the players, by socket.io session, resolved by the handlers registered on the game master
+    _pending: Dict[str, asyncio.Future] = {}
+    _registered = False
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.last_state = None
+        self.round_trips = []
+
+    async def listen(self, **kwargs) -> None:
+        await super().listen(**kwargs)
+        CompactRemotePlayerProxy.register_handlers(EventMaster.get_instance().sio)
+
+    @classmethod
+    def register_handlers(cls, sio) -> None:
+        if cls._registered:
+            return
+        cls._registered = True
+
+        def resolve(sid, label, data):
+            future = cls._pending.pop(sid, None)
+            if future is not None and not future.done():
+                future.set_result((label, json.loads(data)))
+
+        @sio.on("compact_action")
+        async def handle_action(sid, data):
+            resolve(sid, "compact_action", data)
+
+        @sio.on("compact_resync")
+        async def handle_resync(sid, data):
+            resolve(sid, "compact_resync", data)
+
+    def turn_payload(self, current_state: GameStateDivercite, remaining_time: float, keyframe: bool) -> dict:
+        """
+        Builds the turn message: the moves played since the player's last move, or the full state when the player
+        has no state yet, has to resync, or the states are not separated by single moves.
+
+        Args:
+            current_state (GameStateDivercite): The state the player has to play in.
+            remaining_time (float): Time credit left to the player.
+            keyframe (bool): Send the full state.
+
+        Returns:
+            dict: The message.
+        """
+        payload = {"step": current_state.get_step(), "remaining_time": remaining_time}
+        if not keyframe and self.last_state is not None:
+            moves = []
+            env = self.last_state.get_rep().get_env()
+            for pos, piece in current_state.get_rep().get_env().items():
+                if pos not in env:
+                    moves.append([piece.get_type()[:2], list(pos)])
+            # Two players : only the opponent's move since the player's own move
+            if len(moves) == current_state.get_step() - self.last_state.get_step() == 1:
+                return {**payload, "moves": moves}
+        return {**payload, "state": json.loads(json.dumps(current_state.to_json(), default=lambda x: x.to_json()))}
+
+    async def play(self, current_state: GameStateDivercite, remaining_time: float, **_) -> LightAction:
+        """
+        Plays a move through the connected player.
+
+        Args:
+            current_state (GameStateDivercite): The current game state.
+            remaining_time (float): Time credit left to the player.
+
+        Returns:
+            LightAction: The action played.
+        """
+        sio = EventMaster.get_instance().sio
+        keyframe = False
+        while True:
+            future = asyncio.get_running_loop().create_future()
+            CompactRemotePlayerProxy._pending[self.sid] = future
+            sent_at = time.time()
+            await sio.emit("compact_turn", json.dumps(self.turn_payload(current_state, remaining_time, keyframe)), to=self.sid)
+            label, reply = await future
+            round_trip = time.time() - sent_at
+            if label == "compact_action" and reply["step"] == current_state.get_step():
+                break
+            # The player's state does not match : the full state is sent again
+            logger.warning(f"{self.get_name()} lost track of the game at step {reply['step']}, sending the full state")
+            keyframe = True
+        transport_time = max(round_trip - reply["search_time"], 0.0)
+        self.round_trips.append(transport_time)
+        logger.info(f"Round trip to {self.get_name()} : {transport_time*1000:.1f} ms transport, "
+                    f"{reply['search_time']:.2f} s search (average {sum(self.round_trips)/len(self.round_trips)*1000:.1f} ms)")
+        action = LightAction({"piece": reply["piece"], "position": tuple(reply["position"])})
+        if action in current_state.get_possible_light_actions():
+            self.last_state = current_state.apply_action(action)
+        return action
+
+
+class CompactLocalPlayerProxy(LocalPlayerProxy):
+    """
+    Player side of the compact transport: keeps its own copy of the game state for the whole session,
+    built from the first full state received and kept up to date with the moves of each turn.
+
+    Attributes:
+        session_state (Optional[GameStateDivercite]): The state reached by the player's last move.
+    """
+
+    def __init__(self, wrapped_player, gs: type = GameStateDivercite) -> None:
+        super().__init__(wrapped_player, gs=gs)
+        self.session_state = None
+
+        @self.sio.on("compact_turn")
+        async def handle_compact_turn(data):
+            message = json.loads(data)
+            current_state = self.receive_turn(message)
+            if current_state is None:
+                await self.sio.emit("compact_resync", json.dumps({"step": message["step"]}))
+                return
+            logger.info(f"{self.wrapped_player.name} is playing")
+            start = time.time()
+            action = self.compute_action(current_state=current_state, remaining_time=message["remaining_time"])
+            piece, position = find_played_move(current_state, action)
+            self.session_state = current_state.apply_action(LightAction({"piece": piece, "position": position}))
+            await self.sio.emit("compact_action", json.dumps({"step": current_state.get_step(), "piece": piece,
+                                                             "position": position, "search_time": time.time() - start}))
+            logger.info(f"{self.wrapped_player} played {piece} at {position}")
+
+    def receive_turn(self, message: dict) -> Optional[GameStateDivercite]:
+        """
+        Rebuild the state of a turn: decode the full state, or apply the moves to the session state.
+
+        Args:
+            message (dict): The turn message.
+
+        Returns:
+            Optional[GameStateDivercite]: The state to play in, None if the moves do not apply to the session state.
+        """
+        if "state" in message:
+            return GameStateDivercite.from_json(json.dumps(message["state"]), next_player=self)
+        current_state = self.session_state
+        if current_state is None or current_state.get_step() + len(message["moves"]) != message["step"]:
+            return None
+        for piece, position in message["moves"]:
+            current_state = current_state.apply_action(LightAction({"piece": piece, "position": tuple(position)}))
+        return current_state
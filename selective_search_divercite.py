@@ -0,0 +1,379 @@
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+from argparse import RawTextHelpFormatter
+from os.path import dirname
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from arena_divercite import create_initial_state, find_played_move, load_player_module
+from seahorse.game.game_state import GameState
+from seahorse.game.light_action import LightAction
+
+# Late move reductions : the first moves of the ordering are searched at full depth,
+# the later ones are reduced by log(depth) * log(move number) / LMR_DIVISOR plies
+FULL_DEPTH_MOVES = 3
+LMR_DIVISOR = 1.5
+
+# ProbCut : a cut is made when the shallow search predicts the deep search out of the window
+# with a margin of PROBCUT_THRESHOLD standard deviations
+PROBCUT_THRESHOLD = 1.5
+PROBCUT_DEPTH_REDUCTION = 2
+PROBCUT_MIN_DEPTH = 3
+# The depths fitted on fewer positions are not trusted to cut
+PROBCUT_MIN_SAMPLES = 1000
+
+# Quiescence : at the horizon, only the moves that complete or break a divercite are searched,
+# within a budget of QUIESCENCE_NODES nodes and QUIESCENCE_DEPTH plies
+QUIESCENCE_NODES = 16
+QUIESCENCE_DEPTH = 4
+
+# Width of the null windows : the evaluations are weighted sums of floats, a window of 1 would not be empty
+NULL_WINDOW = 1e-6
+
+# A search of a player: (state, alpha, beta, depth) -> (value, best move)
+Search = Callable[[GameState, float, float, int], Tuple[float, Any]]
+
+
+def late_move_reduction(move_number: int, depth: int) -> int:
+    """
+    Returns the number of plies by which a move is reduced.
+
+    Args:
+        move_number (int): Rank of the move in the move ordering, from 0.
+        depth (int): Remaining depth of the node.
+
+    Returns:
+        int: The reduction, the reduced search depth `depth - 1 - reduction` never goes below 0.
+    """
+    if move_number < FULL_DEPTH_MOVES or depth < 2:
+        return 0
+    reduction = max(1, int(0.5 + math.log(depth) * math.log(move_number) / LMR_DIVISOR))
+    return min(reduction, depth - 1)
+
+
+def search_late_move(search: Search, new_state: GameState, alpha: float, beta: float, depth: int, move_number: int,
+                     heuristic_value: float, maximizing: bool) -> Optional[Tuple[float, Any]]:
+    """
+    Search a move after the first one of a node: a null-window search at reduced depth has to prove that the move
+    beats the bound of the side to move, it is then searched again at full depth, and with the full window.
+
+    Args:
+        search (Search): The search of the opponent's nodes.
+        new_state (GameState): The state after the move.
+        alpha (float): Lower bound of the window of the node.
+        beta (float): Upper bound of the window of the node.
+        depth (int): Remaining depth of the node.
+        move_number (int): Rank of the move in the move ordering, from 1.
+        heuristic_value (float): Heuristic value of the move, by which the moves are sorted.
+        maximizing (bool): True if the side to move maximizes.
+
+    Returns:
+        Optional[Tuple[float, Any]]: The value and best reply of the move, None when neither this move nor the
+            following ones can beat the bound of the side to move.
+    """
+    reduced_depth = depth - 1 - late_move_reduction(move_number, depth)
+    if maximizing:
+        # Moves are sorted: once the heuristic does not beat alpha, no later move does at the horizon
+        # (the opponent's quiescence can only lower the heuristic)
+        if reduced_depth == 0 and heuristic_value <= alpha:
+            return None
+        new_v, new_m = search(new_state, alpha, alpha + NULL_WINDOW, reduced_depth)
+        if new_v > alpha and reduced_depth < depth - 1:
+            new_v, new_m = search(new_state, alpha, alpha + NULL_WINDOW, depth - 1)
+    else:
+        if reduced_depth == 0 and heuristic_value >= beta:
+            return None
+        new_v, new_m = search(new_state, beta - NULL_WINDOW, beta, reduced_depth)
+        if new_v < beta and reduced_depth < depth - 1:
+            new_v, new_m = search(new_state, beta - NULL_WINDOW, beta, depth - 1)
+    if alpha < new_v < beta:
+        new_v, new_m = search(new_state, alpha, beta, depth - 1)
+    return new_v, new_m
+
+
+def quiescence(current_state: GameState, alpha: float, beta: float, maximizing: bool, evaluate: Callable[[GameState], float],
+               budget: list, depth: int = QUIESCENCE_DEPTH) -> float:
+    """
+    Extend the search at the horizon with the moves that complete or break a divercite only.
+    The side to move may also stand pat on the heuristic, as a quiet move is always available.
+
+    Args:
+        current_state (GameState): The state at the horizon, walked in place with `push` and `pop`.
+        alpha (float): Lower bound of the window.
+        beta (float): Upper bound of the window.
+        maximizing (bool): True if the searching player is to move.
+        evaluate (Callable[[GameState], float]): The heuristic of the searching player.
+        budget (list): Number of nodes left, shared by the whole quiescence search.
+        depth (int, optional): Number of plies left.
+
+    Returns:
+        float: The value of the state.
+    """
+    v = evaluate(current_state)
+    if current_state.is_done() or depth == 0:
+        return v
+    if maximizing:
+        if v >= beta:
+            return v
+        alpha = max(alpha, v)
+    else:
+        if v <= alpha:
+            return v
+        beta = min(beta, v)
+    for action in current_state.generate_tactical_light_actions():
+        if budget[0] <= 0:
+            break
+        budget[0] -= 1
+        current_state.push(action)
+        new_v = quiescence(current_state, alpha, beta, not maximizing, evaluate, budget, depth - 1)
+        current_state.pop()
+        if maximizing and new_v > v:
+            v = new_v
+            alpha = max(alpha, v)
+            if v >= beta:
+                break
+        elif not maximizing and new_v < v:
+            v = new_v
+            beta = min(beta, v)
+            if v <= alpha:
+                break
+    return v
+
+
+def probcut_path(player_file: str) -> str:
+    """
+    Returns the path of the ProbCut calibration of a player module, stored next to it.
+
+    Args:
+        player_file (str): Path to the player module.
+
+    Returns:
+        str: Path to `probcut_<module>.json`.
+    """
+    return os.path.join(dirname(os.path.abspath(player_file)), f"probcut_{os.path.splitext(os.path.basename(player_file))[0]}.json")
+
+
+class ProbCut:
+    """
+    Calibration of ProbCut: at depth d, the value of a deep search is predicted from a shallow search
+    of depth d - PROBCUT_DEPTH_REDUCTION as a * shallow_value + b, with a residual standard deviation sigma.
+    Without calibration (no pairs), no cut is ever made, nor at the depths fitted on fewer than PROBCUT_MIN_SAMPLES positions.
+
+    Attributes:
+        pairs (Dict[int, dict]): The shallow depth, a, b, sigma and number of samples of each calibrated depth.
+        threshold (float): Number of standard deviations of margin required to cut.
+    """
+
+    def __init__(self, pairs: Optional[Dict[int, dict]] = None, threshold: float = PROBCUT_THRESHOLD) -> None:
+        self.pairs = pairs if pairs is not None else {}
+        self.threshold = threshold
+
+    @classmethod
+    def load(cls, path: str) -> "ProbCut":
+        """
+        Load a calibration file, a missing file disables ProbCut.
+        The depths fitted on fewer than PROBCUT_MIN_SAMPLES positions are dropped.
+
+        Args:
+            path (str): Path to the calibration file.
+
+        Returns:
+            ProbCut: The calibration.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        pairs = {int(depth): pair for depth, pair in data["pairs"].items() if pair["n"] >= PROBCUT_MIN_SAMPLES}
+        return cls(pairs, data.get("threshold", PROBCUT_THRESHOLD))
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"threshold": self.threshold, "pairs": {str(depth): pair for depth, pair in sorted(self.pairs.items())}}, f, indent=2)
+
+    def high_bound(self, depth: int, beta: float) -> Optional[Tuple[int, float]]:
+        """
+        Returns the shallow search bound at or above which the deep search is predicted to fail high.
+
+        Args:
+            depth (int): Remaining depth of the node.
+            beta (float): Upper bound of the window.
+
+        Returns:
+            Optional[Tuple[int, float]]: The shallow depth and the bound, None when the depth is not calibrated
+                or the bound is infinite.
+        """
+        pair = self.pairs.get(depth)
+        if pair is None or pair["a"] <= 0 or beta == math.inf:
+            return None
+        return pair["shallow_depth"], (beta + self.threshold * pair["sigma"] - pair["b"]) / pair["a"]
+
+    def low_bound(self, depth: int, alpha: float) -> Optional[Tuple[int, float]]:
+        """
+        Returns the shallow search bound at or below which the deep search is predicted to fail low.
+
+        Args:
+            depth (int): Remaining depth of the node.
+            alpha (float): Lower bound of the window.
+
+        Returns:
+            Optional[Tuple[int, float]]: The shallow depth and the bound, None when the depth is not calibrated
+                or the bound is infinite.
+        """
+        pair = self.pairs.get(depth)
+        if pair is None or pair["a"] <= 0 or alpha == -math.inf:
+            return None
+        return pair["shallow_depth"], (alpha - self.threshold * pair["sigma"] - pair["b"]) / pair["a"]
+
+    def cuts(self, search: Search, current_state: GameState, alpha: float, beta: float, depth: int, maximizing: bool) -> bool:
+        """
+        Run the shallow null-window search of a node, and tell if it predicts the deep search out of the window.
+
+        Args:
+            search (Search): The search of the nodes of the side to move.
+            current_state (GameState): The node.
+            alpha (float): Lower bound of the window.
+            beta (float): Upper bound of the window.
+            depth (int): Remaining depth of the node.
+            maximizing (bool): True if the side to move maximizes.
+
+        Returns:
+            bool: True if the node is cut, its value is then beta when maximizing, alpha otherwise.
+        """
+        if maximizing:
+            probcut = self.high_bound(depth, beta)
+            if probcut is None:
+                return False
+            shallow_depth, high = probcut
+            shallow_v, _ = search(current_state, high - NULL_WINDOW, high, shallow_depth)
+            return shallow_v >= high
+        probcut = self.low_bound(depth, alpha)
+        if probcut is None:
+            return False
+        shallow_depth, low = probcut
+        shallow_v, _ = search(current_state, low, low + NULL_WINDOW, shallow_depth)
+        return shallow_v <= low
+
+
+def fit(samples: List[Tuple[float, float]], shallow_depth: int) -> dict:
+    """
+    Fit deep = a * shallow + b by least squares.
+
+    Args:
+        samples (List[Tuple[float, float]]): The (shallow value, deep value) pairs.
+        shallow_depth (int): Depth of the shallow searches.
+
+    Returns:
+        dict: The shallow depth, a, b, the residual standard deviation sigma and the number of samples.
+    """
+    shallow, deep = [x for x, _ in samples], [y for _, y in samples]
+    if len(set(shallow)) > 1:
+        a, b = statistics.linear_regression(shallow, deep)
+    else:
+        a, b = 1.0, statistics.fmean(deep) - shallow[0]
+    residuals = [y - (a * x + b) for x, y in samples]
+    return {"shallow_depth": shallow_depth, "a": a, "b": b, "sigma": statistics.pstdev(residuals), "n": len(samples)}
+
+
+def sample_positions(player_path: str, n_games: int, random_ply_rate: float, seed: int) -> List[Tuple[list, int]]:
+    """
+    Play quick games of the player against itself at depth 1, with some random moves for diversity.
+
+    Args:
+        player_path (str): Path to the player module.
+        n_games (int): Number of games.
+        random_ply_rate (float): Probability of playing a random move instead of the player's move.
+        seed (int): Seed of the random moves.
+
+    Returns:
+        List[Tuple[list, int]]: The moves leading to each position, and the index of the player to move.
+    """
+    rng = random.Random(seed)
+    module = load_player_module(player_path)
+    positions = []
+    for _ in range(n_games):
+        players = [module.MyPlayer("W", name="calibration_1", probcut=ProbCut()),
+                   module.MyPlayer("B", name="calibration_2", probcut=ProbCut())]
+        current_state = create_initial_state(*players)
+        moves = []
+        while not current_state.is_done():
+            positions.append((list(moves), len(moves) % 2))
+            if rng.random() < random_ply_rate:
+                action = rng.choice(list(current_state.get_possible_light_actions()))
+            else:
+                _, action = current_state.get_next_player().alphaBetaSearch(current_state, 1)
+            move = find_played_move(current_state, action)
+            moves.append(move)
+            current_state = current_state.apply_action(LightAction({"piece": move[0], "position": move[1]}))
+    return positions
+
+
+def calibrate(player_path: str, depths: List[int], n_games: int, n_positions: int, seed: int = 0) -> ProbCut:
+    """
+    Collect shallow and deep search values of the player on sampled positions and fit the ProbCut calibration.
+    The searches are run with ProbCut disabled, from the point of view of the player to move.
+
+    Args:
+        player_path (str): Path to the player module.
+        depths (List[int]): The deep depths to calibrate.
+        n_games (int): Number of games the positions are sampled from.
+        n_positions (int): Number of positions searched for each depth.
+        seed (int, optional): Seed of the sampling. Defaults to 0.
+
+    Returns:
+        ProbCut: The fitted calibration.
+    """
+    # loguru is only needed by the calibration, the players import this module for the search helpers
+    from loguru import logger
+
+    rng = random.Random(seed)
+    module = load_player_module(player_path)
+    positions = sample_positions(player_path, n_games, 0.25, seed)
+    pairs = {}
+    for depth in depths:
+        shallow_depth = depth - PROBCUT_DEPTH_REDUCTION
+        samples = []
+        for moves, to_move in rng.sample(positions, min(n_positions, len(positions))):
+            players = [module.MyPlayer("W", name="calibration_1", probcut=ProbCut()),
+                       module.MyPlayer("B", name="calibration_2", probcut=ProbCut())]
+            current_state = create_initial_state(*players)
+            for piece, position in moves:
+                current_state = current_state.apply_action(LightAction({"piece": piece, "position": position}))
+            if len(moves) + depth > current_state.max_step:
+                continue
+            searcher = players[to_move]
+            shallow, _ = searcher.maxValue(current_state, -math.inf, math.inf, shallow_depth)
+            deep, _ = searcher.maxValue(current_state, -math.inf, math.inf, depth)
+            samples.append((shallow, deep))
+        if len(samples) < PROBCUT_MIN_SAMPLES:
+            logger.warning(f"Depth {depth} : {len(samples)} positions, at least {PROBCUT_MIN_SAMPLES} are needed to cut")
+            continue
+        pairs[depth] = fit(samples, shallow_depth)
+        logger.info(f"Depth {depth} from depth {shallow_depth} : {pairs[depth]}")
+    return ProbCut(pairs)
+
+
+if __name__=="__main__":
+
+    from loguru import logger
+
+    parser = argparse.ArgumentParser(
+                        prog="selective_search_divercite.py",
+                        description="Calibrates the ProbCut of a player from shallow and deep searches on sampled positions.\n"
+                                    "The calibration is written next to the player module, which loads it at creation.",
+                        formatter_class=RawTextHelpFormatter)
+    parser.add_argument("player", help="The player module to calibrate.")
+    parser.add_argument("-d","--depths",type=int,nargs="+",default=[3, 4, 5],help="Depths to calibrate.\n\n")
+    parser.add_argument("-g","--games",type=int,default=100,help="Number of games the positions are sampled from.\n\n")
+    parser.add_argument("-n","--positions",type=int,default=2000,help=f"Number of positions per depth, at least {PROBCUT_MIN_SAMPLES} are needed to cut.\n\n")
+    parser.add_argument("-s","--seed",type=int,default=0,help="Seed of the sampling.\n\n")
+    parser.add_argument("-o","--output",default=None,help="Calibration file, next to the player module by default.\n\n")
+    args = parser.parse_args()
+
+    probcut = calibrate(args.player, [depth for depth in args.depths if depth >= PROBCUT_MIN_DEPTH], args.games, args.positions, args.seed)
+    output = args.output or probcut_path(args.player)
+    probcut.save(output)
+    logger.info(f"ProbCut calibration written to {output}")
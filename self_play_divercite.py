@@ -0,0 +1,375 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import time
+from argparse import RawTextHelpFormatter
+from collections import deque
+from itertools import combinations
+from typing import Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from arena_divercite import create_initial_state, load_player_module, play_headless_game, player_name, random_opening
+from geometry_divercite import Variant, add_variant_arguments, variant_from_arguments
+from player_divercite import PlayerDivercite
+from tournament_divercite import ResultsStore
+from writer_divercite import FSYNC_POLICIES, default_writer
+
+# A game whose worker sends nothing for the time credit of a player plus LEASE_GRACE seconds is given to another worker
+LEASE_GRACE = 30.0
+MAX_ATTEMPTS = 3
+
+# Messages are JSON objects, one per line :
+#  worker -> coordinator : {"type": "request", "worker"}
+#                          {"type": "move", "job_id", "move"}            the move as a compact string, see encode_move
+#                          {"type": "result", "job_id", "players", "scores", "winner", "termination", "times"}
+#                          {"type": "failed", "job_id", "message"}       the game could not be played (e.g. import error)
+#  coordinator -> worker : {"type": "job", "job_id", "white", "black", "time_limit", "opening_plies", "seed", "variant"}
+#                          the variant as in Variant.to_json
+#                          {"type": "stop"}
+
+
+def send(writer: asyncio.StreamWriter, message: dict) -> None:
+    if not writer.is_closing():
+        writer.write((json.dumps(message) + "\n").encode())
+
+
+def encode_move(piece: str, position: Tuple[int, int]) -> str:
+    """
+    Returns the compact form of a move streamed by the workers: the piece then the row and column, e.g. "RC3,4",
+    or "RC10,4" on a larger board.
+    """
+    return f"{piece}{position[0]},{position[1]}"
+
+
+def decode_move(move: str) -> Tuple[str, Tuple[int, int]]:
+    row, column = move[2:].split(",")
+    return move[:2], (int(row), int(column))
+
+
+def make_jobs(player_paths: List[str], games_per_pairing: int, time_limit: float, opening_plies: int, seed: int,
+              variant: Optional[Variant] = None) -> List[dict]:
+    """
+    Build the game jobs: a single player plays against itself, several players play every pairing.
+    Colors alternate between the games of a pairing.
+
+    Args:
+        player_paths (List[str]): Paths to the player modules, as seen by the workers.
+        games_per_pairing (int): Number of games of each pairing.
+        time_limit (float): Time credit of each player per game, in seconds.
+        opening_plies (int): Number of random moves opening each game.
+        seed (int): Seed of the openings, the k-th job uses seed + k.
+        variant (Optional[Variant]): Rules of the games, the standard game when None.
+
+    Returns:
+        List[dict]: The jobs, identified by the players and the game number so that a run can be resumed.
+    """
+    pairings = [(player_paths[0], player_paths[0])] if len(player_paths) == 1 else list(combinations(player_paths, 2))
+    variant = (variant or Variant()).to_json()
+    jobs = []
+    for first, second in pairings:
+        for game in range(games_per_pairing):
+            white, black = (first, second) if game % 2 == 0 else (second, first)
+            jobs.append({"job_id": f"{player_name(first)}_{player_name(second)}_{game}", "white": white, "black": black,
+                         "time_limit": time_limit, "opening_plies": opening_plies, "seed": seed + len(jobs),
+                         "variant": variant})
+    return jobs
+
+
+def play_job(job: dict, on_move) -> dict:
+    """
+    Play the game of a job with the headless engine, after its random opening.
+
+    Args:
+        job (dict): The job.
+        on_move (Callable[[str, Tuple[int, int]], None]): Called with every move played.
+
+    Returns:
+        dict: The game record, in the format of `arena_divercite.play_headless_game`.
+    """
+    white = load_player_module(job["white"]).MyPlayer("W", name=player_name(job["white"])+"_1")
+    black = load_player_module(job["black"]).MyPlayer("B", name=player_name(job["black"])+"_2")
+    variant = Variant(**job["variant"])
+    opening_state = create_initial_state(PlayerDivercite("W"), PlayerDivercite("B"), variant)
+    opening = random_opening(opening_state, job["opening_plies"], random.Random(job["seed"]))
+    return play_headless_game(white, black, time_limit=job["time_limit"], opening=opening, on_move=on_move, variant=variant)
+
+
+class Coordinator:
+    """
+    Hands out game jobs to the workers connecting over TCP and collects their results. A job whose worker
+    disconnects, fails or stays silent past its lease is handed out again, up to MAX_ATTEMPTS times,
+    after which it is recorded as crashed.
+
+    Attributes:
+        store (ResultsStore): Where the game records are appended, the games already recorded are not played again.
+        pending (Deque[dict]): The jobs waiting for a worker.
+        in_flight (Dict[str, dict]): The job, worker connection, streamed moves and last activity of each game being played.
+        max_attempts (int): Number of times a job is handed out before it is given up.
+    """
+
+    def __init__(self, jobs: List[dict], store: ResultsStore, max_attempts: int = MAX_ATTEMPTS) -> None:
+        self.store = store
+        self.pending: Deque[dict] = deque(job for job in jobs
+                                          if job["job_id"] not in store.games or store.games[job["job_id"]]["termination"] == "crash")
+        self.in_flight: Dict[str, dict] = {}
+        self.max_attempts = max_attempts
+        self.attempts: Dict[str, int] = {}
+        self.changed: Optional[asyncio.Condition] = None
+
+    def is_finished(self) -> bool:
+        return not self.pending and not self.in_flight
+
+    async def next_job(self) -> Optional[dict]:
+        """
+        Wait for a job to hand out.
+
+        Returns:
+            Optional[dict]: The job, None once every job is finished.
+        """
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.pending or self.is_finished())
+            return self.pending.popleft() if self.pending else None
+
+    async def requeue(self, job: dict, reason: str) -> None:
+        job_id = job["job_id"]
+        self.in_flight.pop(job_id, None)
+        self.attempts[job_id] = self.attempts.get(job_id, 0) + 1
+        if self.attempts[job_id] >= self.max_attempts:
+            logger.error(f"Game {job_id} given up after {self.attempts[job_id]} attempt(s) : {reason}")
+            self.store.append({"type": "game", "game_id": job_id, "white": player_name(job["white"]),
+                               "black": player_name(job["black"]), "winner": None, "termination": "crash"})
+        else:
+            logger.warning(f"Game {job_id} handed out again : {reason}")
+            self.pending.append(job)
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def finish(self, job_id: str, message: dict) -> None:
+        game = self.in_flight.pop(job_id)
+        record = {"type": "game", "game_id": job_id, "white": player_name(game["job"]["white"]),
+                  "black": player_name(game["job"]["black"]), "players": message["players"], "moves": game["moves"],
+                  "times": message["times"], "scores": message["scores"], "winner": message["winner"],
+                  "termination": message["termination"], "variant": game["job"]["variant"], "worker": game["worker"]}
+        self.store.append(record)
+        logger.info(f"Game {job_id} : {record['white']} vs {record['black']} -> winner {record['winner']} "
+                    f"({record['termination']}) by {game['worker']}, {len(self.pending)} pending, {len(self.in_flight)} in flight")
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        worker = "unknown"
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                game = self.in_flight.get(message.get("job_id"))
+                if message["type"] == "request":
+                    worker = message.get("worker", worker)
+                    job = await self.next_job()
+                    if job is None:
+                        send(writer, {"type": "stop"})
+                        await writer.drain()
+                        break
+                    self.in_flight[job["job_id"]] = {"job": job, "writer": writer, "worker": worker, "moves": [],
+                                                     "last_activity": time.time()}
+                    send(writer, {"type": "job", **job})
+                elif game is None or game["writer"] is not writer:
+                    # A late message about a game handed out again
+                    continue
+                elif message["type"] == "move":
+                    piece, position = decode_move(message["move"])
+                    game["moves"].append([piece, list(position)])
+                    game["last_activity"] = time.time()
+                elif message["type"] == "result":
+                    await self.finish(message["job_id"], message)
+                elif message["type"] == "failed":
+                    await self.requeue(game["job"], f"failed on {worker} : {message['message']}")
+                await writer.drain()
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+        finally:
+            for game in [game for game in self.in_flight.values() if game["writer"] is writer]:
+                await self.requeue(game["job"], f"lost worker {worker}")
+            writer.close()
+
+    async def watch_leases(self) -> None:
+        while True:
+            await asyncio.sleep(1)
+            now = time.time()
+            for game in list(self.in_flight.values()):
+                if now - game["last_activity"] > game["job"]["time_limit"] + LEASE_GRACE:
+                    # Closing the connection ends its handler, which hands the game out again
+                    logger.warning(f"Game {game['job']['job_id']} : no news from {game['worker']}")
+                    game["writer"].close()
+
+    async def run(self, hostname: str, port: int) -> None:
+        self.changed = asyncio.Condition()
+        server = await asyncio.start_server(self.handle_connection, hostname, port)
+        watchdog = asyncio.create_task(self.watch_leases())
+        logger.info(f"Coordinating {len(self.pending)} game(s) on {hostname}:{port}")
+        async with self.changed:
+            await self.changed.wait_for(self.is_finished)
+        watchdog.cancel()
+        server.close()
+        await server.wait_closed()
+
+
+class Worker:
+    """
+    Plays the games handed out by a coordinator one after the other, streaming the moves as they are played.
+
+    Attributes:
+        name (str): Name of the worker in the records.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    async def play(self, writer: asyncio.StreamWriter, job: dict) -> bool:
+        loop = asyncio.get_running_loop()
+
+        def on_move(piece: str, position: Tuple[int, int]) -> None:
+            loop.call_soon_threadsafe(send, writer, {"type": "move", "job_id": job["job_id"], "move": encode_move(piece, position)})
+
+        try:
+            # The game runs in a thread so the moves are sent while it is played
+            record = await asyncio.to_thread(play_job, job, on_move)
+        except Exception as e:
+            send(writer, {"type": "failed", "job_id": job["job_id"], "message": repr(e)})
+            return False
+        send(writer, {"type": "result", "job_id": job["job_id"], "players": record["players"], "scores": record["scores"],
+                      "winner": record["winner"], "termination": record["termination"],
+                      "times": [round(t, 3) for t in record["times"]]})
+        return True
+
+    async def run(self, hostname: str, port: int, connect_attempts: int = 20) -> int:
+        """
+        Play games until the coordinator has none left.
+
+        Args:
+            hostname (str): Address of the coordinator.
+            port (int): Port of the coordinator.
+            connect_attempts (int, optional): Connection attempts, half a second apart, while the coordinator starts.
+
+        Returns:
+            int: The number of games played.
+        """
+        for attempt in range(connect_attempts):
+            try:
+                reader, writer = await asyncio.open_connection(hostname, port)
+                break
+            except OSError:
+                if attempt == connect_attempts - 1:
+                    raise
+                await asyncio.sleep(0.5)
+        n_games = 0
+        while True:
+            send(writer, {"type": "request", "worker": self.name})
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if message["type"] == "stop":
+                break
+            n_games += await self.play(writer, message)
+            await writer.drain()
+        writer.close()
+        return n_games
+
+
+def run_worker(hostname: str, port: int, name: str) -> None:
+    try:
+        n_games = asyncio.run(Worker(name).run(hostname, port))
+    except OSError as e:
+        logger.warning(f"Worker {name} could not reach the coordinator : {e}")
+        return
+    logger.info(f"Worker {name} played {n_games} game(s)")
+
+
+def start_worker(hostname: str, port: int, name: str) -> multiprocessing.Process:
+    process = multiprocessing.Process(target=run_worker, args=(hostname, port, name))
+    process.start()
+    return process
+
+
+def supervise_workers(hostname: str, port: int, n_workers: int, stop: Optional[threading.Event] = None) -> None:
+    """
+    Run worker processes, restarting those that die, until every worker is sent away by the coordinator.
+
+    Args:
+        hostname (str): Address of the coordinator.
+        port (int): Port of the coordinator.
+        n_workers (int): Number of worker processes.
+        stop (threading.Event, optional): Set to stop the workers still running (e.g. once a local coordinator is done).
+    """
+    names = [f"{socket.gethostname()}_{os.getpid()}_{i}" for i in range(n_workers)]
+    processes = [start_worker(hostname, port, name) for name in names]
+    while any(process.is_alive() or process.exitcode != 0 for process in processes):
+        if stop is not None and stop.wait(1):
+            break
+        if stop is None:
+            time.sleep(1)
+        for i, process in enumerate(processes):
+            if not process.is_alive() and process.exitcode != 0:
+                # The games it was playing are handed out again by the coordinator
+                logger.warning(f"Worker {names[i]} died (exit code {process.exitcode}), restarting it")
+                processes[i] = start_worker(hostname, port, names[i])
+    for process in processes:
+        # A worker still trying to connect when the last game ended has nothing left to play
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser(
+                        prog="self_play_divercite.py",
+                        description="Distributed self-play : a coordinator hands out headless games to workers on any machine over TCP\n"
+                                    "and appends the game records to a results file, running the same command again resumes it.",
+                        formatter_class=RawTextHelpFormatter)
+    parser.add_argument("-t","--type",required=True,choices=["coordinator","worker","local"],
+                        help="\nThe execution mode you want.\n"
+                             +" - coordinator: Hands out the games of the given players and collects the records.\n"
+                             +" - worker: Plays the games handed out by the coordinator at the given address, with -j processes.\n"
+                             +" - local: Runs a coordinator and -j worker processes on this machine.\n\n")
+    parser.add_argument("-a","--address",required=False,default="localhost",help="\nThe address of the coordinator.\n\n")
+    parser.add_argument("-p","--port",required=False,type=int,default=16002,help="The port of the coordinator.\n\n")
+    parser.add_argument("-j","--workers",type=int,default=os.cpu_count(),help="Number of worker processes (worker and local modes).\n\n")
+    parser.add_argument("-n","--games",type=int,default=10,help="Number of games of each pairing, colors alternate.\n\n")
+    parser.add_argument("--time-limit",type=float,default=60*15,help="Time credit of each player per game, in seconds.\n\n")
+    parser.add_argument("-r","--opening-plies",type=int,default=2,help="Random moves opening each game.\n\n")
+    parser.add_argument("-s","--seed",type=int,default=0,help="Seed of the openings.\n\n")
+    parser.add_argument("-o","--output",default="self_play_results.jsonl",help="Results file, reused to resume.\n\n")
+    parser.add_argument("--fsync",choices=FSYNC_POLICIES,default="never",help="When the results are synced to disk.\n\n")
+    add_variant_arguments(parser)
+    parser.add_argument("players_list",nargs="*",help="The players, a single player plays against itself (coordinator and local modes).")
+    args = parser.parse_args()
+
+    if args.type == "worker":
+        supervise_workers(args.address, args.port, args.workers)
+    else:
+        if not args.players_list:
+            parser.error("the coordinator needs at least one player")
+        default_writer().fsync = args.fsync
+        try:
+            variant = variant_from_arguments(args)
+        except ValueError as e:
+            parser.error(str(e))
+        coordinator = Coordinator(make_jobs(args.players_list, args.games, args.time_limit, args.opening_plies, args.seed, variant),
+                                  ResultsStore(args.output))
+        stop = threading.Event()
+        supervisor = threading.Thread(target=supervise_workers, args=(args.address, args.port, args.workers, stop))
+        if args.type == "local":
+            supervisor.start()
+        asyncio.run(coordinator.run(args.address, args.port))
+        stop.set()
+        if args.type == "local":
+            supervisor.join()
+        logger.info(f"{len(coordinator.store.games)} game(s) recorded in {args.output}")
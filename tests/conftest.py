@@ -0,0 +1,44 @@
+import os
+import random
+import sys
+from typing import List
+
+import pytest
+
+# The modules of the game live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from arena_divercite import create_initial_state
+from game_state_divercite import GameStateDivercite
+from geometry_divercite import Variant
+from player_divercite import PlayerDivercite
+from seahorse.game.light_action import LightAction
+
+# The standard board and a larger one, whose tables are derived from the same geometry code
+BOARD_SIZES = [9, 11]
+
+
+def new_game(size: int) -> GameStateDivercite:
+    """
+    Returns the initial state of a game on a board of the given size.
+    """
+    return create_initial_state(PlayerDivercite("W", name="white"), PlayerDivercite("B", name="black"), Variant(size))
+
+
+def random_moves(current_state: GameStateDivercite, seed: int) -> List[LightAction]:
+    """
+    Returns the moves of a random game played to the end from a state.
+    """
+    rng = random.Random(seed)
+    moves = []
+    while not current_state.is_done():
+        action = rng.choice(sorted(current_state.get_possible_light_actions(),
+                                   key=lambda action: (action.data["piece"], action.data["position"])))
+        moves.append(action)
+        current_state = current_state.apply_action(action)
+    return moves
+
+
+@pytest.fixture(params=BOARD_SIZES, ids=lambda size: f"{size}x{size}")
+def size(request) -> int:
+    return request.param
@@ -0,0 +1,55 @@
+from board_divercite import BoardDivercite
+from conftest import new_game, random_moves
+
+
+def assert_indexes_recomputed(board: BoardDivercite) -> None:
+    """
+    Checks the incremental indexes of a board against a board built from scratch on the same pieces.
+    """
+    recomputed = BoardDivercite(env=dict(board.get_env()), dim=board.get_dimensions())
+    assert board.zobrist_key == recomputed.zobrist_key
+    assert board.hot_cities == recomputed.hot_cities
+    assert board.color_masks == recomputed.color_masks
+
+
+def test_apply_action_indexes_match_recompute(size):
+    for seed in range(3):
+        current_state = new_game(size)
+        for action in random_moves(current_state, seed=seed):
+            current_state = current_state.apply_action(action)
+            assert_indexes_recomputed(current_state.get_rep())
+
+
+def test_push_indexes_match_recompute(size):
+    current_state = new_game(size)
+    moves = random_moves(current_state, seed=size)
+    for action in moves:
+        current_state.push(action)
+        assert_indexes_recomputed(current_state.get_rep())
+    for _ in moves:
+        current_state.pop()
+        assert_indexes_recomputed(current_state.get_rep())
+
+
+def test_zobrist_key_ignores_move_order(size):
+    moves = random_moves(new_game(size), seed=size)
+    final_state = new_game(size)
+    for action in moves:
+        final_state = final_state.apply_action(action)
+    # The same pieces placed in another order: rebuilt from the final board, row by row
+    board = BoardDivercite(env={}, dim=final_state.get_rep().get_dimensions())
+    for pos, piece in sorted(final_state.get_rep().get_env().items()):
+        board = BoardDivercite(env={**board.get_env(), pos: piece}, dim=board.get_dimensions(),
+                               zobrist_key=board.zobrist_key_after(pos, piece))
+    assert board.zobrist_key == final_state.get_rep().zobrist_key
+
+
+def test_is_divercite_follows_the_color_masks(size):
+    current_state = new_game(size)
+    for action in random_moves(current_state, seed=size):
+        current_state = current_state.apply_action(action)
+    board = current_state.get_rep()
+    for city_pos, resources in board.geometry.city_neighbours.items():
+        colors = [board.get_env()[pos].color for pos in resources if pos in board.get_env()]
+        expected = len(colors) == 4 and len(set(colors)) == 4
+        assert board.is_divercite(city_pos) == expected
@@ -0,0 +1,100 @@
+import copy
+import json
+
+import pytest
+
+from conftest import new_game, random_moves
+from game_state_divercite import GameStateDivercite
+
+
+def snapshot(state: GameStateDivercite) -> dict:
+    """
+    Returns everything `push` modifies, copied so that later moves do not change it.
+    """
+    board = state.get_rep()
+    return {
+        "env": dict(board.get_env()),
+        "scores": dict(state.scores),
+        "step": state.step,
+        "next_player": state.next_player.get_id(),
+        "players_pieces_left": copy.deepcopy(state.players_pieces_left),
+        "zobrist_key": board.zobrist_key,
+        "hot_cities": dict(board.hot_cities),
+        "color_masks": dict(board.color_masks),
+    }
+
+
+def test_push_matches_apply_action(size):
+    current_state = new_game(size)
+    walked_state = current_state.copy()
+    for action in random_moves(current_state, seed=size):
+        current_state = current_state.apply_action(action)
+        walked_state.push(action)
+        assert snapshot(walked_state) == snapshot(current_state)
+    assert walked_state.is_done()
+
+
+def test_pop_restores_every_state(size):
+    initial_state = new_game(size)
+    walked_state = initial_state.copy()
+    snapshots = []
+    for action in random_moves(initial_state, seed=size + 1):
+        snapshots.append(snapshot(walked_state))
+        walked_state.push(action)
+    while snapshots:
+        walked_state.pop()
+        assert snapshot(walked_state) == snapshots.pop()
+    assert snapshot(walked_state) == snapshot(initial_state)
+
+
+def test_push_leaves_the_copied_state_untouched(size):
+    initial_state = new_game(size)
+    before = snapshot(initial_state)
+    walked_state = initial_state.copy()
+    for action in random_moves(initial_state, seed=size + 2)[:10]:
+        walked_state.push(action)
+    assert snapshot(initial_state) == before
+
+
+def test_pop_restores_the_generated_actions(size):
+    current_state = new_game(size)
+    action = random_moves(current_state, seed=size + 3)[0]
+    actions = list(current_state.get_possible_light_actions())
+    current_state.push(action)
+    assert list(current_state.get_possible_light_actions()) != actions
+    current_state.pop()
+    assert list(current_state.get_possible_light_actions()) == actions
+
+
+def to_wire(payload: dict) -> dict:
+    """
+    Returns a payload as received by the GUI and stored in the records, serialized as the game master does.
+    """
+    return json.loads(json.dumps(payload, default=lambda x: x.to_json()))
+
+
+def test_apply_json_delta_rebuilds_every_state(size):
+    current_state = new_game(size)
+    state_json = to_wire(current_state.to_json())
+    for action in random_moves(current_state, seed=size + 4):
+        next_state = current_state.apply_action(action)
+        delta = to_wire(next_state.to_delta_json(current_state))
+        assert delta["kind"] == "delta"
+        state_json = GameStateDivercite.apply_json_delta(state_json, delta)
+        assert state_json == to_wire(next_state.to_json())
+        current_state = next_state
+
+
+def test_apply_json_delta_leaves_the_previous_state_untouched(size):
+    current_state = new_game(size)
+    next_state = current_state.apply_action(random_moves(current_state, seed=size)[0])
+    state_json = to_wire(current_state.to_json())
+    before = copy.deepcopy(state_json)
+    GameStateDivercite.apply_json_delta(state_json, to_wire(next_state.to_delta_json(current_state)))
+    assert state_json == before
+
+
+def test_to_delta_json_needs_a_placed_piece(size):
+    current_state = new_game(size)
+    with pytest.raises(ValueError):
+        current_state.to_delta_json(current_state)
@@ -0,0 +1,20 @@
+import pytest
+
+from geometry_divercite import BoardGeometry
+from self_play_divercite import decode_move, encode_move
+
+
+@pytest.mark.parametrize("board_size", [5, 9, 11, 13])
+def test_moves_round_trip_on_every_cell(board_size):
+    geometry = BoardGeometry.get(board_size)
+    for res_city, positions in geometry.positions.items():
+        for position in positions:
+            for color in "RGBY":
+                piece = color + res_city
+                assert decode_move(encode_move(piece, position)) == (piece, position)
+
+
+def test_moves_with_two_digit_coordinates():
+    assert encode_move("RC", (10, 4)) == "RC10,4"
+    assert decode_move("RC10,4") == ("RC", (10, 4))
+    assert decode_move("GR12,10") == ("GR", (12, 10))
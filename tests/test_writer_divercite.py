@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+import writer_divercite
+from writer_divercite import BackgroundWriter
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    """
+    Counts the files synced to disk by the writers.
+    """
+    calls = []
+    monkeypatch.setattr(writer_divercite.os, "fsync", calls.append)
+    return calls
+
+
+def read(path) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_close_file_writes_the_queued_text_and_reopens(tmp_path):
+    path = str(tmp_path / "record.json")
+    with BackgroundWriter() as writer:
+        writer.write(path, "a")
+        writer.write(path, "b")
+        writer.close_file(path)
+        writer.flush()
+        assert read(path) == "ab"
+        writer.write(path, "c")
+        writer.flush()
+        assert read(path) == "abc"
+
+
+def test_close_writes_everything_queued(tmp_path):
+    paths = [str(tmp_path / f"record_{i}.json") for i in range(3)]
+    writer = BackgroundWriter(batch_size=4)
+    for i in range(100):
+        writer.write(paths[i % 3], f"{i}\n")
+    writer.close()
+    for k, path in enumerate(paths):
+        assert read(path).split() == [str(i) for i in range(k, 100, 3)]
+
+
+def test_closed_writer(tmp_path):
+    writer = BackgroundWriter()
+    writer.close()
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.write(str(tmp_path / "record.json"), "a")
+    with pytest.raises(ValueError):
+        writer.close_file(str(tmp_path / "record.json"))
+
+
+def test_unknown_fsync_policy():
+    with pytest.raises(ValueError):
+        BackgroundWriter(fsync="always")
+
+
+@pytest.mark.parametrize("fsync, after_flush, after_close_file, after_close", [
+    ("never", 0, 0, 0),
+    ("batch", 1, 2, 3),
+    ("close", 0, 1, 2),
+])
+def test_fsync_policies(tmp_path, fsyncs, fsync, after_flush, after_close_file, after_close):
+    writer = BackgroundWriter(fsync=fsync)
+    writer.write(str(tmp_path / "first.json"), "a")
+    writer.flush()
+    assert len(fsyncs) == after_flush
+    writer.close_file(str(tmp_path / "first.json"))
+    writer.flush()
+    assert len(fsyncs) == after_close_file
+    # A file still open when the writer is closed
+    writer.write(str(tmp_path / "second.json"), "b")
+    writer.close()
+    assert len(fsyncs) == after_close
+    assert read(tmp_path / "first.json") == "a"
+    assert read(tmp_path / "second.json") == "b"
+
+
+def test_write_errors_reach_the_caller(tmp_path):
+    writer = BackgroundWriter()
+    # A directory cannot be opened for writing
+    writer.write(str(tmp_path), "a")
+    with pytest.raises(OSError):
+        writer.flush()
+    writer.close()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,324 @@
+import argparse
+import glob
+import json
+import os
+from argparse import RawTextHelpFormatter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from itertools import combinations
+from os.path import basename, splitext
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from arena_divercite import create_worker_pool, load_player_module, play_headless_game, player_name
+from geometry_divercite import Variant, add_variant_arguments, variant_from_arguments
+from writer_divercite import FSYNC_POLICIES, BackgroundWriter, default_writer
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 32.0
+
+
+def find_players(players_dir: str) -> List[str]:
+    """
+    List the player modules of a directory, i.e. the python files defining a `MyPlayer` class.
+
+    Args:
+        players_dir (str): The directory to scan.
+
+    Returns:
+        List[str]: Sorted paths of the player modules.
+    """
+    paths = []
+    for path in sorted(glob.glob(os.path.join(players_dir, "*.py"))):
+        with open(path, encoding="utf-8") as f:
+            if "class MyPlayer" in f.read():
+                paths.append(path)
+    return paths
+
+
+def run_game(job: dict) -> dict:
+    """
+    Play one tournament game, in a worker process.
+
+    Args:
+        job (dict): The game id, round, both player paths and the time limit.
+
+    Returns:
+        dict: The game record completed with the job information.
+    """
+    white = load_player_module(job["white"]).MyPlayer("W", name=player_name(job["white"])+"_1")
+    black = load_player_module(job["black"]).MyPlayer("B", name=player_name(job["black"])+"_2")
+    record = play_headless_game(white, black, time_limit=job["time_limit"], variant=job["variant"])
+    return {"type": "game", "game_id": job["game_id"], "round": job["round"],
+            "white": player_name(job["white"]), "black": player_name(job["black"]), **record}
+
+
+def expected_score(rating: float, opponent_rating: float) -> float:
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def update_ratings(ratings: Dict[str, float], record: dict) -> None:
+    """
+    Apply the Elo update of a finished game.
+
+    Args:
+        ratings (Dict[str, float]): The ratings, updated in place.
+        record (dict): The game record.
+    """
+    white, black = record["white"], record["black"]
+    if record["winner"] is None:
+        score = 0.5
+    else:
+        score = 1.0 - record["winner"]
+    rating_white, rating_black = ratings.get(white, INITIAL_RATING), ratings.get(black, INITIAL_RATING)
+    delta = K_FACTOR * (score - expected_score(rating_white, rating_black))
+    ratings[white] = rating_white + delta
+    ratings[black] = rating_black - delta
+
+
+class ResultsStore:
+    """
+    Append-only JSON lines file holding the rounds and game records of a tournament, so it can be resumed.
+    The entries are kept in memory at once and appended to the file by a background writer.
+
+    Attributes:
+        path (str): Path of the results file.
+        writer (BackgroundWriter): The writer appending the entries.
+        games (Dict[str, dict]): The game records by game id, in completion order.
+        rounds (Dict[int, List[Tuple[str, str]]]): The (white, black) pairings of each swiss round.
+    """
+
+    def __init__(self, path: str, writer: Optional[BackgroundWriter] = None) -> None:
+        self.path = path
+        self.writer = writer if writer is not None else default_writer()
+        self.games = {}
+        self.rounds = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry["type"] == "game":
+                        self.games[entry["game_id"]] = entry
+                    elif entry["type"] == "round":
+                        self.rounds[entry["round"]] = [tuple(pairing) for pairing in entry["pairings"]]
+
+    def append(self, entry: dict) -> None:
+        self.writer.write(self.path, json.dumps(entry) + "\n")
+        if entry["type"] == "game":
+            self.games[entry["game_id"]] = entry
+        elif entry["type"] == "round":
+            self.rounds[entry["round"]] = [tuple(pairing) for pairing in entry["pairings"]]
+
+    def compute_ratings(self, names: List[str]) -> Dict[str, float]:
+        ratings = {name: INITIAL_RATING for name in names}
+        for record in self.games.values():
+            if record["termination"] != "crash":
+                update_ratings(ratings, record)
+        return ratings
+
+
+class Tournament:
+    """
+    Round-robin or swiss tournament between player modules, played in parallel across a process pool
+    kept for the whole tournament.
+
+    Attributes:
+        paths (Dict[str, str]): Player module path by player name.
+        store (ResultsStore): Where the results are kept.
+        time_limit (float): Time credit of each player per game, in seconds.
+        workers (int): Number of worker processes.
+        games_per_pairing (int): Games played by each pairing, colors alternate between games.
+        variant (Optional[Variant]): Rules of the games, the standard game when None.
+    """
+
+    def __init__(self, paths: List[str], store: ResultsStore, time_limit: float, workers: int, games_per_pairing: int,
+                 variant: Optional[Variant] = None) -> None:
+        self.paths = {player_name(path): path for path in paths}
+        self.store = store
+        self.time_limit = time_limit
+        self.workers = workers
+        self.games_per_pairing = games_per_pairing
+        self.variant = variant
+        self.executor = None
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = create_worker_pool(self.workers, self.paths.values())
+        return self.executor
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def make_jobs(self, round_number: int, pairings: List[Tuple[str, str]]) -> List[dict]:
+        jobs = []
+        for first, second in pairings:
+            for k in range(self.games_per_pairing):
+                white, black = (first, second) if k % 2 == 0 else (second, first)
+                game_id = f"{round_number}-{white}-{black}-{k}"
+                # Crashed games are played again when the tournament is resumed
+                if game_id not in self.store.games or self.store.games[game_id]["termination"] == "crash":
+                    jobs.append({"game_id": game_id, "round": round_number, "white": self.paths[white],
+                                 "black": self.paths[black], "time_limit": self.time_limit, "variant": self.variant})
+        return jobs
+
+    def run_jobs(self, jobs: List[dict]) -> None:
+        """
+        Play the games of a round. When a worker dies, it breaks the pool and every game the pool did not finish:
+        the broken pool is shut down and these games are played again on a new pool. If the pool breaks again,
+        the games left are played one at a time, so that the game killing its worker is recorded as crashed.
+
+        Args:
+            jobs (List[dict]): The games to play.
+        """
+        jobs = self.run_pool(jobs)
+        if not jobs:
+            return
+        self.close()
+        logger.warning(f"A worker died, {len(jobs)} game(s) played again on a new pool")
+        jobs = self.run_pool(jobs)
+        if not jobs:
+            return
+        self.close()
+        logger.warning(f"A worker died again, the {len(jobs)} game(s) left are played one at a time")
+        for job in jobs:
+            if self.run_pool([job]):
+                self.close()
+                logger.error(f"Game {job['game_id']} crashed: its worker died")
+                self.append_game(self.crash_record(job))
+
+    def run_pool(self, jobs: List[dict]) -> List[dict]:
+        """
+        Play games on the worker pool.
+
+        Args:
+            jobs (List[dict]): The games to play.
+
+        Returns:
+            List[dict]: The games left unplayed because the pool broke.
+        """
+        executor = self.get_executor()
+        futures = {}
+        unplayed = []
+        for job in jobs:
+            try:
+                futures[executor.submit(run_game, job)] = job
+            except BrokenProcessPool:
+                unplayed.append(job)
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                record = future.result()
+            except BrokenProcessPool:
+                unplayed.append(job)
+                continue
+            except Exception as e:
+                # The worker itself failed (e.g. the module could not be imported), the game is not rated
+                logger.error(f"Game {job['game_id']} crashed: {e}")
+                record = self.crash_record(job)
+            self.append_game(record)
+        return unplayed
+
+    @staticmethod
+    def crash_record(job: dict) -> dict:
+        return {"type": "game", "game_id": job["game_id"], "round": job["round"],
+                "white": player_name(job["white"]), "black": player_name(job["black"]),
+                "winner": None, "termination": "crash",
+                "variant": (job["variant"] if job["variant"] is not None else Variant()).to_json()}
+
+    def append_game(self, record: dict) -> None:
+        self.store.append(record)
+        logger.info(f"Game {record['game_id']} : {record['white']} vs {record['black']} -> "
+                    f"winner {record['winner']} ({record['termination']})")
+
+    def round_robin(self, cycles: int) -> None:
+        pairings = list(combinations(sorted(self.paths), 2))
+        for cycle in range(cycles):
+            self.run_jobs(self.make_jobs(cycle, pairings))
+
+    def swiss(self, n_rounds: int) -> None:
+        for round_number in range(n_rounds):
+            pairings = self.store.rounds.get(round_number)
+            if pairings is None:
+                pairings = self.swiss_pairings()
+                self.store.append({"type": "round", "round": round_number, "pairings": pairings})
+            self.run_jobs(self.make_jobs(round_number, pairings))
+            self.log_ladder()
+
+    def swiss_pairings(self) -> List[Tuple[str, str]]:
+        """
+        Pair players of similar ratings, avoiding rematches when possible. With an odd number of players,
+        the lowest rated player left unpaired sits out the round.
+
+        Returns:
+            List[Tuple[str, str]]: The pairings of the next round.
+        """
+        ratings = self.store.compute_ratings(list(self.paths))
+        played = {}
+        for record in self.store.games.values():
+            pairing = frozenset((record["white"], record["black"]))
+            played[pairing] = played.get(pairing, 0) + 1
+        unpaired = sorted(self.paths, key=lambda name: -ratings[name])
+        pairings = []
+        while len(unpaired) > 1:
+            first = unpaired.pop(0)
+            opponent = min(unpaired, key=lambda name: (played.get(frozenset((first, name)), 0), unpaired.index(name)))
+            unpaired.remove(opponent)
+            pairings.append((first, opponent))
+        return pairings
+
+    def ladder(self) -> List[Tuple[str, float, int]]:
+        ratings = self.store.compute_ratings(list(self.paths))
+        n_games = {name: 0 for name in self.paths}
+        for record in self.store.games.values():
+            for name in (record["white"], record["black"]):
+                if name in n_games:
+                    n_games[name] += 1
+        return sorted(((name, ratings[name], n_games[name]) for name in self.paths), key=lambda x: -x[1])
+
+    def log_ladder(self) -> None:
+        for rank, (name, rating, n_games) in enumerate(self.ladder(), start=1):
+            logger.info(f"{rank:>3}. {name:<30} {rating:7.1f} ({n_games} games)")
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser(
+                        prog="tournament_divercite.py",
+                        description="Rates every player module of a directory through headless games played in parallel.\n"
+                                    "Results are appended to a file, running the same command again resumes the tournament.",
+                        formatter_class=RawTextHelpFormatter)
+    parser.add_argument("players_dir", help="Directory containing the player modules (files defining MyPlayer).")
+    parser.add_argument("-f","--format",choices=["round_robin","swiss"],default="round_robin",help="Pairing system.\n\n")
+    parser.add_argument("-n","--rounds",type=int,default=1,help="Number of swiss rounds, or of round-robin cycles.\n\n")
+    parser.add_argument("-k","--games-per-pairing",type=int,default=2,help="Games per pairing, colors alternate.\n\n")
+    parser.add_argument("-j","--workers",type=int,default=os.cpu_count(),help="Number of games played in parallel.\n\n")
+    parser.add_argument("-t","--time-limit",type=float,default=60*15,help="Time credit of each player per game (s).\n\n")
+    parser.add_argument("-o","--output",default="tournament_results.jsonl",help="Results file, reused to resume.\n\n")
+    parser.add_argument("--fsync",choices=FSYNC_POLICIES,default="never",help="When the results are synced to disk.\n\n")
+    add_variant_arguments(parser)
+    args = parser.parse_args()
+    default_writer().fsync = args.fsync
+    try:
+        variant = variant_from_arguments(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    paths = find_players(args.players_dir)
+    if len(paths) < 2:
+        logger.error(f"Found {len(paths)} player module(s) in {args.players_dir}, at least 2 are needed.")
+    else:
+        logger.info(f"Players : {[splitext(basename(path))[0] for path in paths]}")
+        tournament = Tournament(paths, ResultsStore(args.output), args.time_limit, args.workers, args.games_per_pairing, variant)
+        try:
+            if args.format == "round_robin":
+                tournament.round_robin(args.rounds)
+            else:
+                tournament.swiss(args.rounds)
+        finally:
+            tournament.close()
+        tournament.log_ladder()
@@ -0,0 +1,323 @@
+import argparse
+import json
+import math
+import os
+import random
+from argparse import RawTextHelpFormatter
+from concurrent.futures import Executor
+from typing import Iterable, Tuple
+
+import numpy as np
+from loguru import logger
+
+from analysis_divercite import read_games
+from arena_divercite import (compute_winner, create_initial_state, create_worker_pool, find_played_move, load_player_module,
+                             play_headless_game, random_opening)
+from evaluation_weights_divercite import EvaluationWeights, evaluation_path
+from geometry_divercite import Variant
+from player_divercite import PlayerDivercite
+from seahorse.game.light_action import LightAction
+
+# Range searched for the scaling constant of the Texel loss, mapping heuristic values to expected results
+SCALE_RANGE = (1e-3, 10.0)
+# Strength of the L2 penalty pulling the index scores toward the starting weights
+DEFAULT_REGULARIZATION = 1e-3
+
+
+def self_play_game(job: dict) -> dict:
+    """
+    Play one self-play game at a fixed depth after a random opening, in a worker process.
+
+    Args:
+        job (dict): The player module path, the evaluation weights vector, the depth, the number of opening plies and the seed.
+
+    Returns:
+        dict: The game record, in the format of `arena_divercite.play_headless_game`.
+    """
+    module = load_player_module(job["player"])
+    weights = EvaluationWeights.from_vector(job["weights"])
+    players = [module.MyPlayer("W", name="self_play_1", evaluation_weights=weights),
+               module.MyPlayer("B", name="self_play_2", evaluation_weights=weights)]
+    current_state = create_initial_state(*players)
+    moves = random_opening(current_state, job["opening_plies"], random.Random(job["seed"]))
+    for piece, position in moves:
+        current_state = current_state.apply_action(LightAction({"piece": piece, "position": position}))
+    while not current_state.is_done():
+        _, action = current_state.get_next_player().alphaBetaSearch(current_state, job["depth"])
+        move = find_played_move(current_state, action)
+        moves.append(move)
+        current_state = current_state.apply_action(LightAction({"piece": move[0], "position": move[1]}))
+    scores = [current_state.scores[player.get_id()] for player in players]
+    return {"type": "game", "game_id": job["seed"], "players": [player.get_name() for player in players], "moves": moves,
+            "scores": scores, "winner": compute_winner(scores), "termination": "done", "variant": Variant().to_json()}
+
+
+def self_play(executor: Executor, player_path: str, weights: EvaluationWeights, n_games: int, depth: int,
+              opening_plies: int, seed: int) -> Iterable[dict]:
+    """
+    Play self-play games across the worker pool, records are yielded in the order of the games.
+
+    Args:
+        executor (Executor): The worker pool, with the player preloaded.
+        player_path (str): Path to the player module.
+        weights (EvaluationWeights): Evaluation weights of both players.
+        n_games (int): Number of games.
+        depth (int): Search depth of every move.
+        opening_plies (int): Number of random moves opening each game.
+        seed (int): Seed of the openings, game i uses seed + i.
+
+    Returns:
+        Iterable[dict]: The game records.
+    """
+    jobs = ({"player": player_path, "weights": weights.to_vector(), "depth": depth, "opening_plies": opening_plies,
+             "seed": seed + i} for i in range(n_games))
+    yield from executor.map(self_play_game, jobs)
+
+
+def extract_positions(games: Iterable[dict], player_path: str, skip_plies: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Replay games through the engine and label each position with the result of its game.
+    Games that did not go to the end (forfeit, truncated record) are skipped.
+
+    Args:
+        games (Iterable[dict]): The games, as produced by `analysis_divercite.read_games`.
+        player_path (str): Path to the player module whose `evaluation_features` are extracted.
+        skip_plies (int, optional): Number of opening positions of each game left out. Defaults to 0.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The features of white minus the features of black of each position,
+            the result for white (1, 0.5 or 0) and the index of the game of each position.
+    """
+    extractor = load_player_module(player_path).MyPlayer("W", name="tuning")
+    features, results, game_indices = [], [], []
+    n_games = 0
+    for game in games:
+        players = [PlayerDivercite("W", name=game["players"][0]), PlayerDivercite("B", name=game["players"][1])]
+        current_state = create_initial_state(*players, Variant.from_json(game["variant"]))
+        white_id, black_id = players[0].get_id(), players[1].get_id()
+        game_features = []
+        for ply, (piece, position) in enumerate(game["moves"]):
+            current_state.push(LightAction({"piece": piece, "position": tuple(position)}))
+            if ply + 1 >= skip_plies and not current_state.is_done():
+                white, black = extractor.evaluation_features(current_state, white_id), extractor.evaluation_features(current_state, black_id)
+                game_features.append([w - b for w, b in zip(white, black)])
+        if not current_state.is_done() or not game_features:
+            continue
+        winner = compute_winner([current_state.scores[white_id], current_state.scores[black_id]])
+        features.extend(game_features)
+        results.extend([0.5 if winner is None else 1.0 - winner] * len(game_features))
+        game_indices.extend([n_games] * len(game_features))
+        n_games += 1
+    return np.array(features, dtype=np.float64), np.array(results, dtype=np.float64), np.array(game_indices, dtype=np.int64)
+
+
+def texel_loss(weights: np.ndarray, features: np.ndarray, results: np.ndarray, scale: float) -> float:
+    """
+    Mean squared error between the game results and the results predicted from the heuristic,
+    sigmoid(scale * heuristic), over the whole dataset at once.
+
+    Args:
+        weights (np.ndarray): The weights vector, see `EvaluationWeights.to_vector`.
+        features (np.ndarray): The feature differences of the positions.
+        results (np.ndarray): The results for white.
+        scale (float): The scaling constant of the sigmoid.
+
+    Returns:
+        float: The loss.
+    """
+    predicted = 1 / (1 + np.exp(-scale * (features @ weights)))
+    return float(np.mean((results - predicted) ** 2))
+
+
+def fit_scale(weights: np.ndarray, features: np.ndarray, results: np.ndarray, iterations: int = 60) -> float:
+    """
+    Find the scaling constant minimizing the loss of fixed weights, by golden section search on its logarithm.
+
+    Args:
+        weights (np.ndarray): The weights vector.
+        features (np.ndarray): The feature differences of the positions.
+        results (np.ndarray): The results for white.
+        iterations (int, optional): Number of iterations. Defaults to 60.
+
+    Returns:
+        float: The scaling constant.
+    """
+    ratio = (math.sqrt(5) - 1) / 2
+    low, high = math.log(SCALE_RANGE[0]), math.log(SCALE_RANGE[1])
+    for _ in range(iterations):
+        left, right = high - ratio * (high - low), low + ratio * (high - low)
+        if texel_loss(weights, features, results, math.exp(left)) < texel_loss(weights, features, results, math.exp(right)):
+            high = right
+        else:
+            low = left
+    return math.exp((low + high) / 2)
+
+
+def fit(features: np.ndarray, results: np.ndarray, initial: EvaluationWeights, scale: float, iterations: int = 2000,
+        learning_rate: float = 0.05, regularization: float = DEFAULT_REGULARIZATION) -> EvaluationWeights:
+    """
+    Fit the index scores by minimizing the Texel loss with Adam, full batch, plus an L2 penalty toward the starting
+    weights so that the index scores only move as far as the positions support. The score weight is kept fixed:
+    it anchors the scale of the heuristic, in which the ProbCut calibration and the scaling constant are expressed.
+    The score of a city without colors is kept fixed too, it is the reference the other index scores count from.
+
+    Args:
+        features (np.ndarray): The feature differences of the positions.
+        results (np.ndarray): The results for white.
+        initial (EvaluationWeights): The starting weights.
+        scale (float): The scaling constant of the sigmoid, fitted for the starting weights.
+        iterations (int, optional): Number of gradient steps. Defaults to 2000.
+        learning_rate (float, optional): Step size. Defaults to 0.05.
+        regularization (float, optional): Strength of the L2 penalty. Defaults to DEFAULT_REGULARIZATION.
+
+    Returns:
+        EvaluationWeights: The fitted weights.
+    """
+    weights = np.array(initial.to_vector(), dtype=np.float64)
+    start = weights.copy()
+    free = np.ones_like(weights)
+    free[:2] = 0
+    m, v = np.zeros_like(weights), np.zeros_like(weights)
+    beta1, beta2 = 0.9, 0.999
+    for t in range(1, iterations + 1):
+        predicted = 1 / (1 + np.exp(-scale * (features @ weights)))
+        error = (predicted - results) * predicted * (1 - predicted)
+        grad = (2 * scale * (features.T @ error) / len(results) + 2 * regularization * (weights - start)) * free
+        m = beta1 * m + (1 - beta1) * grad
+        v = beta2 * v + (1 - beta2) * grad ** 2
+        weights -= learning_rate * (m / (1 - beta1 ** t)) / (np.sqrt(v / (1 - beta2 ** t)) + 1e-12)
+    return EvaluationWeights.from_vector([initial.score_weight, initial.index_scores[0]] + [round(float(w), 3) for w in weights[2:]])
+
+
+def validation_game(job: dict) -> dict:
+    """
+    Play one timed validation game between the candidate and the baseline weights, in a worker process.
+
+    Args:
+        job (dict): The player module path, the weights vectors of white and black, their names, the opening and the time limit.
+
+    Returns:
+        dict: The game record, in the format of `arena_divercite.play_headless_game`.
+    """
+    module = load_player_module(job["player"])
+    white = module.MyPlayer("W", name=job["names"][0], evaluation_weights=EvaluationWeights.from_vector(job["weights"][0]))
+    black = module.MyPlayer("B", name=job["names"][1], evaluation_weights=EvaluationWeights.from_vector(job["weights"][1]))
+    return play_headless_game(white, black, time_limit=job["time_limit"], opening=[tuple(move) for move in job["opening"]])
+
+
+def validate(executor: Executor, player_path: str, candidate: EvaluationWeights, baseline: EvaluationWeights,
+             n_pairs: int, time_limit: float, opening_plies: int, seed: int) -> dict:
+    """
+    Play the candidate weights against the baseline weights across the worker pool. Each random opening
+    is played twice with the colors swapped.
+
+    Args:
+        executor (Executor): The worker pool, with the player preloaded.
+        player_path (str): Path to the player module.
+        candidate (EvaluationWeights): The weights to validate.
+        baseline (EvaluationWeights): The weights played against.
+        n_pairs (int): Number of openings.
+        time_limit (float): Time credit of each player per game, in seconds.
+        opening_plies (int): Number of random moves of each opening.
+        seed (int): Seed of the openings.
+
+    Returns:
+        dict: The number of games, wins, draws and losses of the candidate, its score and the Elo difference.
+    """
+    rng = random.Random(seed)
+    initial_state = create_initial_state(PlayerDivercite("W"), PlayerDivercite("B"))
+    jobs = []
+    for _ in range(n_pairs):
+        opening = random_opening(initial_state, opening_plies, rng)
+        for candidate_color in (0, 1):
+            weights = [baseline.to_vector(), baseline.to_vector()]
+            weights[candidate_color] = candidate.to_vector()
+            names = ["baseline_1", "baseline_2"]
+            names[candidate_color] = f"candidate_{candidate_color + 1}"
+            jobs.append({"player": player_path, "weights": weights, "names": names, "opening": opening,
+                         "time_limit": time_limit, "candidate": candidate_color})
+    wins = draws = losses = 0
+    for job, record in zip(jobs, executor.map(validation_game, jobs)):
+        if record["winner"] is None:
+            draws += 1
+        elif record["winner"] == job["candidate"]:
+            wins += 1
+        else:
+            losses += 1
+    games = wins + draws + losses
+    score = (wins + 0.5 * draws) / games
+    clipped = min(max(score, 1e-3), 1 - 1e-3)
+    return {"games": games, "wins": wins, "draws": draws, "losses": losses, "score": score,
+            "elo": -400 * math.log10(1 / clipped - 1)}
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser(
+                        prog="tuning_divercite.py",
+                        description="Tunes the evaluation weights of a player on labeled positions (Texel method) and validates\n"
+                                    "the tuned weights against the current ones in parallel headless matches.\n"
+                                    "Positions come from recorded games, results files and self-play games played across the workers.\n"
+                                    "Validated weights are written next to the player module, which loads them at creation.",
+                        formatter_class=RawTextHelpFormatter)
+    parser.add_argument("games", nargs="*", help="Recorded games (__REC__*.json), results files (*.jsonl) or directories of them.")
+    parser.add_argument("-p","--player",default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "my_player_2.py"),
+                        help="The player module to tune.\n\n")
+    parser.add_argument("-n","--self-play",type=int,default=0,help="Number of self-play games added to the positions.\n\n")
+    parser.add_argument("-d","--depth",type=int,default=2,help="Search depth of the self-play games.\n\n")
+    parser.add_argument("-r","--opening-plies",type=int,default=2,help="Random moves opening the self-play and validation games.\n\n")
+    parser.add_argument("-k","--skip-plies",type=int,default=4,help="Opening positions of each game left out of the dataset.\n\n")
+    parser.add_argument("-i","--iterations",type=int,default=2000,help="Gradient steps of the fit.\n\n")
+    parser.add_argument("-l","--regularization",type=float,default=DEFAULT_REGULARIZATION,
+                        help="Strength of the L2 penalty pulling the index scores toward the current weights.\n\n")
+    parser.add_argument("-m","--matches",type=int,default=20,help="Number of validation openings, each played with both colors.\n\n")
+    parser.add_argument("-t","--time",type=float,default=60,help="Time credit of each player per validation game (s).\n\n")
+    parser.add_argument("-j","--workers",type=int,default=os.cpu_count(),help="Number of games played in parallel.\n\n")
+    parser.add_argument("-s","--seed",type=int,default=0,help="Seed of the openings.\n\n")
+    parser.add_argument("--save-games",default=None,help="JSON lines file the self-play games are written to.\n\n")
+    parser.add_argument("-f","--force",action="store_true",help="Write the tuned weights even if they do not beat the current ones.\n\n")
+    parser.add_argument("-o","--output",default=None,help="Weights file, next to the player module by default.\n\n")
+    args = parser.parse_args()
+
+    output = args.output or evaluation_path(args.player)
+    baseline = EvaluationWeights.load(evaluation_path(args.player))
+    games = list(read_games(args.games))
+    with create_worker_pool(args.workers, [args.player]) as executor:
+        if args.self_play > 0:
+            records = list(self_play(executor, args.player, baseline, args.self_play, args.depth, args.opening_plies, args.seed))
+            logger.info(f"Played {len(records)} self-play game(s) at depth {args.depth}")
+            if args.save_games:
+                with open(args.save_games, "w", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps(record) + "\n")
+            games.extend(records)
+        features, results, game_indices = extract_positions(games, args.player, args.skip_plies)
+        if len(results) == 0:
+            parser.error("no finished game to tune on")
+        n_games = int(game_indices[-1]) + 1
+        logger.info(f"{len(results)} positions from {n_games} game(s)")
+
+        # Held-out positions of one game in ten, to check that the fit generalizes
+        held_out = game_indices % 10 == 9
+        train = ~held_out if held_out.any() else np.ones_like(held_out)
+        initial = np.array(baseline.to_vector(), dtype=np.float64)
+        scale = fit_scale(initial, features[train], results[train])
+        candidate = fit(features[train], results[train], baseline, scale, args.iterations, regularization=args.regularization)
+        tuned = np.array(candidate.to_vector(), dtype=np.float64)
+        logger.info(f"Scale {scale:.4f}")
+        logger.info(f"Current weights {baseline.to_vector()} : loss {texel_loss(initial, features[train], results[train], scale):.5f}"
+                    + (f", held out {texel_loss(initial, features[held_out], results[held_out], scale):.5f}" if held_out.any() else ""))
+        logger.info(f"Tuned weights {candidate.to_vector()} : loss {texel_loss(tuned, features[train], results[train], scale):.5f}"
+                    + (f", held out {texel_loss(tuned, features[held_out], results[held_out], scale):.5f}" if held_out.any() else ""))
+
+        validation = None
+        if args.matches > 0:
+            validation = validate(executor, args.player, candidate, baseline, args.matches, args.time, args.opening_plies, args.seed)
+            logger.info(f"Tuned against current weights : +{validation['wins']} ={validation['draws']} -{validation['losses']} "
+                        f"score {validation['score']:.3f} ({validation['elo']:+.0f} Elo)")
+
+    if args.force or (validation is not None and validation["score"] > 0.5):
+        candidate.save(output)
+        logger.info(f"Tuned weights written to {output}")
+    else:
+        logger.info("Tuned weights not written")
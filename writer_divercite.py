@@ -0,0 +1,177 @@
+import atexit
+import os
+import queue
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# never : the files are flushed to the OS after each batch, the OS writes them to disk when it sees fit
+# batch : every batch is synced to disk before the next one is written
+# close : the files are synced to disk once, when the writer is closed
+FSYNC_POLICIES = ["never", "batch", "close"]
+MAX_QUEUE = 10000
+BATCH_SIZE = 256
+
+
+class BackgroundWriter:
+    """
+    Appends text to files from a dedicated thread, so that the game loops and the coordinators never wait for the disk.
+    Writes are queued in a bounded queue (a full queue blocks the writers instead of growing without bound),
+    then written in batches, each file opened once for the lifetime of the writer. The queue is drained and the
+    files are closed with `close_file` or when the writer is closed, at the latest when the interpreter exits.
+
+    Attributes:
+        fsync (str): When the files are synced to disk, one of FSYNC_POLICIES.
+        batch_size (int): Maximum number of writes grouped in a batch.
+    """
+
+    def __init__(self, fsync: str = "never", max_queue: int = MAX_QUEUE, batch_size: int = BATCH_SIZE) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync}, expected one of {FSYNC_POLICIES}.")
+        self.fsync = fsync
+        self.batch_size = batch_size
+        # A None text closes the file, a None item stops the thread
+        self._queue: "queue.Queue[Optional[Tuple[str, Optional[str]]]]" = queue.Queue(max_queue)
+        self._files: Dict[str, object] = {}
+        self._error: Optional[OSError] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="background-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, path: str, text: str) -> None:
+        """
+        Queue text to be appended to a file.
+
+        Args:
+            path (str): The file, created if needed.
+            text (str): The text, newlines included.
+        """
+        self._raise_error()
+        if self._closed:
+            raise ValueError("The writer is closed.")
+        self._queue.put((path, text))
+
+    def close_file(self, path: str) -> None:
+        """
+        Queue the closing of a file, once the text queued before for it is written. The file is synced to disk
+        unless the policy is never, and is opened again if text is written to it later.
+
+        Args:
+            path (str): The file.
+        """
+        self._raise_error()
+        if self._closed:
+            raise ValueError("The writer is closed.")
+        self._queue.put((path, None))
+
+    def flush(self) -> None:
+        """
+        Wait until everything queued so far is written.
+        """
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        """
+        Write everything queued, sync the files according to the policy and close them. Closing twice does nothing.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+        self._raise_error()
+
+    def __enter__(self) -> "BackgroundWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def _raise_error(self) -> None:
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            writes = [item for item in batch if item is not None]
+            try:
+                self._write_batch(writes)
+            except OSError as e:
+                # The batch is lost, the error is raised to the next caller
+                logger.error(f"Background write failed: {e}")
+                self._error = e
+            stop = batch[-1] is None
+            if stop:
+                self._close_files()
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, writes: List[Tuple[str, Optional[str]]]) -> None:
+        touched = {}
+        for path, text in writes:
+            if text is None:
+                touched.pop(path, None)
+                self._close_file(path)
+                continue
+            f = self._files.get(path)
+            if f is None:
+                f = self._files[path] = open(path, "a", encoding="utf-8")
+            f.write(text)
+            touched[path] = f
+        for f in touched.values():
+            f.flush()
+            if self.fsync == "batch":
+                os.fsync(f.fileno())
+
+    def _close_file(self, path: str) -> None:
+        f = self._files.pop(path, None)
+        if f is None:
+            return
+        try:
+            f.flush()
+            if self.fsync != "never":
+                os.fsync(f.fileno())
+        finally:
+            f.close()
+
+    def _close_files(self) -> None:
+        for path in list(self._files):
+            try:
+                if self.fsync == "close":
+                    self._close_file(path)
+                else:
+                    self._files.pop(path).close()
+            except OSError as e:
+                logger.error(f"Background write failed: {e}")
+                self._error = e
+
+
+_default_writer: Optional[BackgroundWriter] = None
+_default_writer_lock = threading.Lock()
+
+
+def default_writer() -> BackgroundWriter:
+    """
+    Returns the writer shared by the records of the process, started on first use.
+
+    Returns:
+        BackgroundWriter: The writer.
+    """
+    global _default_writer
+    with _default_writer_lock:
+        if _default_writer is None or _default_writer._closed:
+            _default_writer = BackgroundWriter()
+        return _default_writer